@@ -0,0 +1,289 @@
+"""
+Headless batch recognition over folders of images and recorded video.
+
+Runs the FaceService detect -> embed -> search pipeline across a process pool
+and streams one JSON line per recognized face. Progress is recorded next to
+the output file, so an interrupted scan picks up where it stopped:
+
+    python batch_scan.py /evidence/case-42 --output case-42.jsonl --workers 8
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".wmv")
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def find_media(directory):
+    """Returns the sorted image and video paths below a directory."""
+    images, videos = [], []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            extension = os.path.splitext(name)[1].lower()
+            if extension in IMAGE_EXTENSIONS:
+                images.append(path)
+            elif extension in VIDEO_EXTENSIONS:
+                videos.append(path)
+    return sorted(images), sorted(videos)
+
+
+def plan_units(images, videos, chunk_frames):
+    """
+    Splits the work into units: one per image and one per chunk of chunk_frames
+    frames of each video, so long recordings spread over all workers.
+    """
+    units = [{"key": path, "source": path, "type": "image"} for path in images]
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        if frame_count <= 0:
+            print(f"Skipping {path}: could not read frame count.")
+            continue
+        for start in range(0, frame_count, chunk_frames):
+            end = min(frame_count, start + chunk_frames)
+            units.append({
+                "key": f"{path}#{start}-{end}", "source": path, "type": "video",
+                "start": start, "end": end, "fps": fps,
+            })
+    return units
+
+
+class ProgressLog:
+    """
+    Tracks which units are finished in <output>.progress. Result lines written
+    for units that never completed are dropped on resume, so an interrupted
+    scan does not leave duplicate lines behind.
+    """
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.path = output_path + ".progress"
+        self.completed = set()
+
+    def load(self, units):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.completed = {line.strip() for line in f if line.strip()}
+        if os.path.exists(self.output_path):
+            self._drop_partial_results(units)
+        return self.completed
+
+    def mark_done(self, key):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(key + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.add(key)
+
+    def _drop_partial_results(self, units):
+        unfinished = [u for u in units if u["key"] not in self.completed]
+        if not unfinished:
+            return
+
+        def is_unfinished(record):
+            for unit in unfinished:
+                if record["source"] != unit["source"]:
+                    continue
+                if unit["type"] == "image" or unit["start"] <= record["frame"] < unit["end"]:
+                    return True
+            return False
+
+        tmp_path = self.output_path + ".tmp"
+        dropped = 0
+        with open(self.output_path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+            for line in src:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    dropped += 1  # torn write from the interruption
+                    continue
+                if is_unfinished(record):
+                    dropped += 1
+                    continue
+                dst.write(line)
+        os.replace(tmp_path, self.output_path)
+        if dropped:
+            print(f"Dropped {dropped} result lines from unfinished units.")
+
+
+def _prepare_index():
+    """
+    Sets up the schema and brings the index snapshot up to date once, before
+    the workers start, so they only ever read it. Runs in a child process so
+    the parent does not load the models before the pool forks.
+    """
+    from database import DatabaseService
+    from face_service import FaceService
+
+    face_service = FaceService(DatabaseService(), sharded=False)
+    face_service.save_snapshot()
+    face_service.close()
+
+
+def _init_worker(confidence_threshold, detection_width, threads_per_worker):
+    """Loads the models and gallery once per worker process."""
+    # Keep each process from spawning a thread per core for the math libraries
+    for variable in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[variable] = str(threads_per_worker)
+
+    from database import DatabaseService
+    from face_service import FaceService
+    from detection_scheduler import DetectionScheduler
+
+    face_service = FaceService(DatabaseService(init_schema=False), sharded=False, read_only=True)
+    _worker["face_service"] = face_service
+    _worker["confidence_threshold"] = (
+        confidence_threshold if confidence_threshold is not None else face_service.detection_confidence
+    )
+    # Used for its downscaled detection pass only; max_interval=1 detects every frame
+    _worker["scheduler"] = DetectionScheduler(detection_width=detection_width, max_interval=1)
+
+
+def _recognize_frame(frame_rgb):
+    """Detects, embeds and searches every confident face of a frame."""
+    face_service = _worker["face_service"]
+    faces, _ = _worker["scheduler"].process(face_service.detector, frame_rgb)
+    faces = [f for f in faces if f['confidence'] >= _worker["confidence_threshold"]]
+
+    boxes, crops, keypoints = [], [], []
+    for face in faces:
+        x, y, w, h = face['box']
+        face_img = frame_rgb[y:y+h, x:x+w]
+        if face_img.size == 0:
+            continue
+        boxes.append([x, y, w, h])
+        crops.append(face_img)
+        keypoints.append({name: (px - x, py - y) for name, (px, py) in face.get('keypoints', {}).items()})
+
+    if not crops:
+        return []
+    embeddings, error = face_service.get_embeddings_batch(crops, keypoints)
+    if error:
+        return []
+    return [(box, label, float(score)) for box, (label, score) in zip(boxes, face_service.search_faces(embeddings))]
+
+
+def _scan_unit(unit, frame_step):
+    """Processes one image or video chunk. Returns (unit key, records, frames processed, error)."""
+    records = []
+    if unit["type"] == "image":
+        image = cv2.imread(unit["source"])
+        if image is None:
+            return unit["key"], [], 0, "Could not read image."
+        for box, label, score in _recognize_frame(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)):
+            records.append({"source": unit["source"], "frame": 0, "box": box, "label": label, "score": round(score, 4)})
+        return unit["key"], records, 1, None
+
+    cap = cv2.VideoCapture(unit["source"])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, unit["start"])
+    processed = 0
+    for frame_index in range(unit["start"], unit["end"]):
+        # grab() skips decoding-to-BGR for frames that are not sampled
+        if (frame_index - unit["start"]) % frame_step:
+            if not cap.grab():
+                break
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        processed += 1
+        for box, label, score in _recognize_frame(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)):
+            records.append({
+                "source": unit["source"], "frame": frame_index, "time": round(frame_index / unit["fps"], 3),
+                "box": box, "label": label, "score": round(score, 4),
+            })
+    cap.release()
+    return unit["key"], records, processed, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run face recognition over folders of images and videos.")
+    parser.add_argument("input", help="Directory with images and/or video files (searched recursively).")
+    parser.add_argument("--output", default="scan_results.jsonl", help="JSONL file results are appended to.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--frame-step", type=int, default=5, help="Process every N-th video frame.")
+    parser.add_argument("--chunk-frames", type=int, default=1500, help="Video frames per work unit.")
+    parser.add_argument("--confidence", type=float, default=None,
+                        help="Minimum face detection confidence (default DETECTION_CONFIDENCE).")
+    parser.add_argument("--detection-width", type=int, default=640, help="Downscale frames to this width for detection.")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous progress and start over.")
+    args = parser.parse_args()
+
+    images, videos = find_media(args.input)
+    units = plan_units(images, videos, args.chunk_frames)
+
+    progress = ProgressLog(args.output)
+    if args.restart:
+        for path in (args.output, progress.path):
+            if os.path.exists(path):
+                os.remove(path)
+    completed = progress.load(units)
+    todo = [u for u in units if u["key"] not in completed]
+    print(f"{len(images)} images, {len(videos)} videos -> {len(units)} work units, {len(todo)} left to scan.")
+    if not todo:
+        return
+
+    with ProcessPoolExecutor(max_workers=1) as setup:
+        setup.submit(_prepare_index).result()
+
+    frames_done = faces_found = matches = 0
+    video_seconds = 0.0
+    start_time = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as output, ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_worker,
+        initargs=(args.confidence, args.detection_width, args.threads_per_worker)
+    ) as pool:
+        pending = {}
+        remaining = iter(todo)
+        # Keep a bounded number of units in flight so results stream steadily
+        for unit in remaining:
+            pending[pool.submit(_scan_unit, unit, args.frame_step)] = unit
+            if len(pending) >= args.workers * 2:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                unit = pending.pop(future)
+                key, records, processed, error = future.result()
+                if error:
+                    print(f"{key}: {error}")
+                if records:
+                    output.write("".join(json.dumps(r) + "\n" for r in records))
+                    output.flush()
+                    os.fsync(output.fileno())
+                progress.mark_done(key)
+
+                frames_done += processed
+                faces_found += len(records)
+                matches += sum(1 for r in records if r["label"] != "Unknown")
+                if unit["type"] == "video":
+                    video_seconds += (unit["end"] - unit["start"]) / unit["fps"]
+
+                next_unit = next(remaining, None)
+                if next_unit is not None:
+                    pending[pool.submit(_scan_unit, next_unit, args.frame_step)] = next_unit
+
+            elapsed = time.perf_counter() - start_time
+            print(f"\r{len(progress.completed)}/{len(units)} units, {frames_done} frames, "
+                  f"{frames_done / elapsed:.1f} frames/s, {faces_found} faces, {matches} matches", end="", flush=True)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"\nDone in {elapsed:.1f}s.")
+    if video_seconds:
+        print(f"Scanned {video_seconds:.0f}s of video at {video_seconds / elapsed:.1f}x real time.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Speed and agreement report for the face detector backends.
+
+Each detector runs over a local folder of images; latency is measured per
+image and detections are matched by IoU against a reference detector
+(MTCNN by default). Run from the project root, for example:
+
+    python -m benchmarks.detector_benchmark --images samples/ --detectors mtcnn yunet haar
+"""
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from face_detectors import DETECTOR_NAMES, create_detector
+from tracker import iou_matrix
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_images(directory, width=None):
+    """Loads every image in a directory as RGB, optionally downscaled to a maximum width."""
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(directory, name))
+        if image is None:
+            continue
+        if width and image.shape[1] > width:
+            scale = width / image.shape[1]
+            image = cv2.resize(image, (width, int(image.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        images.append((name, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+    return images
+
+
+def match_count(boxes, reference_boxes, iou_threshold):
+    """Number of one-to-one box matches with IoU at or above the threshold."""
+    if not boxes or not reference_boxes:
+        return 0
+    ious = iou_matrix(boxes, reference_boxes)
+    matched_rows, matched_cols = set(), set()
+    for flat_index in np.argsort(-ious, axis=None):
+        row, col = np.unravel_index(flat_index, ious.shape)
+        if ious[row, col] < iou_threshold:
+            break
+        if row in matched_rows or col in matched_cols:
+            continue
+        matched_rows.add(row)
+        matched_cols.add(col)
+    return len(matched_rows)
+
+
+def run_detector(detector, images, confidence_threshold, warmup=2):
+    """Returns per-image latencies in milliseconds and the confident boxes found in each image."""
+    for _, image in images[:warmup]:
+        detector.detect_faces(image)
+
+    latencies, boxes = [], []
+    for _, image in images:
+        start = time.perf_counter()
+        faces = detector.detect_faces(image)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        boxes.append([face['box'] for face in faces if face['confidence'] >= confidence_threshold])
+    return np.array(latencies), boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare face detector backends on a local image set.")
+    parser.add_argument("--images", required=True, help="Directory of test images.")
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTOR_NAMES), choices=DETECTOR_NAMES)
+    parser.add_argument("--reference", default="mtcnn", choices=DETECTOR_NAMES,
+                        help="Detector whose boxes count as ground truth for agreement.")
+    parser.add_argument("--width", type=int, default=None, help="Downscale images to this width first.")
+    parser.add_argument("--confidence", type=float, default=0.9)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed for two boxes to agree.")
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.width)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+    print(f"Loaded {len(images)} images.")
+
+    names = [args.reference] + [name for name in args.detectors if name != args.reference]
+    results = {}
+    reference_boxes = None
+    for name in names:
+        try:
+            detector = create_detector(name)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        print(f"Running {name}...")
+        latencies, boxes = run_detector(detector, images, args.confidence)
+        if name == args.reference:
+            reference_boxes = boxes
+
+        detected = sum(len(b) for b in boxes)
+        result = {
+            "latency_mean_ms": round(float(latencies.mean()), 2),
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "fps": round(1000.0 / float(latencies.mean()), 1),
+            "faces_detected": detected,
+        }
+        if reference_boxes is not None:
+            reference_total = sum(len(b) for b in reference_boxes)
+            matched = sum(match_count(b, r, args.iou) for b, r in zip(boxes, reference_boxes))
+            result["agreement_recall"] = round(matched / reference_total, 4) if reference_total else None
+            result["agreement_precision"] = round(matched / detected, 4) if detected else None
+        results[name] = result
+
+    print(f"\n{'detector':<12} {'mean ms':>9} {'p95 ms':>9} {'fps':>7} {'faces':>7} {'recall':>8} {'precision':>10}")
+    for name, r in results.items():
+        recall = r.get("agreement_recall")
+        precision = r.get("agreement_precision")
+        print(f"{name:<12} {r['latency_mean_ms']:>9.2f} {r['latency_p95_ms']:>9.2f} {r['fps']:>7.1f} "
+              f"{r['faces_detected']:>7} {recall if recall is not None else '-':>8} "
+              f"{precision if precision is not None else '-':>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"images": len(images), "reference": args.reference, "results": results}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
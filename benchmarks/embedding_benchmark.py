@@ -0,0 +1,179 @@
+"""
+Parity and latency report for the embedding engines.
+
+The TensorFlow engine is the reference: every ONNX export embeds the same
+faces, and its embeddings must stay within --tolerance cosine similarity of
+the reference ones. Latency is measured one face at a time (registration)
+and in batches (the live pipeline). Run from the project root, for example:
+
+    python -m benchmarks.embedding_benchmark --images faces/ --onnx models/arcface.onnx models/arcface_int8.onnx
+
+Exits with status 1 if any engine fails the parity check.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from embedding_engines import ONNXEngine, TensorFlowEngine, preprocess_face
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_faces(directory, crop, limit):
+    """
+    Loads images as RGB. With crop, each image is reduced to its largest
+    detected face (FACE_DETECTOR); otherwise the images are used as face crops.
+    """
+    detector = None
+    if crop:
+        from face_detectors import create_detector
+        detector = create_detector()
+
+    faces = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(directory, name))
+        if image is None:
+            continue
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if detector is not None:
+            detections = detector.detect_faces(image)
+            if not detections:
+                continue
+            x, y, w, h = max(detections, key=lambda f: f['box'][2] * f['box'][3])['box']
+            image = image[y:y+h, x:x+w]
+            if image.size == 0:
+                continue
+        faces.append(image)
+        if len(faces) >= limit:
+            break
+    return faces
+
+
+def synthetic_faces(count, rng):
+    """Smooth random crops; only a stand-in when no face images are available."""
+    faces = []
+    for _ in range(count):
+        small = rng.integers(0, 256, size=(14, 14, 3), dtype=np.uint8)
+        faces.append(cv2.resize(small, (112, 112), interpolation=cv2.INTER_CUBIC))
+    return faces
+
+
+def embed_all(engine, batch, batch_size):
+    return np.concatenate([engine.embed(batch[i:i + batch_size]) for i in range(0, len(batch), batch_size)])
+
+
+def latencies_ms(engine, batch, batch_size, repeats):
+    """Milliseconds per engine call at the given batch size."""
+    samples = []
+    for _ in range(repeats):
+        for start in range(0, len(batch) - batch_size + 1, batch_size):
+            chunk = batch[start:start + batch_size]
+            started = time.perf_counter()
+            engine.embed(chunk)
+            samples.append((time.perf_counter() - started) * 1000.0)
+    return np.array(samples)
+
+
+def cosine_similarities(embeddings, reference):
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    return np.sum(embeddings * reference, axis=1)
+
+
+def benchmark_engine(name, load, faces, reference, args):
+    start = time.perf_counter()
+    engine = load()
+    load_seconds = time.perf_counter() - start
+    batch = np.stack([preprocess_face(face, engine.input_size) for face in faces])
+    # The first calls pay for graph building and kernel selection
+    engine.embed(batch[:1])
+    engine.embed(batch[:args.batch_size])
+
+    single = latencies_ms(engine, batch[:args.latency_faces], 1, 1)
+    batched = latencies_ms(engine, batch, args.batch_size, args.repeats)
+    result = {
+        "engine": name,
+        "load_seconds": round(load_seconds, 2),
+        "single_p50_ms": round(float(np.percentile(single, 50)), 3),
+        "single_p95_ms": round(float(np.percentile(single, 95)), 3),
+        "batch_p50_ms": round(float(np.percentile(batched, 50)), 3),
+        "faces_per_second": round(args.batch_size * 1000.0 / float(batched.mean()), 1),
+    }
+    embeddings = embed_all(engine, batch, args.batch_size)
+    if reference is not None:
+        similarities = cosine_similarities(embeddings, reference)
+        result.update(
+            cosine_min=round(float(similarities.min()), 5),
+            cosine_mean=round(float(similarities.mean()), 5),
+            parity_ok=bool(similarities.min() >= args.tolerance),
+        )
+    return result, embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding engines against TensorFlow for parity and latency.")
+    parser.add_argument("--images", help="Directory of face images (or photos, with --crop).")
+    parser.add_argument("--crop", action="store_true", help="Crop the largest detected face from each image.")
+    parser.add_argument("--faces", type=int, default=256, help="Faces to use at most.")
+    parser.add_argument("--onnx", nargs="*", default=[os.getenv("ONNX_MODEL_PATH", "models/arcface.onnx")],
+                        help="ONNX models to compare.")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX intra-op threads (default ONNX_THREADS).")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--latency-faces", type=int, default=64, help="Faces timed one at a time.")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the faces for the batched timing.")
+    parser.add_argument("--tolerance", type=float, default=0.99,
+                        help="Minimum cosine similarity to the TensorFlow embedding of every face.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    if args.images:
+        faces = load_faces(args.images, args.crop, args.faces)
+        if not faces:
+            parser.error(f"No faces found in {args.images}")
+    else:
+        print("No --images given; using synthetic crops, which only approximate real parity.")
+        faces = synthetic_faces(args.faces, np.random.default_rng(args.seed))
+
+    engines = [("tensorflow", TensorFlowEngine)]
+    for path in args.onnx:
+        engines.append((f"onnx:{os.path.basename(path)}", lambda path=path: ONNXEngine(path, args.threads)))
+
+    reference, results = None, []
+    for name, load in engines:
+        print(f"Running {name}...")
+        try:
+            result, embeddings = benchmark_engine(name, load, faces, reference, args)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        if name == "tensorflow":
+            reference = embeddings
+        results.append(result)
+
+    print(f"\n{len(faces)} faces, batch size {args.batch_size}, tolerance {args.tolerance}")
+    print(f"{'engine':<32} {'load s':>7} {'1-face p50':>11} {'1-face p95':>11} {'batch p50':>10} "
+          f"{'faces/s':>9} {'cos min':>9} {'cos mean':>9} {'parity':>7}")
+    for r in results:
+        parity = "-" if "parity_ok" not in r else ("ok" if r["parity_ok"] else "FAIL")
+        print(f"{r['engine']:<32} {r['load_seconds']:>7.2f} {r['single_p50_ms']:>11.3f} {r['single_p95_ms']:>11.3f} "
+              f"{r['batch_p50_ms']:>10.3f} {r['faces_per_second']:>9.1f} {r.get('cosine_min', '-'):>9} "
+              f"{r.get('cosine_mean', '-'):>9} {parity:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"faces": len(faces), "batch_size": args.batch_size, "tolerance": args.tolerance,
+                       "results": results}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if any(r.get("parity_ok") is False for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
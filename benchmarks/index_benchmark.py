@@ -0,0 +1,198 @@
+"""
+Recall versus latency report for the FAISS index backends.
+
+Every backend from index_factory is built over the same gallery and compared
+against the exact flat index over the original float32 vectors, together with
+the memory each index occupies. --storage first round-trips the gallery through
+a compact database format, so its recall cost is included. Run from the
+project root, for example:
+
+    python -m benchmarks.index_benchmark --gallery-size 1000000 --output index_report.json
+    python -m benchmarks.index_benchmark --backends flat sq8 --storage int8
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from index_factory import IndexConfig, create_index, apply_search_params, index_memory_bytes
+from embedding_codec import STORAGE_TYPES, encode_embedding, decode_embedding
+
+
+def random_unit_vectors(count, dimension, rng):
+    vectors = rng.standard_normal((count, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(gallery, count, noise, rng):
+    """Simulates new captures of known people by perturbing random gallery vectors."""
+    picks = rng.choice(len(gallery), size=count, replace=False)
+    queries = gallery[picks] + noise * rng.standard_normal((count, gallery.shape[1]), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def load_gallery_from_db():
+    """Reads the real criminal embeddings from the configured database."""
+    from database import DatabaseService
+    db_service = DatabaseService()
+    gallery = np.array([
+        decode_embedding(row['embedding'])
+        for rows in db_service.stream_embeddings() for row in rows
+    ], dtype=np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def round_trip_storage(gallery, storage):
+    """Encodes and decodes every vector in the given database storage format."""
+    if storage == "float32":
+        return gallery
+    decoded = np.array([decode_embedding(encode_embedding(vector, storage)) for vector in gallery], dtype=np.float32)
+    decoded /= np.linalg.norm(decoded, axis=1, keepdims=True)
+    return decoded
+
+
+def recall(approx_ids, exact_ids, k):
+    """Fraction of the exact top-k neighbours that the approximate search also returned."""
+    hits = sum(len(set(a[:k]) & set(e[:k])) for a, e in zip(approx_ids, exact_ids))
+    return hits / (len(exact_ids) * k)
+
+
+def single_query_latencies(index, queries, k):
+    """Searches one query at a time, the way the live detection loop does."""
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        index.search(queries[i:i+1], k)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000.0
+
+
+def benchmark_backend(config, gallery, queries, exact_ids, k, latency_queries):
+    ids = np.arange(len(gallery), dtype=np.int64)
+
+    start = time.perf_counter()
+    index, index_type = create_index(config, gallery.shape[1], gallery)
+    train_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.add_with_ids(gallery, ids)
+    add_seconds = time.perf_counter() - start
+    index_mb = index_memory_bytes(index) / (1024 * 1024)
+
+    results = []
+    for search_config in sweep_search_params(config):
+        apply_search_params(index, search_config)
+
+        start = time.perf_counter()
+        _, approx_ids = index.search(queries, k)
+        batch_seconds = time.perf_counter() - start
+
+        latencies = single_query_latencies(index, queries[:latency_queries], k)
+        results.append({
+            "backend": search_config.describe(),
+            "index_type": index_type,
+            "train_seconds": round(train_seconds, 3),
+            "add_seconds": round(add_seconds, 3),
+            "index_mb": round(index_mb, 2),
+            "recall_at_1": round(recall(approx_ids, exact_ids, 1), 4),
+            f"recall_at_{k}": round(recall(approx_ids, exact_ids, k), 4),
+            "batch_qps": round(len(queries) / batch_seconds, 1),
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 4),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        })
+    return results
+
+
+def sweep_search_params(config):
+    """Yields copies of a config for each query-time setting to compare."""
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        values = sorted({1, 4, 16, 64, config.nprobe})
+        for nprobe in values:
+            if nprobe <= config.nlist:
+                yield IndexConfig(**{**vars(config), "nprobe": nprobe})
+    elif config.index_type == "hnsw":
+        for ef_search in sorted({16, 64, 256, config.ef_search}):
+            yield IndexConfig(**{**vars(config), "ef_search": ef_search})
+    else:
+        yield config
+
+
+def print_report(report):
+    rows = report["results"]
+    k = report["k"]
+    print(f"\nGallery: {report['gallery_size']} vectors stored as {report['storage']}, "
+          f"{report['queries']} queries, k={k}")
+    header = f"{'backend':<60} {'MB':>9} {'R@1':>7} {f'R@{k}':>7} {'QPS':>10} {'p50 ms':>9} {'p95 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['backend']:<60} {row['index_mb']:>9.2f} {row['recall_at_1']:>7.4f} {row[f'recall_at_{k}']:>7.4f} "
+              f"{row['batch_qps']:>10.1f} {row['latency_p50_ms']:>9.4f} {row['latency_p95_ms']:>9.4f}")
+
+
+def main():
+    defaults = IndexConfig.from_env()
+    parser = argparse.ArgumentParser(description="Compare FAISS backends against the exact flat index.")
+    parser.add_argument("--gallery-size", type=int, default=100000, help="Number of synthetic identities.")
+    parser.add_argument("--from-db", action="store_true", help="Use the embeddings stored in the database instead.")
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--latency-queries", type=int, default=200, help="Queries timed one at a time.")
+    parser.add_argument("--noise", type=float, default=0.05, help="Perturbation applied to gallery vectors to form queries.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=["flat", "sq8", "sq_fp16", "ivf_flat", "ivf_pq", "hnsw"])
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default="float32",
+                        help="Database format the gallery passes through before indexing.")
+    parser.add_argument("--nlist", type=int, default=defaults.nlist)
+    parser.add_argument("--nprobe", type=int, default=defaults.nprobe)
+    parser.add_argument("--pq-m", type=int, default=defaults.pq_m)
+    parser.add_argument("--pq-bits", type=int, default=defaults.pq_bits)
+    parser.add_argument("--hnsw-m", type=int, default=defaults.hnsw_m)
+    parser.add_argument("--ef-construction", type=int, default=defaults.ef_construction)
+    parser.add_argument("--ef-search", type=int, default=defaults.ef_search)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.from_db:
+        gallery = load_gallery_from_db()
+    else:
+        gallery = random_unit_vectors(args.gallery_size, args.dimension, rng)
+    queries = make_queries(gallery, min(args.queries, len(gallery)), args.noise, rng)
+
+    exact_index = faiss.IndexFlatIP(gallery.shape[1])
+    exact_index.add(gallery)
+    _, exact_ids = exact_index.search(queries, args.k)
+    del exact_index
+    indexed_gallery = round_trip_storage(gallery, args.storage)
+
+    report = {
+        "gallery_size": len(gallery),
+        "storage": args.storage,
+        "queries": len(queries),
+        "k": args.k,
+        "results": [],
+    }
+    for backend in args.backends:
+        config = IndexConfig(
+            index_type=backend, nlist=args.nlist, nprobe=args.nprobe, pq_m=args.pq_m, pq_bits=args.pq_bits,
+            hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, ef_search=args.ef_search
+        )
+        print(f"Benchmarking {config.describe()}...")
+        report["results"].extend(
+            benchmark_backend(config, indexed_gallery, queries, exact_ids, args.k, args.latency_queries)
+        )
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
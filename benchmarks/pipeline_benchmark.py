@@ -0,0 +1,359 @@
+"""
+End-to-end latency report for the recognition pipeline.
+
+Runs offline: galleries are synthetic random unit vectors fed to FaceService
+through an in-memory stand-in for the database, and frames are replayed from
+a local video or image folder. Reports p50/p95/p99 latency per stage, frames
+per second and peak RSS. Run from the project root, for example:
+
+    python -m benchmarks.pipeline_benchmark --gallery-sizes 1000 100000 --video clip.mp4 --output run.json
+    python -m benchmarks.pipeline_benchmark --video clip.mp4 --output new.json --compare run.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from benchmarks.detector_benchmark import load_images
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class SyntheticGallery:
+    """
+    Stands in for DatabaseService when benchmarking: serves size random unit
+    vectors, photos_per_identity per criminal, through the same methods
+    FaceService uses to load and sync embeddings. Chunks are generated on
+    demand from the seed, so even a million vectors never exist as bytes at once.
+    """
+    def __init__(self, size, photos_per_identity=1, dimension=512, seed=0):
+        self.size = size
+        self.photos_per_identity = photos_per_identity
+        self.dimension = dimension
+        self.seed = seed
+        self.updated_at = datetime(2024, 1, 1)
+
+    def vectors(self, start, count):
+        """The unit vectors with embedding ids start+1 .. start+count (ids are 1-based like MySQL)."""
+        rng = np.random.default_rng([self.seed, start])
+        vectors = rng.standard_normal((count, self.dimension), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def stream_embeddings(self, since=None, chunk_size=1000):
+        if since is not None and since >= self.updated_at:
+            return
+        for start in range(0, self.size, chunk_size):
+            count = min(chunk_size, self.size - start)
+            vectors = self.vectors(start, count)
+            rows = []
+            for offset in range(count):
+                embedding_id = start + offset + 1
+                criminal_id = (start + offset) // self.photos_per_identity + 1
+                rows.append({
+                    "id": embedding_id,
+                    "criminal_id": criminal_id,
+                    "name": f"person-{criminal_id}",
+                    "embedding": vectors[offset].tobytes(),
+                    "updated_at": self.updated_at,
+                })
+            yield rows
+
+    def count_embeddings(self):
+        return self.size
+
+    def fetch_embedding_ids(self):
+        return set(range(1, self.size + 1))
+
+    def get_criminals_version(self):
+        return {"total": -(-self.size // self.photos_per_identity), "embeddings": self.size,
+                "last_update": self.updated_at.isoformat()}
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds."""
+    if len(seconds) == 0:
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if the platform does not report it."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except (ImportError, AttributeError):
+        return None
+
+
+def read_frames(video_path=None, images_dir=None, max_frames=300):
+    """Loads up to max_frames RGB frames from a video file or an image folder."""
+    if images_dir:
+        return [image for _, image in load_images(images_dir)[:max_frames]]
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+
+def bench_gallery(face_service, size, args):
+    """Times load_embeddings_from_db and search for one synthetic gallery size."""
+    gallery = SyntheticGallery(size, args.photos_per_identity, face_service.embedding_dimension, args.seed)
+    face_service.db_service = gallery
+
+    _, load_seconds = timed(face_service.load_embeddings_from_db)
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = gallery.vectors(0, min(args.queries, size))
+    queries += args.noise * rng.standard_normal(queries.shape, dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    single = [timed(face_service.search_face, query)[1] for query in queries]
+    batch_seconds = []
+    for start in range(0, len(queries), args.batch_size):
+        batch_seconds.append(timed(face_service.search_faces, queries[start:start + args.batch_size])[1])
+
+    return {
+        "gallery_size": size,
+        "identities": gallery.get_criminals_version()["total"],
+        "index_type": face_service.index_type,
+        "load_embeddings_from_db_s": round(load_seconds, 3),
+        "search_face": latency_summary(single),
+        "search_faces_batch": latency_summary(batch_seconds),
+        "search_qps": round(len(queries) / sum(batch_seconds), 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_embedding(face_service, crops, args):
+    """Times get_embedding one face at a time and get_embeddings_batch in batches."""
+    single = [timed(face_service.get_embedding, crop)[1] for crop in crops]
+    batched = []
+    for start in range(0, len(crops), args.batch_size):
+        batched.append(timed(face_service.get_embeddings_batch, crops[start:start + args.batch_size])[1])
+    return {
+        "faces": len(crops),
+        "batch_size": args.batch_size,
+        "get_embedding": latency_summary(single),
+        "get_embeddings_batch": latency_summary(batched),
+        "faces_per_second_single": round(len(crops) / sum(single), 1),
+        "faces_per_second_batched": round(len(crops) / sum(batched), 1),
+    }
+
+
+def bench_replay(face_service, frames, args):
+    """
+    Replays frames through detect -> embed -> search the way the live pipeline
+    does (downscaled detection, batched embedding and search) and times each stage.
+    """
+    from detection_scheduler import DetectionScheduler
+    scheduler = DetectionScheduler(detection_width=args.detection_width, max_interval=1)
+
+    stages = {"extract_face": [], "detect": [], "embed": [], "search": [], "frame": []}
+    faces_found = 0
+    for frame_rgb in frames:
+        stages["extract_face"].append(timed(face_service.extract_face, frame_rgb)[1])
+
+        frame_start = time.perf_counter()
+        (faces, _), seconds = timed(scheduler.process, face_service.detector, frame_rgb)
+        stages["detect"].append(seconds)
+
+        crops, keypoints = [], []
+        for face in faces:
+            if face['confidence'] < (args.confidence or face_service.detection_confidence):
+                continue
+            x, y, w, h = face['box']
+            crop = frame_rgb[y:y+h, x:x+w]
+            if crop.size == 0:
+                continue
+            crops.append(crop)
+            keypoints.append({name: (px - x, py - y) for name, (px, py) in face.get('keypoints', {}).items()})
+
+        if crops:
+            (embeddings, error), seconds = timed(face_service.get_embeddings_batch, crops, keypoints)
+            stages["embed"].append(seconds)
+            if not error:
+                stages["search"].append(timed(face_service.search_faces, embeddings)[1])
+                faces_found += len(crops)
+        stages["frame"].append(time.perf_counter() - frame_start)
+
+    report = {name: latency_summary(seconds) for name, seconds in stages.items()}
+    report["frames"] = len(frames)
+    report["faces"] = faces_found
+    report["fps"] = round(len(frames) / sum(stages["frame"]), 2) if frames else 0.0
+    return report
+
+
+def collect_metrics(report, prefix=""):
+    """Flattens a report into {path: value} for the numbers worth comparing."""
+    metrics = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(collect_metrics(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key.endswith(("_ms", "_s", "_mb")) or key in ("fps", "search_qps") or key.startswith("faces_per_second"):
+                metrics[path] = value
+    return metrics
+
+
+def compare_reports(baseline, current, tolerance):
+    """
+    Prints every shared metric with its relative change and returns the ones
+    that got worse by more than tolerance (a fraction). Latency, time and
+    memory regress upwards; fps, qps and faces per second regress downwards.
+    """
+    old, new = collect_metrics(baseline), collect_metrics(current)
+    regressions = []
+    print(f"\n{'metric':<60} {'baseline':>12} {'current':>12} {'change':>9}")
+    for path in sorted(old.keys() & new.keys()):
+        before, after = old[path], new[path]
+        if not before:
+            continue
+        change = (after - before) / before
+        higher_is_better = path.endswith(("fps", "qps")) or ".faces_per_second" in path
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{path:<60} {before:>12} {after:>12} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(path)
+    return regressions
+
+
+def print_report(report):
+    for result in report["galleries"].values():
+        print(f"\nGallery {result['gallery_size']} ({result['index_type']}): "
+              f"load {result['load_embeddings_from_db_s']}s, "
+              f"search p50/p95/p99 {result['search_face']['p50_ms']}/{result['search_face']['p95_ms']}/"
+              f"{result['search_face']['p99_ms']} ms, {result['search_qps']} QPS batched, "
+              f"peak RSS {result['peak_rss_mb']} MB")
+    if "embedding" in report:
+        e = report["embedding"]
+        print(f"\nEmbedding: {e['faces_per_second_single']} faces/s single, "
+              f"{e['faces_per_second_batched']} faces/s in batches of {e['batch_size']}")
+    if "replay" in report:
+        r = report["replay"]
+        print(f"\nReplay: {r['frames']} frames, {r['faces']} faces, {r['fps']} FPS")
+        print(f"{'stage':<14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for stage in ("extract_face", "detect", "embed", "search", "frame"):
+            s = r[stage]
+            if s["count"]:
+                print(f"{stage:<14} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection, embedding, search and gallery loading.")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Synthetic gallery sizes to load and search (up to 1000000).")
+    parser.add_argument("--photos-per-identity", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=500, help="Search queries per gallery size.")
+    parser.add_argument("--noise", type=float, default=0.05, help="Perturbation applied to gallery vectors to form queries.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Faces per batched embedding or search call.")
+    media = parser.add_mutually_exclusive_group()
+    media.add_argument("--video", help="Video file replayed through the detection path.")
+    media.add_argument("--images", help="Image folder replayed through the detection path.")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--detection-width", type=int, default=640)
+    parser.add_argument("--confidence", type=float, default=None, help="Default DETECTION_CONFIDENCE.")
+    parser.add_argument("--embedding-faces", type=int, default=64,
+                        help="Synthetic face crops embedded when no media is given.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown counted as a regression by --compare.")
+    args = parser.parse_args()
+
+    # Keep the benchmark's index snapshots away from the application's
+    os.environ["INDEX_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    # Every pass must run the model: cache hits would time lookups, not embedding
+    os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+    os.environ["EMBEDDING_CACHE_DIR"] = ""
+    from face_service import FaceService
+    face_service, init_seconds = timed(FaceService, SyntheticGallery(0), sharded=False)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "detector": face_service.detector.name,
+        "index": face_service.index_config.describe(),
+        "face_service_init_s": round(init_seconds, 3),
+        # Keyed by size so --compare lines up the same galleries across runs
+        "galleries": {},
+    }
+
+    for size in args.gallery_sizes:
+        print(f"Benchmarking gallery of {size} embeddings...")
+        report["galleries"][str(size)] = bench_gallery(face_service, size, args)
+
+    frames = read_frames(args.video, args.images, args.max_frames) if (args.video or args.images) else []
+    if args.video or args.images:
+        if not frames:
+            parser.error("No frames could be read from the given media.")
+        # Searches run against the last gallery loaded above
+        print(f"Replaying {len(frames)} frames...")
+        report["replay"] = bench_replay(face_service, frames, args)
+
+    # Real crops give realistic embedding timings; random ones still exercise the model
+    crops = []
+    for frame in frames:
+        face, error = face_service.extract_face(frame)
+        if not error:
+            crops.append(face)
+    if not crops:
+        rng = np.random.default_rng(args.seed)
+        crops = [rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(args.embedding_faces)]
+    print(f"Embedding {len(crops)} faces...")
+    report["embedding"] = bench_embedding(face_service, crops, args)
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Throughput and recall report for sharded gallery search.
+
+A synthetic gallery is spread over 1, 2, 4... local shard workers and searched
+with batched queries; recall is measured against one exact flat index over the
+whole gallery. Each run then adds one more shard and reports how many
+embeddings the rebalance moved and how long it took. Run from the project
+root, for example:
+
+    python -m benchmarks.shard_benchmark --gallery-size 2000000 --shards 1 2 4 8
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from index_factory import IndexConfig
+from shard_search import ShardedIndex
+from benchmarks.index_benchmark import random_unit_vectors, make_queries, recall
+
+
+def benchmark_shards(config, shard_count, gallery, owners, queries, exact_ids, k, batch_size):
+    ids = np.arange(len(gallery), dtype=np.int64)
+    start = time.perf_counter()
+    index = ShardedIndex(config, gallery.shape[1], local_shards=shard_count)
+    start_seconds = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        index.build(ids, owners, gallery)
+        build_seconds = time.perf_counter() - start
+
+        results, batch_ms = [], []
+        for offset in range(0, len(queries), batch_size):
+            started = time.perf_counter()
+            results.append(index.search(queries[offset:offset + batch_size], k)[1])
+            batch_ms.append((time.perf_counter() - started) * 1000.0)
+        found_ids = np.concatenate(results)
+        sizes = list(index.shard_sizes().values())
+
+        start = time.perf_counter()
+        moved = index.add_shard()
+        rebalance_seconds = time.perf_counter() - start
+        rebalanced_ids = index.search(queries[:batch_size], k)[1]
+    finally:
+        index.close()
+
+    return {
+        "shards": shard_count,
+        "start_seconds": round(start_seconds, 2),
+        "build_seconds": round(build_seconds, 2),
+        "batch_p50_ms": round(float(np.percentile(batch_ms, 50)), 2),
+        "queries_per_second": round(len(queries) * 1000.0 / sum(batch_ms), 1),
+        f"recall@{k}": round(recall(found_ids, exact_ids, k), 4),
+        "largest_shard_share": round(max(sizes) / len(gallery), 3),
+        "rebalance_moved_share": round(moved / len(gallery), 3),
+        "rebalance_seconds": round(rebalance_seconds, 2),
+        "recall_after_rebalance": round(recall(rebalanced_ids, exact_ids[:batch_size], k), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure sharded gallery search throughput, recall and rebalancing.")
+    parser.add_argument("--gallery-size", type=int, default=200000)
+    parser.add_argument("--embeddings-per-criminal", type=int, default=3)
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=64, help="Queries per search call.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend", default="flat", help="Index backend of every shard (see FAISS_INDEX_TYPE).")
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    gallery = random_unit_vectors(args.gallery_size, args.dimension, rng)
+    owners = np.arange(args.gallery_size) // args.embeddings_per_criminal
+    queries = make_queries(gallery, args.queries, args.noise, rng)
+
+    exact = faiss.IndexFlatIP(args.dimension)
+    exact.add(gallery)
+    exact_ids = exact.search(queries, args.k)[1]
+    del exact
+
+    config = IndexConfig(args.backend)
+    results = []
+    for shard_count in args.shards:
+        print(f"Benchmarking {shard_count} shard(s)...")
+        results.append(benchmark_shards(config, shard_count, gallery, owners, queries, exact_ids, args.k, args.batch_size))
+
+    print(f"\nGallery {args.gallery_size} x {args.dimension}, backend {config.describe()}, batches of {args.batch_size}")
+    print(f"{'shards':>6} {'build s':>8} {'batch p50':>10} {'queries/s':>10} {'recall':>7} "
+          f"{'largest':>8} {'+1 moved':>9} {'moved s':>8}")
+    for r in results:
+        print(f"{r['shards']:>6} {r['build_seconds']:>8.2f} {r['batch_p50_ms']:>10.2f} {r['queries_per_second']:>10.1f} "
+              f"{r[f'recall@{args.k}']:>7.4f} {r['largest_shard_share']:>8.3f} {r['rebalance_moved_share']:>9.3f} "
+              f"{r['rebalance_seconds']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"gallery_size": args.gallery_size, "backend": config.describe(), "results": results}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
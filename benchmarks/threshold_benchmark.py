@@ -0,0 +1,383 @@
+"""
+Offline evaluation of the recognition and detection thresholds.
+
+A labelled dataset (one subdirectory of face images per person) is embedded
+once per engine and the embeddings are cached under --cache-dir, so reruns go
+straight to scoring. Faces take the same path as in FaceService: crops are
+aligned with their landmarks and faces failing the quality gate
+(FACE_QUALITY_MIN_SCORE) are counted and left out. Every pair of faces is then scored with blocked matrix
+multiplies; same-person (genuine) and different-person (impostor) scores are
+binned on the fly, so memory stays flat however many pairs there are. From
+the histograms come ROC and DET curves, the equal error rate, the threshold
+that meets a target false-match rate, and the error rates at the current
+RECOGNITION_THRESHOLD. With --crop, faces are cut out by the configured
+detector and the share of images passing each detection confidence is
+reported too. Run from the project root, for example:
+
+    python -m benchmarks.threshold_benchmark --dataset lfw/ --crop --target-fmr 1e-4
+    python -m benchmarks.threshold_benchmark --dataset lfw/ --crop --engines tensorflow onnx --curves det.csv
+
+Live matching compares a face with every stored embedding of a criminal, so
+pairwise rates are a close guide to, not an exact copy of, the live ones.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from benchmarks.pipeline_benchmark import SyntheticGallery
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CONFIDENCE_LEVELS = (0.8, 0.9, 0.95, 0.99)
+FMR_TARGETS = (1e-2, 1e-3, 1e-4, 1e-5)
+
+
+def find_dataset(directory):
+    """Lists (path, person) for every image in the dataset's per-person subdirectories."""
+    items = []
+    for person in sorted(os.listdir(directory)):
+        person_dir = os.path.join(directory, person)
+        if not os.path.isdir(person_dir):
+            continue
+        for name in sorted(os.listdir(person_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((os.path.join(person_dir, name), person))
+    return items
+
+
+def dataset_fingerprint(items):
+    """Changes whenever an image is added, removed or rewritten."""
+    digest = hashlib.blake2b(digest_size=12)
+    for path, person in items:
+        stat = os.stat(path)
+        digest.update(f"{person}/{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def load_face(path, detector):
+    """
+    Reads an image as RGB. With a detector, cuts out its largest face the way
+    FaceService.extract_face does. Returns (face, landmarks relative to the
+    crop, detection confidence); the last two are None without a detector.
+    """
+    image = cv2.imread(path)
+    if image is None:
+        return None, None, None
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    if detector is None:
+        return image, None, None
+    faces = detector.detect_faces(image)
+    if not faces:
+        return None, None, 0.0
+    face = max(faces, key=lambda f: f['box'][2] * f['box'][3])
+    x, y, w, h = face['box']
+    crop = image[y:y+h, x:x+w]
+    if crop.size == 0:
+        return None, None, face['confidence']
+    keypoints = {name: (px - x, py - y) for name, (px, py) in face.get('keypoints', {}).items()}
+    return crop, keypoints, face['confidence']
+
+
+def embed_dataset(face_service, items, crop, batch_size, cache_dir):
+    """
+    Embeds every image through the FaceService's quality gate and
+    get_embeddings_batch (which aligns crops with their landmarks), or loads
+    the result from the cache. Returns a dict with L2-normalized embeddings,
+    person labels, detection confidences (NaN without --crop), the number of
+    faces the quality gate rejected and the embedding rate when computed.
+    """
+    scorer = face_service.quality_scorer
+    detector = face_service.detector if crop else None
+    cache_path = None
+    if cache_dir:
+        mode = "crop" if crop else "raw"
+        cache_path = os.path.join(
+            cache_dir, f"{face_service.embedding_engine.model_id}_{mode}_q{scorer.min_score:g}_{dataset_fingerprint(items)}.npz")
+        if os.path.exists(cache_path):
+            cached = np.load(cache_path)
+            print(f"Loaded {len(cached['embeddings'])} cached embeddings from {cache_path}")
+            return {"embeddings": cached["embeddings"], "labels": cached["labels"].tolist(),
+                    "confidences": cached["confidences"], "quality_rejected": int(cached["quality_rejected"]),
+                    "faces_per_second": None}
+
+    embeddings, labels, confidences = [], [], []
+    batch, batch_keypoints, batch_labels, batch_confidences = [], [], [], []
+    embed_seconds = 0.0
+    quality_rejected = 0
+
+    def flush():
+        nonlocal embed_seconds, quality_rejected
+        if not batch:
+            return
+        scores, _ = scorer.score_batch(batch, batch_keypoints)
+        passing = [i for i, score in enumerate(scores) if scorer.passes(score)]
+        quality_rejected += len(batch) - len(passing)
+        if passing:
+            start = time.perf_counter()
+            batch_embeddings, error = face_service.get_embeddings_batch(
+                [batch[i] for i in passing], [batch_keypoints[i] for i in passing])
+            embed_seconds += time.perf_counter() - start
+            if error:
+                raise ValueError(error)
+            embeddings.append(batch_embeddings)
+            labels.extend(batch_labels[i] for i in passing)
+            confidences.extend(batch_confidences[i] for i in passing)
+        batch.clear(), batch_keypoints.clear(), batch_labels.clear(), batch_confidences.clear()
+
+    skipped = 0
+    for path, person in items:
+        face, keypoints, confidence = load_face(path, detector)
+        if face is None:
+            skipped += 1
+            continue
+        batch.append(face)
+        batch_keypoints.append(keypoints)
+        batch_labels.append(person)
+        batch_confidences.append(np.nan if confidence is None else confidence)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    if skipped:
+        print(f"Skipped {skipped} images without a usable face.")
+    if quality_rejected:
+        print(f"The quality gate rejected {quality_rejected} faces.")
+    if not embeddings:
+        raise ValueError("No faces could be embedded.")
+
+    embeddings = np.concatenate(embeddings).astype(np.float32)
+    confidences = np.array(confidences, dtype=np.float32)
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_path, embeddings=embeddings, labels=np.array(labels), confidences=confidences,
+                 quality_rejected=quality_rejected)
+    return {"embeddings": embeddings, "labels": labels, "confidences": confidences,
+            "quality_rejected": quality_rejected, "faces_per_second": len(embeddings) / max(embed_seconds, 1e-9)}
+
+
+def synthetic_dataset(identities, per_identity, dimension, spread, rng):
+    """Clustered random embeddings; only exercises the scoring, the rates mean nothing."""
+    centers = rng.standard_normal((identities, dimension)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    embeddings = np.repeat(centers, per_identity, axis=0)
+    embeddings += spread * rng.standard_normal(embeddings.shape).astype(np.float32) / np.sqrt(dimension)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    labels = np.repeat(np.arange(identities), per_identity).tolist()
+    return {"embeddings": embeddings, "labels": labels, "confidences": np.full(len(labels), np.nan, dtype=np.float32),
+            "quality_rejected": None, "faces_per_second": None}
+
+
+def pair_histograms(embeddings, labels, bins, block_size):
+    """
+    Scores every unordered pair once, block by block, and bins the cosine
+    similarities over [-1, 1]. Returns (genuine counts, impostor counts).
+    """
+    _, codes = np.unique(np.asarray(labels), return_inverse=True)
+    count = len(embeddings)
+    total = np.zeros(bins, dtype=np.int64)
+    genuine = np.zeros(bins, dtype=np.int64)
+    scale = bins / 2.0
+    for row_start in range(0, count, block_size):
+        rows = embeddings[row_start:row_start + block_size]
+        row_codes = codes[row_start:row_start + block_size]
+        for col_start in range(row_start, count, block_size):
+            scores = rows @ embeddings[col_start:col_start + block_size].T
+            cells = np.clip(((scores + 1.0) * scale).astype(np.int64), 0, bins - 1)
+            same = row_codes[:, None] == codes[None, col_start:col_start + block_size]
+            if col_start == row_start:
+                # Diagonal block: only pairs above the diagonal, never a face with itself
+                upper = np.triu(np.ones(scores.shape, dtype=bool), k=1)
+                cells, same = cells[upper], same[upper]
+            else:
+                cells, same = cells.ravel(), same.ravel()
+            total += np.bincount(cells, minlength=bins)
+            genuine += np.bincount(cells[same], minlength=bins)
+    return genuine, total - genuine
+
+
+def error_curves(genuine, impostor):
+    """
+    Accepting scores at or above each bin's lower edge, returns (thresholds,
+    false-match rates, false-non-match rates), thresholds ascending.
+    """
+    bins = len(genuine)
+    thresholds = np.linspace(-1.0, 1.0, bins + 1)[:-1]
+    accepted_impostors = np.cumsum(impostor[::-1])[::-1]
+    accepted_genuine = np.cumsum(genuine[::-1])[::-1]
+    fmr = accepted_impostors / max(1, impostor.sum())
+    fnmr = 1.0 - accepted_genuine / max(1, genuine.sum())
+    return thresholds, fmr, fnmr
+
+
+def summarize(thresholds, fmr, fnmr, target_fmr, current_threshold):
+    eer_index = int(np.argmin(np.abs(fmr - fnmr)))
+    summary = {
+        "eer": round(float((fmr[eer_index] + fnmr[eer_index]) / 2), 5),
+        "eer_threshold": round(float(thresholds[eer_index]), 4),
+    }
+    for target in sorted(set(FMR_TARGETS) | {target_fmr}, reverse=True):
+        # FMR only falls as the threshold rises, so the first bin that meets the target is the loosest one
+        meeting = np.nonzero(fmr <= target)[0]
+        index = int(meeting[0]) if len(meeting) else len(fmr) - 1
+        summary[f"threshold@fmr={target:g}"] = round(float(thresholds[index]), 4)
+        summary[f"fnmr@fmr={target:g}"] = round(float(fnmr[index]), 5)
+    current = min(len(thresholds) - 1, int(np.searchsorted(thresholds, current_threshold - 1e-9)))
+    summary["current_threshold"] = current_threshold
+    summary["fmr@current"] = round(float(fmr[current]), 6)
+    summary["fnmr@current"] = round(float(fnmr[current]), 5)
+    return summary
+
+
+def detection_report(confidences, current_confidence):
+    """Share of images whose largest face passes each detection confidence."""
+    if np.all(np.isnan(confidences)):
+        return None
+    levels = sorted(set(CONFIDENCE_LEVELS) | {current_confidence})
+    return {f"pass@{level:g}": round(float(np.mean(confidences >= level)), 4) for level in levels}
+
+
+def write_curves(path, curves):
+    """Writes the ROC/DET points of every engine as CSV: engine, threshold, fmr, fnmr, tmr."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["engine", "threshold", "fmr", "fnmr", "tmr"])
+        for name, (thresholds, fmr, fnmr) in curves.items():
+            for threshold, false_match, false_non_match in zip(thresholds, fmr, fnmr):
+                writer.writerow([name, f"{threshold:.4f}", f"{false_match:.8f}", f"{false_non_match:.8f}",
+                                 f"{1.0 - false_non_match:.8f}"])
+
+
+def plot_curves(path, curves):
+    """Draws ROC and DET curves side by side; needs matplotlib."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed; skipping --plot.")
+        return
+    figure, (roc, det) = plt.subplots(1, 2, figsize=(11, 4.5))
+    for name, (_, fmr, fnmr) in curves.items():
+        visible = fmr > 0
+        roc.plot(fmr[visible], 1.0 - fnmr[visible], label=name)
+        det.plot(fmr[visible], np.maximum(fnmr[visible], 1e-6), label=name)
+    roc.set(xscale="log", xlabel="False match rate", ylabel="True match rate", title="ROC")
+    det.set(xscale="log", yscale="log", xlabel="False match rate", ylabel="False non-match rate", title="DET")
+    for axes in (roc, det):
+        axes.grid(True, which="both", alpha=0.3)
+        axes.legend()
+    figure.tight_layout()
+    figure.savefig(path, dpi=120)
+    print(f"Curves plotted to {path}")
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Tune recognition and detection thresholds on a labelled face dataset.")
+    parser.add_argument("--dataset", help="Directory with one subdirectory of images per person.")
+    parser.add_argument("--crop", action="store_true", help="Crop the largest detected face (FACE_DETECTOR) from each image.")
+    parser.add_argument("--engines", nargs="+", default=[os.getenv("EMBEDDING_ENGINE", "tensorflow")],
+                        help="Embedding engines to evaluate (tensorflow, onnx).")
+    parser.add_argument("--cache-dir", default="eval_cache", help="Where embeddings are cached; empty disables it.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--detection-confidence", type=float, default=float(os.getenv("DETECTION_CONFIDENCE") or 0.95),
+                        help="With --crop, faces below this confidence are left out of the pairs.")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("RECOGNITION_THRESHOLD") or 0.65),
+                        help="Recognition threshold to report error rates at.")
+    parser.add_argument("--target-fmr", type=float, default=1e-3, help="False-match rate to find a threshold for.")
+    parser.add_argument("--bins", type=int, default=4000, help="Score bins over [-1, 1].")
+    parser.add_argument("--block-size", type=int, default=2048, help="Rows and columns per matrix multiply.")
+    parser.add_argument("--synthetic", type=int, nargs=2, metavar=("IDENTITIES", "PER_IDENTITY"),
+                        help="Score random clustered embeddings instead of a dataset (throughput only).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--curves", help="Write ROC/DET points as CSV to this path.")
+    parser.add_argument("--plot", help="Plot ROC and DET curves to this image (needs matplotlib).")
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    args = parser.parse_args()
+    if not args.dataset and not args.synthetic:
+        parser.error("Give --dataset, or --synthetic to measure scoring throughput only.")
+
+    items = []
+    if args.dataset:
+        items = find_dataset(args.dataset)
+        if not items:
+            parser.error(f"No images found under {args.dataset}")
+        # Faces go through a FaceService over an empty gallery; keep its index
+        # snapshot away from the application's and embed without its cache
+        os.environ["INDEX_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="threshold_benchmark_")
+        os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+        os.environ["EMBEDDING_CACHE_DIR"] = ""
+
+    results, curves = [], {}
+    for engine_name in (["synthetic"] if args.synthetic else args.engines):
+        print(f"Evaluating {engine_name}...")
+        if args.synthetic:
+            data = synthetic_dataset(*args.synthetic, 512, 1.0, np.random.default_rng(args.seed))
+        else:
+            try:
+                from face_service import FaceService
+                os.environ["EMBEDDING_ENGINE"] = engine_name
+                face_service = FaceService(SyntheticGallery(0), sharded=False)
+                data = embed_dataset(face_service, items, args.crop, args.batch_size, args.cache_dir)
+            except Exception as e:
+                print(f"Skipping {engine_name}: {e}")
+                continue
+
+        embeddings, labels, confidences = data["embeddings"], data["labels"], data["confidences"]
+        result = {"engine": engine_name, "faces": len(labels), "people": len(set(labels)),
+                  "quality_rejected": data["quality_rejected"],
+                  "detection": detection_report(confidences, args.detection_confidence)}
+        if result["detection"] is not None:
+            keep = confidences >= args.detection_confidence
+            embeddings, labels = embeddings[keep], [label for label, kept in zip(labels, keep) if kept]
+            result["faces_scored"] = len(labels)
+
+        start = time.perf_counter()
+        genuine, impostor = pair_histograms(embeddings, labels, args.bins, args.block_size)
+        score_seconds = time.perf_counter() - start
+        thresholds, fmr, fnmr = error_curves(genuine, impostor)
+        curves[engine_name] = (thresholds, fmr, fnmr)
+        result.update(
+            genuine_pairs=int(genuine.sum()),
+            impostor_pairs=int(impostor.sum()),
+            faces_per_second=None if data["faces_per_second"] is None else round(data["faces_per_second"], 1),
+            pairs_per_second=round((genuine.sum() + impostor.sum()) / max(score_seconds, 1e-9)),
+            **summarize(thresholds, fmr, fnmr, args.target_fmr, args.threshold),
+        )
+        results.append(result)
+
+    target = f"{args.target_fmr:g}"
+    print(f"\nThresholds accept cosine similarity >= t; bin width {2.0 / args.bins:g}")
+    print(f"{'engine':<14} {'faces':>7} {'genuine':>10} {'impostor':>12} {'EER':>8} {'t@EER':>7} "
+          f"{'t@FMR ' + target:>12} {'FNMR there':>11} {'FMR@' + str(args.threshold):>10} {'FNMR@' + str(args.threshold):>10} "
+          f"{'faces/s':>8} {'Mpairs/s':>9}")
+    for r in results:
+        faces_per_second = "-" if r["faces_per_second"] is None else f"{r['faces_per_second']:.1f}"
+        print(f"{r['engine']:<14} {r.get('faces_scored', r['faces']):>7} {r['genuine_pairs']:>10} {r['impostor_pairs']:>12} "
+              f"{r['eer']:>8.4f} {r['eer_threshold']:>7.3f} {r[f'threshold@fmr={target}']:>12.3f} "
+              f"{r[f'fnmr@fmr={target}']:>11.4f} {r['fmr@current']:>10.6f} {r['fnmr@current']:>10.4f} "
+              f"{faces_per_second:>8} {r['pairs_per_second'] / 1e6:>9.1f}")
+        if r["quality_rejected"]:
+            print(f"{'':<14} quality gate rejected {r['quality_rejected']} faces")
+        if r["detection"]:
+            passing = "  ".join(f"{level}: {share:.1%}" for level, share in r["detection"].items())
+            print(f"{'':<14} detection {passing}")
+
+    if args.curves and curves:
+        write_curves(args.curves, curves)
+        print(f"\nCurves written to {args.curves}")
+    if args.plot and curves:
+        plot_curves(args.plot, curves)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"dataset": args.dataset, "target_fmr": args.target_fmr, "results": results}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Bulk import of a criminal watchlist from a CSV or JSON manifest plus an image folder.
+
+The manifest needs a name and an image column (path relative to --images-dir);
+father_name, gender, dob and crimes_done are optional. Several rows with the
+same name enroll several photos of that criminal:
+
+    python bulk_import.py watchlist.csv --images-dir photos/ --errors import_errors.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+
+def read_manifest(path, images_dir):
+    """Reads manifest rows as record dicts with an absolute image_path."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    elif path.lower().endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+
+    records = []
+    for row in rows:
+        image = (row.get("image") or row.get("image_path") or "").strip()
+        records.append({
+            "name": row.get("name", ""),
+            "father_name": row.get("father_name"),
+            "gender": row.get("gender"),
+            "dob": row.get("dob"),
+            "crimes_done": row.get("crimes_done"),
+            "image_path": os.path.join(images_dir, image) if image else "",
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import many criminals with their photos at once.")
+    parser.add_argument("manifest", help="CSV, JSON or JSONL manifest of criminals.")
+    parser.add_argument("--images-dir", default=".", help="Directory the manifest's image paths are relative to.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Faces embedded per forward pass.")
+    parser.add_argument("--workers", type=int, default=4, help="Threads reading images and detecting faces.")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per INSERT transaction.")
+    parser.add_argument("--errors", default="import_errors.csv", help="Where to write per-record errors.")
+    args = parser.parse_args()
+
+    records = read_manifest(args.manifest, args.images_dir)
+    # A criminal may have several photos, i.e. several records with the same name
+    names = {(record.get('name') or '').strip() for record in records} - {""}
+    print(f"Read {len(records)} photos of {len(names)} criminals from {args.manifest}.")
+
+    from database import DatabaseService
+    from face_service import FaceService
+    face_service = FaceService(DatabaseService(), sharded=False)
+
+    start_time = time.perf_counter()
+
+    def report_progress(stage, done, total):
+        elapsed = time.perf_counter() - start_time
+        print(f"\r{stage}: {done}/{total} ({done / elapsed:.1f}/s)", end="", flush=True)
+        if done == total:
+            print()
+
+    imported, errors = face_service.import_criminals(
+        records, batch_size=args.batch_size, workers=args.workers,
+        chunk_size=args.chunk_size, progress_callback=report_progress
+    )
+    face_service.save_snapshot()
+
+    print(f"Imported {imported} of {len(names)} criminals in {time.perf_counter() - start_time:.1f}s.")
+    if errors:
+        with open(args.errors, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "error"])
+            writer.writerows(errors)
+        print(f"{len(errors)} photos or criminals failed; see {args.errors}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
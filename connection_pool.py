@@ -0,0 +1,190 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import pymysql
+
+# Errors after which a connection can no longer be trusted and is thrown away
+BROKEN_CONNECTION_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+
+class LatencyStats:
+    """Keeps a count, running total and a window of recent samples of a duration."""
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.samples.append(seconds)
+
+    def summary(self):
+        """Returns count, mean, p50, p95 and max in milliseconds (percentiles over the recent window)."""
+        with self._lock:
+            samples = np.array(self.samples) * 1000.0
+            count, total, maximum = self.count, self.total, self.max
+        if count == 0:
+            return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "count": count,
+            "mean_ms": round(total * 1000.0 / count, 3),
+            "p50_ms": round(float(np.percentile(samples, 50)), 3),
+            "p95_ms": round(float(np.percentile(samples, 95)), 3),
+            "max_ms": round(maximum * 1000.0, 3),
+        }
+
+
+class _PooledConnection:
+    """A live connection plus the bookkeeping the pool needs to decide when to recycle it."""
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    A thread-safe, bounded pool of MySQL connections.
+    At most max_size connections exist at once; callers wait up to timeout
+    seconds for a free one. A connection idle for longer than
+    health_check_interval is pinged before it is handed out, one older than
+    recycle seconds is replaced, and one that raised a connection error is
+    closed instead of being returned.
+    """
+    def __init__(self, connect, max_size=5, timeout=10.0, recycle=3600.0, health_check_interval=30.0):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.health_check_interval = health_check_interval
+
+        self._idle = []
+        self._open_count = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self.wait_stats = LatencyStats()
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of a with block."""
+        pooled = self._acquire()
+        try:
+            yield pooled.raw
+        except BROKEN_CONNECTION_ERRORS:
+            self._discard(pooled)
+            raise
+        except BaseException:
+            try:
+                pooled.raw.rollback()
+            except Exception:
+                self._discard(pooled)
+                raise
+            self._release(pooled)
+            raise
+        else:
+            self._release(pooled)
+
+    def _acquire(self):
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The connection pool is closed.")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._open_count < self.max_size:
+                    # Reserve the slot now and connect outside the lock
+                    self._open_count += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise TimeoutError(f"No database connection became free within {self.timeout:.1f}s.")
+                self._condition.wait(remaining)
+
+        try:
+            if pooled is not None:
+                pooled = self._check(pooled)
+            if pooled is None:
+                pooled = _PooledConnection(self._connect())
+                self.created += 1
+        except BaseException:
+            with self._condition:
+                self._open_count -= 1
+                self._condition.notify()
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return pooled
+
+    def _check(self, pooled):
+        """Returns the connection if it is still usable, otherwise closes it and returns None."""
+        now = time.monotonic()
+        if now - pooled.created_at > self.recycle:
+            self._close_raw(pooled)
+            return None
+        if now - pooled.last_used > self.health_check_interval:
+            try:
+                pooled.raw.ping(reconnect=False)
+            except Exception:
+                self._close_raw(pooled)
+                return None
+        return pooled
+
+    def _release(self, pooled):
+        pooled.last_used = time.monotonic()
+        with self._condition:
+            if self._closed:
+                self._open_count -= 1
+                self._close_raw(pooled)
+            else:
+                # LIFO reuse keeps a few connections warm and lets the rest age out
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    def _discard(self, pooled):
+        self._close_raw(pooled)
+        with self._condition:
+            self._open_count -= 1
+            self._condition.notify()
+
+    def _close_raw(self, pooled):
+        self.discarded += 1
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Closes every idle connection; connections in use are closed when they are returned."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._close_raw(pooled)
+
+    def get_stats(self):
+        with self._condition:
+            stats = {
+                "max_size": self.max_size,
+                "open": self._open_count,
+                "idle": len(self._idle),
+                "in_use": self._open_count - len(self._idle),
+            }
+        stats.update(created=self.created, discarded=self.discarded, timeouts=self.timeouts, wait=self.wait_stats.summary())
+        return stats
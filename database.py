@@ -1,13 +1,24 @@
 import pymysql
 import os
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from connection_pool import ConnectionPool, LatencyStats
 
 class DatabaseService:
     """
     Handles all interactions with the MySQL database.
     Manages connections and executes queries.
+    Connections come from a bounded pool (DB_POOL_SIZE) and run in autocommit
+    mode, so reads always see committed data; writes use transaction().
+    Worker processes pass init_schema=False and leave the schema setup to their parent.
     """
-    def __init__(self):
+    EMBEDDING_ROWS_SQL = (
+        "SELECT e.id, e.criminal_id, c.name, e.embedding, GREATEST(e.updated_at, c.updated_at) AS updated_at "
+        "FROM criminal_embeddings e JOIN criminals c ON c.id = e.criminal_id"
+    )
+
+    def __init__(self, init_schema=True):
         load_dotenv()
         self.db_config = {
             "host": os.getenv("DB_HOST", "localhost"),
@@ -15,21 +26,68 @@ class DatabaseService:
             "password": os.getenv("DB_PASSWORD", ""),
             "database": os.getenv("DB_NAME", "criminal_detection")
         }
-        self.init_database()
+        self.pool = ConnectionPool(
+            self._connect,
+            max_size=int(os.getenv("DB_POOL_SIZE", 5)),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", 10)),
+            recycle=float(os.getenv("DB_POOL_RECYCLE", 3600)),
+        )
+        self.query_stats = {}
+        if init_schema:
+            self.init_database()
 
-    def get_connection(self):
-        """Establishes and returns a database connection."""
+    def _connect(self):
         try:
-            return pymysql.connect(**self.db_config, cursorclass=pymysql.cursors.DictCursor)
+            return pymysql.connect(**self.db_config, cursorclass=pymysql.cursors.DictCursor, autocommit=True)
         except pymysql.Error as e:
             print(f"Error connecting to MySQL Database: {e}")
             raise
 
+    def get_connection(self):
+        """
+        Opens a dedicated connection outside the pool. The caller must close it.
+        Prefer the typed methods below, which borrow pooled connections.
+        """
+        return self._connect()
+
+    @contextmanager
+    def transaction(self):
+        """Borrows a pooled connection and yields a cursor inside a transaction that commits on success."""
+        with self.pool.connection() as connection:
+            connection.begin()
+            with connection.cursor() as cursor:
+                yield cursor
+            connection.commit()
+
+    @contextmanager
+    def timed(self, query_name):
+        """Records how long the block takes under query_name in query_stats."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_query(query_name, time.perf_counter() - start)
+
+    def record_query(self, query_name, seconds):
+        stats = self.query_stats.get(query_name)
+        if stats is None:
+            stats = self.query_stats.setdefault(query_name, LatencyStats())
+        stats.record(seconds)
+
+    def get_stats(self):
+        """Pool usage and wait times plus per-query latencies, in milliseconds."""
+        return {
+            "pool": self.pool.get_stats(),
+            "queries": {name: stats.summary() for name, stats in sorted(self.query_stats.items())},
+        }
+
+    def close(self):
+        self.pool.close()
+
     def init_database(self):
         """Creates the necessary tables if they don't already exist."""
         try:
-            connection = self.get_connection()
-            with connection.cursor() as cursor:
+            with self.transaction() as cursor:
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS criminals (
                         id INT AUTO_INCREMENT PRIMARY KEY,
@@ -40,7 +98,45 @@ class DatabaseService:
                         crimes_done TEXT,
                         embedding LONGBLOB,
                         question VARCHAR(255),
-                        answer VARCHAR(255)
+                        answer VARCHAR(255),
+                        updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                        INDEX idx_criminals_updated_at (updated_at)
+                    )
+                """)
+                # Older databases predate the change-tracking column used for incremental index sync
+                self.ensure_column(
+                    cursor, "criminals", "updated_at",
+                    "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6), "
+                    "ADD INDEX idx_criminals_updated_at (updated_at)"
+                )
+                # One row per enrolled photo, so a criminal can be matched from
+                # several angles. criminals.embedding is kept only for migration.
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS criminal_embeddings (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        criminal_id INT NOT NULL,
+                        embedding LONGBLOB NOT NULL,
+                        created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+                        updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                        INDEX idx_criminal_embeddings_criminal (criminal_id),
+                        INDEX idx_criminal_embeddings_updated_at (updated_at),
+                        FOREIGN KEY (criminal_id) REFERENCES criminals(id) ON DELETE CASCADE
+                    )
+                """)
+                self.migrate_legacy_embeddings(cursor)
+                # One row per logged recognition; written in batches by SightingsLog
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS sightings (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        criminal_id INT NOT NULL,
+                        camera VARCHAR(255) NOT NULL,
+                        seen_at DATETIME(3) NOT NULL,
+                        score FLOAT NOT NULL,
+                        thumbnail_path VARCHAR(512),
+                        INDEX idx_sightings_seen_at (seen_at),
+                        INDEX idx_sightings_criminal_seen_at (criminal_id, seen_at),
+                        INDEX idx_sightings_camera_seen_at (camera, seen_at),
+                        FOREIGN KEY (criminal_id) REFERENCES criminals(id) ON DELETE CASCADE
                     )
                 """)
                 cursor.execute("""
@@ -52,9 +148,252 @@ class DatabaseService:
                         security_answer VARCHAR(255)
                     )
                 """)
-            connection.commit()
-            connection.close()
             print("Database initialized successfully.")
         except pymysql.Error as e:
             print(f"Error during database initialization: {e}")
             raise
+
+    def ensure_column(self, cursor, table, column, definition):
+        """Adds a column to an existing table if it is missing."""
+        cursor.execute(
+            "SELECT COUNT(*) AS found FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        if cursor.fetchone()['found'] == 0:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def migrate_legacy_embeddings(self, cursor):
+        """Copies the single embedding stored on each criminal into criminal_embeddings once."""
+        cursor.execute("SELECT COUNT(*) AS total FROM criminal_embeddings")
+        if cursor.fetchone()['total'] > 0:
+            return
+        cursor.execute("""
+            INSERT INTO criminal_embeddings (criminal_id, embedding)
+            SELECT id, embedding FROM criminals WHERE embedding IS NOT NULL
+        """)
+        if cursor.rowcount:
+            print(f"Migrated {cursor.rowcount} embeddings to the criminal_embeddings table.")
+
+    def get_criminals_version(self):
+        """
+        Returns a cheap stamp of the criminals and criminal_embeddings tables
+        (row counts and latest update time) that changes whenever a row is
+        added, updated or deleted.
+        """
+        with self.timed("get_criminals_version"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) AS total, MAX(updated_at) AS last_update FROM criminals")
+                criminals = cursor.fetchone()
+                cursor.execute("SELECT COUNT(*) AS total, MAX(updated_at) AS last_update FROM criminal_embeddings")
+                embeddings = cursor.fetchone()
+        updates = [row['last_update'] for row in (criminals, embeddings) if row['last_update']]
+        last_update = max(updates).isoformat() if updates else None
+        return {"total": int(criminals['total']), "embeddings": int(embeddings['total']), "last_update": last_update}
+
+    def fetch_user(self, email):
+        """Returns the users row for an email address, or None."""
+        with self.timed("fetch_user"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id, email, password, security_question, security_answer FROM users WHERE email = %s",
+                    (email,)
+                )
+                return cursor.fetchone()
+
+    def find_criminal_by_name(self, name):
+        """Returns the criminals row with this name, or None."""
+        with self.timed("find_criminal_by_name"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id, name, father_name, gender, dob, crimes_done FROM criminals WHERE name = %s",
+                    (name,)
+                )
+                return cursor.fetchone()
+
+    def insert_criminal(self, name, father_name=None, gender=None, dob=None, crimes_done=None, embeddings=()):
+        """
+        Inserts a criminal and its embeddings (blobs from embedding_codec.encode_embedding) in one transaction.
+        Returns (criminal id, [embedding ids]).
+        """
+        with self.timed("insert_criminal"), self.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO criminals (name, father_name, gender, dob, crimes_done) VALUES (%s, %s, %s, %s, %s)",
+                (name, father_name, gender, dob, crimes_done)
+            )
+            criminal_id = cursor.lastrowid
+            embedding_ids = self._insert_embeddings(cursor, criminal_id, embeddings)
+        return criminal_id, embedding_ids
+
+    def add_criminal_embeddings(self, criminal_id, embeddings):
+        """Stores further embeddings (blobs from embedding_codec.encode_embedding) for a criminal. Returns their ids."""
+        with self.timed("add_criminal_embeddings"), self.transaction() as cursor:
+            return self._insert_embeddings(cursor, criminal_id, embeddings)
+
+    def _insert_embeddings(self, cursor, criminal_id, embeddings):
+        embedding_ids = []
+        for embedding in embeddings:
+            cursor.execute(
+                "INSERT INTO criminal_embeddings (criminal_id, embedding) VALUES (%s, %s)",
+                (criminal_id, embedding)
+            )
+            embedding_ids.append(cursor.lastrowid)
+        return embedding_ids
+
+    def stream_embeddings(self, since=None, chunk_size=1000):
+        """
+        Yields lists of up to chunk_size embedding rows (id, criminal_id, name,
+        embedding bytes, updated_at) read through a server-side cursor, so the
+        whole gallery never sits in client memory at once. With since, only rows
+        whose embedding or criminal changed at or after that time are returned.
+        """
+        sql, args = self.EMBEDDING_ROWS_SQL, None
+        if since is not None:
+            sql += " WHERE e.updated_at >= %s OR c.updated_at >= %s"
+            args = (since, since)
+
+        with self.pool.connection() as connection:
+            start = time.perf_counter()
+            cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+            try:
+                cursor.execute(sql, args)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                # Closing drains any unread rows so the connection can be reused
+                cursor.close()
+                self.record_query("stream_embeddings", time.perf_counter() - start)
+
+    def count_embeddings(self):
+        with self.timed("count_embeddings"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) AS total FROM criminal_embeddings")
+                return int(cursor.fetchone()['total'])
+
+    def fetch_embedding_ids(self):
+        """Returns the set of all stored embedding ids."""
+        with self.timed("fetch_embedding_ids"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id FROM criminal_embeddings")
+                return {row['id'] for row in cursor.fetchall()}
+
+    def insert_sightings(self, rows):
+        """
+        Inserts sightings in one transaction; pymysql turns the executemany
+        into multi-row INSERT statements. Each row is
+        (criminal_id, camera, seen_at, score, thumbnail_path or None).
+        """
+        if not rows:
+            return
+        with self.timed("insert_sightings"), self.transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO sightings (criminal_id, camera, seen_at, score, thumbnail_path) VALUES (%s, %s, %s, %s, %s)",
+                rows
+            )
+
+    def fetch_sightings(self, start=None, end=None, criminal_id=None, camera=None, limit=1000):
+        """
+        Returns the newest sightings (with the criminal's name) seen between
+        start and end, optionally only those of one criminal or one camera.
+        """
+        conditions, args = [], []
+        if start is not None:
+            conditions.append("s.seen_at >= %s")
+            args.append(start)
+        if end is not None:
+            conditions.append("s.seen_at < %s")
+            args.append(end)
+        if criminal_id is not None:
+            conditions.append("s.criminal_id = %s")
+            args.append(criminal_id)
+        if camera is not None:
+            conditions.append("s.camera = %s")
+            args.append(camera)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        args.append(int(limit))
+
+        with self.timed("fetch_sightings"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT s.id, s.criminal_id, c.name, s.camera, s.seen_at, s.score, s.thumbnail_path "
+                    f"FROM sightings s JOIN criminals c ON c.id = s.criminal_id {where}"
+                    "ORDER BY s.seen_at DESC LIMIT %s",
+                    args
+                )
+                return cursor.fetchall()
+
+    def find_existing_criminal_names(self, names, chunk_size=1000):
+        """Returns the subset of names that are already registered."""
+        names = list(names)
+        existing = set()
+        with self.timed("find_existing_criminal_names"), self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                for start in range(0, len(names), chunk_size):
+                    chunk = names[start:start + chunk_size]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(f"SELECT name FROM criminals WHERE name IN ({placeholders})", chunk)
+                    existing.update(row['name'] for row in cursor.fetchall())
+        return existing
+
+    def insert_criminals_bulk(self, rows, chunk_size=1000, progress_callback=None):
+        """
+        Inserts criminals with executemany, one transaction per chunk of rows.
+        Each row is (name, father_name, gender, dob, crimes_done, [embedding_bytes, ...]);
+        every embedding becomes a criminal_embeddings row of that criminal.
+        If a chunk fails it is rolled back and retried row by row so that one bad
+        record does not sink the rest.
+        Returns ({name: (criminal id, [embedding ids])}, [(name, error message)]).
+        """
+        criminal_sql = ("INSERT INTO criminals (name, father_name, gender, dob, crimes_done) "
+                        "VALUES (%s, %s, %s, %s, %s)")
+        embedding_sql = "INSERT INTO criminal_embeddings (criminal_id, embedding) VALUES (%s, %s)"
+        inserted = {}
+        errors = []
+
+        def insert_chunk(cursor, chunk):
+            cursor.executemany(criminal_sql, [row[:5] for row in chunk])
+            # Names are unique, so they map the new rows back to their ids
+            names = [row[0] for row in chunk]
+            placeholders = ", ".join(["%s"] * len(names))
+            cursor.execute(f"SELECT id, name FROM criminals WHERE name IN ({placeholders})", names)
+            ids_by_name = {row['name']: row['id'] for row in cursor.fetchall()}
+            cursor.executemany(embedding_sql, [
+                (ids_by_name[row[0]], embedding) for row in chunk for embedding in row[5]
+            ])
+            # The criminals are new, so every embedding they own was just inserted
+            cursor.execute(
+                f"SELECT id, criminal_id FROM criminal_embeddings WHERE criminal_id IN ({placeholders}) ORDER BY id",
+                list(ids_by_name.values())
+            )
+            embedding_ids = {}
+            for row in cursor.fetchall():
+                embedding_ids.setdefault(row['criminal_id'], []).append(row['id'])
+            return {name: (ids_by_name[name], embedding_ids.get(ids_by_name[name], [])) for name in names}
+
+        with self.timed("insert_criminals_bulk"), self.pool.connection() as connection:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                try:
+                    connection.begin()
+                    with connection.cursor() as cursor:
+                        chunk_ids = insert_chunk(cursor, chunk)
+                    connection.commit()
+                    inserted.update(chunk_ids)
+                except pymysql.Error:
+                    connection.rollback()
+                    for row in chunk:
+                        try:
+                            connection.begin()
+                            with connection.cursor() as cursor:
+                                row_ids = insert_chunk(cursor, [row])
+                            connection.commit()
+                            inserted.update(row_ids)
+                        except pymysql.Error as e:
+                            connection.rollback()
+                            errors.append((row[0], str(e)))
+                if progress_callback:
+                    progress_callback(min(start + chunk_size, len(rows)), len(rows))
+        return inserted, errors
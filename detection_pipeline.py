@@ -0,0 +1,443 @@
+import os
+import threading
+import queue
+import time
+from collections import deque
+import cv2
+from tracker import FaceTracker
+from detection_scheduler import DetectionScheduler
+from motion_gate import MotionGate
+
+
+def put_latest(q, item):
+    """
+    Puts an item on a bounded queue, discarding the oldest entry when full.
+    Returns True if an older item had to be dropped.
+    """
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
+
+
+class StageMeter:
+    """Tracks the throughput of one pipeline stage over a sliding time window."""
+    def __init__(self, window_seconds=2.0):
+        self.window_seconds = window_seconds
+        self._timestamps = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        now = time.perf_counter()
+        with self._lock:
+            self._timestamps.append(now)
+            self._trim(now)
+
+    def fps(self):
+        now = time.perf_counter()
+        with self._lock:
+            self._trim(now)
+            if len(self._timestamps) < 2:
+                return 0.0
+            elapsed = now - self._timestamps[0]
+            return len(self._timestamps) / elapsed if elapsed > 0 else 0.0
+
+    def _trim(self, now):
+        while self._timestamps and now - self._timestamps[0] > self.window_seconds:
+            self._timestamps.popleft()
+
+
+class CameraFeed:
+    """
+    Per-source state of the pipeline: the capture handle and its frame queue,
+    plus the detection scheduler, tracker and latest frame with its
+    annotations that belong to this camera only.
+    """
+    def __init__(self, index, source, queue_size, target_fps, detection_width, motion_gate=None):
+        self.index = index
+        self.source = source
+        self.cap = None
+        self.active = False
+        self.frame_queue = queue.Queue(maxsize=queue_size)
+        self.motion_gate = motion_gate
+        self.scheduler = DetectionScheduler(target_fps=target_fps, detection_width=detection_width,
+                                            motion_gate=motion_gate)
+        self.tracker = FaceTracker()
+        self.meter = StageMeter()
+
+        self.latest_frame = None
+        self.latest_annotations = []
+        self.latest_seq = 0
+        self.rendered_seq = 0
+
+    def reset(self):
+        self.scheduler.reset()
+        self.tracker.reset()
+        self.latest_frame = None
+        self.latest_annotations = []
+        self.latest_seq = 0
+        self.rendered_seq = 0
+
+
+def parse_sources(text):
+    """
+    Parses a comma-separated list of video sources. Integers are camera
+    device indices; anything else is treated as a video file path or URL.
+    """
+    sources = []
+    for item in text.split(","):
+        item = item.strip()
+        if item:
+            sources.append(int(item) if item.isdigit() else item)
+    return sources
+
+
+class DetectionPipeline:
+    """
+    Runs the live recognition pipeline off the Tk thread for one or more cameras.
+    Every source has its own capture thread and small bounded frame queue;
+    when a stage falls behind, the oldest queued frame is dropped so no feed lags.
+    A shared detection thread serves the cameras round-robin, one frame per
+    camera per pass, so a busy camera cannot starve the others. A shared
+    embedding thread gathers the faces of all cameras' pending frames into a
+    single batched forward pass.
+    The UI only has to poll get_latest_frames() and paint the results; boxes
+    and labels are published alongside each frame rather than drawn into it,
+    so the display can draw them after scaling the frame down.
+    Every visible face is scored by the face service's quality scorer; a
+    track is embedded with the best crop it has shown since its last
+    embedding, and never with one below FACE_QUALITY_MIN_SCORE.
+    Recognized faces are handed to an optional SightingsLog, which writes
+    them to the database in the background.
+    With motion_gate set, every feed gets a MotionGate (MOTION_* settings):
+    the detector skips frames in which nothing moved and only looks at the
+    moving regions of the others.
+    Stage latencies and frame/face counters are recorded in the face
+    service's metrics registry; with show_overlay set, overlay_lines() also
+    returns FPS and p95 latencies for the display to draw.
+    """
+    STAGES = ("capture", "detect", "embed", "render")
+
+    def __init__(self, face_service, sources=(0,), confidence_threshold=None, queue_size=2,
+                 target_fps=15.0, detection_width=640, show_overlay=False, sightings=None, motion_gate=False):
+        self.face_service = face_service
+        self.sightings = sightings
+        # Defaults to the face service's DETECTION_CONFIDENCE
+        self.confidence_threshold = confidence_threshold if confidence_threshold is not None else face_service.detection_confidence
+        self.target_fps = target_fps
+        self.show_overlay = show_overlay
+
+        # One detection thread serves every feed, so each feed's scheduler has
+        # to budget for all of them sharing the detector.
+        self.feeds = [
+            CameraFeed(index, source, queue_size, target_fps * len(sources), detection_width,
+                       MotionGate.from_env() if motion_gate else None)
+            for index, source in enumerate(sources)
+        ]
+        self.face_queue = queue.Queue(maxsize=queue_size * len(self.feeds))
+
+        self.meters = {stage: StageMeter() for stage in self.STAGES}
+        metrics = face_service.metrics
+        self.stage_seconds = {
+            stage: metrics.histogram("pipeline_stage_seconds", "Time one frame spends in each pipeline stage.", stage=stage)
+            for stage in self.STAGES
+        }
+        self.frames_captured = metrics.counter("pipeline_frames_captured_total", "Frames read from the cameras.")
+        self.frames_dropped = metrics.counter("pipeline_frames_dropped_total", "Frames discarded because a stage fell behind.")
+        self.frames_interpolated = metrics.counter(
+            "pipeline_frames_interpolated_total", "Frames whose boxes were extrapolated instead of detected.")
+        self.frames_motion_skipped = metrics.counter(
+            "pipeline_frames_motion_skipped_total", "Frames not detected because nothing moved in them.")
+        self.frames_motion_regions = metrics.counter(
+            "pipeline_frames_motion_regions_total", "Frames detected only inside their moving regions.")
+        self.faces_seen = metrics.counter("pipeline_faces_seen_total", "Tracked faces over all processed frames.")
+        self.faces_embedded = metrics.counter("pipeline_faces_embedded_total", "Faces sent through the embedding model.")
+        self.faces_low_quality = metrics.counter(
+            "pipeline_faces_low_quality_total", "Faces due for embedding that were skipped for low quality.")
+        self.matches = metrics.counter("pipeline_matches_total", "Embedded faces recognized as a registered criminal.")
+        self.error = None
+
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._latest_lock = threading.Lock()
+
+    def start(self):
+        """Opens every video source and starts the worker threads. Returns (success, error)."""
+        failed = []
+        for feed in self.feeds:
+            feed.cap = cv2.VideoCapture(feed.source)
+            if not feed.cap.isOpened():
+                failed.append(str(feed.source))
+        if failed:
+            self._release_all()
+            return False, f"Could not open video source(s): {', '.join(failed)}."
+
+        self.error = None
+        self._stop_event.clear()
+        self._threads = []
+        for feed in self.feeds:
+            feed.reset()
+            feed.active = True
+            self._threads.append(
+                threading.Thread(target=self._capture_loop, args=(feed,), name=f"capture-{feed.index}", daemon=True)
+            )
+        self._threads.append(threading.Thread(target=self._detect_loop, name="detect", daemon=True))
+        self._threads.append(threading.Thread(target=self._embed_loop, name="embed", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return True, None
+
+    def stop(self):
+        """Signals all workers to stop and releases the video sources."""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+        self._release_all()
+
+    def _release_all(self):
+        for feed in self.feeds:
+            feed.active = False
+            if feed.cap:
+                feed.cap.release()
+                feed.cap = None
+
+    def is_running(self):
+        return not self._stop_event.is_set()
+
+    def get_latest_frames(self):
+        """
+        Returns {feed index: (RGB frame, annotations)} for every feed that
+        produced a new frame since the previous call. Annotations are
+        (box, label, color) tuples in the frame's pixel coordinates.
+        """
+        frames = {}
+        with self._latest_lock:
+            for feed in self.feeds:
+                if feed.latest_seq != feed.rendered_seq:
+                    feed.rendered_seq = feed.latest_seq
+                    frames[feed.index] = (feed.latest_frame, feed.latest_annotations)
+        if frames:
+            self.meters["render"].tick()
+        return frames
+
+    def get_latest_frame(self):
+        """Returns the newest (frame, annotations) of the first feed, or None if nothing new."""
+        return self.get_latest_frames().get(0)
+
+    def set_target_fps(self, target_fps):
+        """Changes the frame rate the detection schedulers aim to sustain per camera."""
+        self.target_fps = target_fps
+        for feed in self.feeds:
+            feed.scheduler.set_target_fps(target_fps * len(self.feeds))
+
+    def get_stage_fps(self):
+        """Returns the measured frames per second of every stage, summed over all feeds."""
+        return {stage: meter.fps() for stage, meter in self.meters.items()}
+
+    def get_feed_fps(self):
+        """Returns the capture frames per second of every feed."""
+        return {feed.index: feed.meter.fps() for feed in self.feeds}
+
+    def get_motion_stats(self):
+        """Motion gate statistics summed over all feeds, or None when the gate is off."""
+        gates = [feed.motion_gate for feed in self.feeds if feed.motion_gate]
+        if not gates:
+            return None
+        checked = sum(gate.checked for gate in gates)
+        total = max(1, checked)
+        return {
+            "checked": checked,
+            "skipped_fraction": round(sum(gate.skipped for gate in gates) / total, 4),
+            "partial_fraction": round(sum(gate.partial for gate in gates) / total, 4),
+            "full_fraction": round(sum(gate.full for gate in gates) / total, 4),
+            "mean_area_fraction": round(sum(gate.region_fraction_total for gate in gates) / total, 4),
+        }
+
+    def record_render(self, seconds):
+        """Called by the UI with the time it took to paint the latest frames."""
+        self.stage_seconds["render"].observe(seconds)
+
+    def _capture_loop(self, feed):
+        # Cameras and streams deliver frames in real time; a recorded file would
+        # be decoded as fast as possible, so it is played at its own frame rate
+        frame_interval = 0.0
+        if isinstance(feed.source, str) and os.path.isfile(feed.source):
+            fps = feed.cap.get(cv2.CAP_PROP_FPS)
+            frame_interval = 1.0 / fps if fps > 0 else 0.0
+        next_due = time.perf_counter()
+        while not self._stop_event.is_set():
+            if frame_interval:
+                delay = next_due - time.perf_counter()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+                # After a stall, carry on from now rather than rushing to catch up
+                next_due = max(next_due, time.perf_counter() - frame_interval) + frame_interval
+            start = time.perf_counter()
+            ret, frame = feed.cap.read()
+            if not ret:
+                feed.active = False
+                # The pipeline only ends once every feed has ended
+                if not any(f.active for f in self.feeds):
+                    self.error = "Camera feed ended."
+                    self._stop_event.set()
+                break
+            self.stage_seconds["capture"].observe(time.perf_counter() - start)
+            self.frames_captured.inc()
+            feed.meter.tick()
+            self.meters["capture"].tick()
+            if put_latest(feed.frame_queue, frame):
+                self.frames_dropped.inc()
+
+    def _detect_loop(self):
+        while not self._stop_event.is_set():
+            did_work = False
+            # Round-robin: at most one frame per camera per pass
+            for feed in self.feeds:
+                try:
+                    frame = feed.frame_queue.get_nowait()
+                except queue.Empty:
+                    continue
+                did_work = True
+
+                start = time.perf_counter()
+                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                faces, detected = feed.scheduler.process(self.face_service.detector, frame_rgb)
+                faces = [face for face in faces if face['confidence'] >= self.confidence_threshold]
+                # Only real detections go into the histogram; extrapolated frames are counted
+                if detected:
+                    self.stage_seconds["detect"].observe(time.perf_counter() - start)
+                    if feed.scheduler.last_mode == "regions":
+                        self.frames_motion_regions.inc()
+                elif feed.scheduler.last_mode == "skipped":
+                    self.frames_motion_skipped.inc()
+                else:
+                    self.frames_interpolated.inc()
+                self.meters["detect"].tick()
+                if put_latest(self.face_queue, (feed, frame_rgb, faces)):
+                    self.frames_dropped.inc()
+
+            if not did_work:
+                time.sleep(0.005)
+
+    def _embed_loop(self):
+        # A second frame of a feed already in the batch waits for the next one,
+        # so no track is updated, embedded or recorded twice in one pass
+        held = None
+        while not self._stop_event.is_set():
+            if held is None:
+                try:
+                    held = self.face_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            items, held = [held], None
+            # Take whatever else is already waiting, up to one frame per feed
+            while len(items) < len(self.feeds):
+                try:
+                    item = self.face_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if any(item[0] is feed for feed, _, _ in items):
+                    held = item
+                    break
+                items.append(item)
+
+            start = time.perf_counter()
+            frame_tracks = []
+            seen, seen_crops, seen_keypoints = [], [], []
+            for feed, frame_rgb, faces in items:
+                tracks = feed.tracker.update([face['box'] for face in faces])
+                frame_tracks.append(tracks)
+                self.faces_seen.inc(len(tracks))
+
+                for face, track in zip(faces, tracks):
+                    x, y, w, h = face['box']
+                    x, y = max(0, x), max(0, y)
+                    face_img = frame_rgb[y:y+h, x:x+w]
+                    if face_img.size == 0:
+                        continue
+                    seen.append((feed, track))
+                    seen_crops.append(face_img)
+                    # Shift the landmarks into the crop's coordinate system for alignment
+                    seen_keypoints.append({name: (px - x, py - y) for name, (px, py) in face.get('keypoints', {}).items()})
+
+            # Score every visible face in one pass; each track keeps its best crop
+            scorer = self.face_service.quality_scorer
+            qualities, _ = scorer.score_batch(seen_crops, seen_keypoints)
+            for (feed, track), crop, face_keypoints, quality in zip(seen, seen_crops, seen_keypoints, qualities):
+                feed.tracker.offer_crop(track, crop, face_keypoints, quality)
+
+            # Only new tracks, tracks due for re-identification and tracks with a
+            # clearly better crop get embedded, and only with a good enough crop
+            pending, crops, keypoints = [], [], []
+            for feed, track in seen:
+                if not feed.tracker.needs_embedding(track):
+                    continue
+                if not scorer.passes(track.best_quality):
+                    self.faces_low_quality.inc()
+                    continue
+                pending.append((feed, track))
+                crops.append(track.best_crop)
+                keypoints.append(track.best_keypoints)
+
+            # Embed the pending faces of every camera in one batched forward pass
+            if crops:
+                embeddings, _ = self.face_service.get_embeddings_batch(crops, keypoints)
+                if embeddings is not None:
+                    self.faces_embedded.inc(len(embeddings))
+                    matches = self.face_service.identify_faces(embeddings)
+                    self.matches.inc(sum(1 for criminal_id, _, _ in matches if criminal_id is not None))
+                    for (feed, track), crop, (criminal_id, name, distance) in zip(pending, crops, matches):
+                        feed.tracker.assign_identity(track, name, distance, track.best_quality)
+                        if criminal_id is not None and self.sightings is not None:
+                            self.sightings.record(criminal_id, feed.source, distance, crop)
+
+            frame_annotations = []
+            for tracks in frame_tracks:
+                annotations = []
+                for track in tracks:
+                    if track.last_embedded is None:
+                        if track.best_quality is not None and not scorer.passes(track.best_quality):
+                            x, y, w, h = track.int_box()
+                            annotations.append(((max(0, x), max(0, y), w, h), f"Low quality ({track.best_quality:.2f})",
+                                                (160, 160, 160)))
+                        continue
+                    x, y, w, h = track.int_box()
+                    x, y = max(0, x), max(0, y)
+                    color = (0, 255, 0) if track.name != "Unknown" else (255, 0, 0)
+                    annotations.append(((x, y, w, h), f"{track.name} ({track.score:.2f})", color))
+                frame_annotations.append(annotations)
+
+            # One observation per frame, so batches of several feeds are split evenly
+            batch_seconds = (time.perf_counter() - start) / len(items)
+            for (feed, frame_rgb, _), annotations in zip(items, frame_annotations):
+                self.stage_seconds["embed"].observe(batch_seconds)
+                self.meters["embed"].tick()
+                self._publish(feed, frame_rgb, annotations)
+
+    def overlay_lines(self):
+        """Per-stage FPS and p95 latency lines for the stats overlay, or None when it is off."""
+        if not self.show_overlay:
+            return None
+        lines = []
+        for stage in self.STAGES:
+            p95 = self.stage_seconds[stage].percentiles((95,))[95]
+            lines.append(f"{stage}: {self.meters[stage].fps():5.1f} fps  p95 {p95:6.1f} ms")
+        motion = self.get_motion_stats()
+        if motion:
+            lines.append(f"motion: skipped {motion['skipped_fraction']:.0%}  regions {motion['partial_fraction']:.0%}  "
+                         f"area {motion['mean_area_fraction']:.0%}")
+        return lines
+
+    def _publish(self, feed, frame_rgb, annotations):
+        with self._latest_lock:
+            feed.latest_frame = frame_rgb
+            feed.latest_annotations = annotations
+            feed.latest_seq += 1
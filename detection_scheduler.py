@@ -0,0 +1,180 @@
+import math
+import time
+import cv2
+from tracker import FaceTracker
+
+
+class DetectionScheduler:
+    """
+    Decides which frames run the face detector and at what resolution.
+    Detection runs on a downscaled copy of the frame, and the boxes are mapped
+    back to full-resolution coordinates for cropping. Only every N-th frame is
+    detected, with N chosen from the measured detection latency so the stage
+    keeps up with target_fps; the frames in between get boxes extrapolated
+    from the motion of the last detections.
+    With a motion gate, a frame due for detection is first checked for motion:
+    without any, the previous boxes are kept and the detector does not run;
+    with some, only the moving regions are detected and boxes elsewhere are kept.
+    last_mode tells the caller what happened to the latest frame
+    ("full", "regions", "skipped" or "interpolated").
+    """
+    def __init__(self, target_fps=15.0, detection_width=640, min_interval=1, max_interval=10, latency_smoothing=0.8,
+                 motion_gate=None):
+        self.target_fps = target_fps
+        self.detection_width = detection_width
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.latency_smoothing = latency_smoothing
+        self.motion_gate = motion_gate
+        self.last_mode = None
+
+        self.interval = min_interval
+        self.detection_latency = None
+        self.frames_since_detection = 0
+
+        # Only used for its motion model; identities are tracked downstream
+        self._motion = FaceTracker(iou_threshold=0.2, max_missed=max_interval)
+        self._faces = []
+        self._face_tracks = []
+
+    def set_target_fps(self, target_fps):
+        self.target_fps = max(1.0, float(target_fps))
+        self._update_interval()
+
+    def process(self, detector, frame_rgb):
+        """
+        Returns (faces, detected) for a frame, where faces use the detector's dict
+        format in full-resolution coordinates and detected tells whether the
+        detector actually ran or the boxes were extrapolated.
+        """
+        if self.frames_since_detection + 1 >= self.interval:
+            regions = self.motion_gate.regions(frame_rgb) if self.motion_gate else None
+            if regions is None:
+                self.last_mode = "full"
+                return self._detect(detector, frame_rgb), True
+            if not regions:
+                self.last_mode = "skipped"
+                return self._hold(), False
+            self.last_mode = "regions"
+            return self._detect_regions(detector, frame_rgb, regions), True
+        self.last_mode = "interpolated"
+        return self._interpolate(), False
+
+    def reset(self):
+        self.interval = self.min_interval
+        self.detection_latency = None
+        self.frames_since_detection = 0
+        self.last_mode = None
+        if self.motion_gate:
+            self.motion_gate.reset()
+        self._motion.reset()
+        self._faces = []
+        self._face_tracks = []
+
+    def _detect(self, detector, frame_rgb):
+        scale = self._detection_scale(frame_rgb)
+        faces, latency = self._run_detector(detector, frame_rgb, scale)
+        self._record_latency(latency)
+        return self._set_faces(faces)
+
+    def _detect_regions(self, detector, frame_rgb, regions):
+        """
+        Detects only inside the moving regions. Boxes from the last detection
+        that lie entirely outside them cannot have changed and are kept.
+        """
+        scale = self._detection_scale(frame_rgb)
+        faces = [face for face in self._faces if not any(self._overlaps(face['box'], region) for region in regions)]
+        total_latency = 0.0
+        for x, y, w, h in regions:
+            region_faces, latency = self._run_detector(detector, frame_rgb[y:y+h, x:x+w], scale)
+            total_latency += latency
+            faces.extend(self._offset(face, x, y) for face in region_faces)
+        self._record_latency(total_latency)
+        return self._set_faces(faces)
+
+    def _hold(self):
+        """Returns the last detected boxes unchanged for a frame in which nothing moved."""
+        self.frames_since_detection += 1
+        return [dict(face) for face in self._faces]
+
+    def _detection_scale(self, frame_rgb):
+        # Regions are scaled like the full frame so faces look the same size to the detector
+        width = frame_rgb.shape[1]
+        return min(1.0, self.detection_width / width) if self.detection_width else 1.0
+
+    def _run_detector(self, detector, image, scale):
+        """Runs the detector on a downscaled copy of image. Returns (faces in image coordinates, seconds)."""
+        height, width = image.shape[:2]
+        if scale < 1.0:
+            small = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        else:
+            small = image
+
+        start = time.perf_counter()
+        faces = detector.detect_faces(small)
+        latency = time.perf_counter() - start
+        if scale < 1.0:
+            faces = [self._rescale(face, 1.0 / scale) for face in faces]
+        return faces, latency
+
+    def _record_latency(self, latency):
+        if self.detection_latency is None:
+            self.detection_latency = latency
+        else:
+            self.detection_latency = self.latency_smoothing * self.detection_latency + (1 - self.latency_smoothing) * latency
+        self._update_interval()
+
+    def _set_faces(self, faces):
+        self._faces = faces
+        # Frames extrapolated or held since the last detection, plus this one
+        elapsed = self.frames_since_detection + 1
+        self._face_tracks = self._motion.update([face['box'] for face in faces], frames=elapsed)
+        self.frames_since_detection = 0
+        return faces
+
+    def _interpolate(self):
+        """Moves the last detected boxes (and their keypoints) along their estimated velocity."""
+        self.frames_since_detection += 1
+        frame_index = self._motion.frame_index + self.frames_since_detection
+        faces = []
+        for face, track in zip(self._faces, self._face_tracks):
+            predicted = track.predict(frame_index)
+            dx, dy = predicted[0] - track.box[0], predicted[1] - track.box[1]
+            faces.append({
+                'box': [int(round(v)) for v in predicted],
+                'confidence': face['confidence'],
+                'keypoints': {name: (int(px + dx), int(py + dy)) for name, (px, py) in face.get('keypoints', {}).items()},
+                'interpolated': True,
+            })
+        return faces
+
+    def _update_interval(self):
+        """Picks the smallest N with latency / N within the per-frame budget."""
+        if self.detection_latency is None:
+            return
+        interval = math.ceil(self.detection_latency * self.target_fps)
+        self.interval = max(self.min_interval, min(self.max_interval, interval))
+
+    @staticmethod
+    def _overlaps(box, region):
+        x, y, w, h = box
+        rx, ry, rw, rh = region
+        return x < rx + rw and rx < x + w and y < ry + rh and ry < y + h
+
+    def _offset(self, face, dx, dy):
+        x, y, w, h = face['box']
+        moved = dict(face)
+        moved['box'] = [x + dx, y + dy, w, h]
+        if 'keypoints' in face:
+            moved['keypoints'] = {name: (px + dx, py + dy) for name, (px, py) in face['keypoints'].items()}
+        return moved
+
+    def _rescale(self, face, factor):
+        x, y, w, h = face['box']
+        rescaled = dict(face)
+        rescaled['box'] = [int(round(x * factor)), int(round(y * factor)), int(round(w * factor)), int(round(h * factor))]
+        if 'keypoints' in face:
+            rescaled['keypoints'] = {
+                name: (int(round(px * factor)), int(round(py * factor))) for name, (px, py) in face['keypoints'].items()
+            }
+        return rescaled
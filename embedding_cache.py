@@ -0,0 +1,165 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of face embeddings. Keys hash the crop's pixels
+    together with the model name and everything else that changes the model
+    input (input size and the alignment landmarks), so an identical crop is
+    never run through the model twice.
+    A bounded in-memory LRU tier sits in front of an optional on-disk tier in
+    disk_dir, which is bounded by total size and evicts least recently used
+    files; it survives restarts and is shared by processes using the same directory.
+    """
+    def __init__(self, model_name, dimension, memory_entries=4096, disk_dir=None, disk_max_bytes=256 * 1024 * 1024):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        # One subdirectory per model so embeddings of different models never mix
+        self.disk_dir = os.path.join(disk_dir, model_name) if disk_dir else None
+
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def make_key(self, face_img, input_size, keypoints=None):
+        """Hashes a crop and the settings that affect its embedding."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{self.model_name}|{input_size}|{face_img.shape}|{face_img.dtype}|".encode())
+        if keypoints and 'left_eye' in keypoints and 'right_eye' in keypoints:
+            digest.update(f"{keypoints['left_eye']}|{keypoints['right_eye']}|".encode())
+        digest.update(np.ascontiguousarray(face_img).data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached embedding for a key, or None."""
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return embedding
+            on_disk = key in self._disk
+
+        if on_disk:
+            embedding = self._read_disk(key)
+            if embedding is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                self._put_memory(key, embedding)
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, embedding):
+        embedding = np.array(embedding, dtype=np.float32)
+        self._put_memory(key, embedding)
+        if self.disk_dir:
+            self._write_disk(key, embedding)
+
+    def _put_memory(self, key, embedding):
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".f32")
+
+    def _scan_disk(self):
+        """Rebuilds the disk tier's LRU order from file modification times."""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".f32"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # keeps the LRU order across restarts
+        except OSError:
+            with self._lock:
+                self._forget_disk(key)
+            return None
+        if len(data) != self.dimension * 4:
+            return None
+        return np.frombuffer(data, dtype=np.float32).copy()
+
+    def _write_disk(self, key, embedding):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Processes (e.g. batch_scan workers) share the directory, and thread
+            # ids repeat across processes, so the writer's pid goes in the name too
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(embedding.tobytes())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write embedding cache entry: {e}")
+            return
+
+        stale = []
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = embedding.nbytes
+            self._disk_bytes += embedding.nbytes
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, _ = next(iter(self._disk.items()))
+                self._forget_disk(old_key)
+                stale.append(old_key)
+                self.evictions += 1
+        for old_key in stale:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
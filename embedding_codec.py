@@ -0,0 +1,63 @@
+import struct
+import numpy as np
+
+# Stored embeddings start with this header: magic, format version, storage
+# type and dimension. int8 blobs follow it with the float32 scale factor.
+MAGIC = b"FE"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<2sBBH")
+SCALE = struct.Struct("<f")
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+_TYPE_CODES = {"float32": 0, "float16": 1, "int8": 2}
+_CODE_TYPES = {code: name for name, code in _TYPE_CODES.items()}
+_ITEM_SIZES = {"float32": 4, "float16": 2, "int8": 1}
+
+
+def encode_embedding(embedding, storage="float32"):
+    """
+    Serializes an embedding for the database as float32 (2 KB for ArcFace),
+    float16 (half) or int8 (a quarter, with one scale factor per vector).
+    """
+    if storage not in _TYPE_CODES:
+        raise ValueError(f"Unknown embedding storage '{storage}'. Choose one of: {', '.join(STORAGE_TYPES)}")
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, _TYPE_CODES[storage], len(embedding))
+    if storage == "float32":
+        return header + embedding.tobytes()
+    if storage == "float16":
+        return header + embedding.astype(np.float16).tobytes()
+
+    # Symmetric quantization: the largest component maps to +/-127
+    scale = float(np.abs(embedding).max()) / 127.0 or 1.0
+    codes = np.clip(np.rint(embedding / scale), -127, 127).astype(np.int8)
+    return header + SCALE.pack(scale) + codes.tobytes()
+
+
+def decode_embedding(blob):
+    """
+    Converts a stored blob back to a float32 vector. Blobs without a header
+    are the raw float32 bytes written by older versions.
+    Returns None if the blob is empty or malformed.
+    """
+    if not blob:
+        return None
+    blob = bytes(blob)
+    if len(blob) >= HEADER.size and blob[:2] == MAGIC:
+        _, version, code, dimension = HEADER.unpack_from(blob)
+        storage = _CODE_TYPES.get(code)
+        if version == FORMAT_VERSION and storage is not None:
+            offset = HEADER.size + (SCALE.size if storage == "int8" else 0)
+            if len(blob) == offset + dimension * _ITEM_SIZES[storage]:
+                if storage == "float32":
+                    return np.frombuffer(blob, dtype=np.float32, offset=offset).copy()
+                if storage == "float16":
+                    return np.frombuffer(blob, dtype=np.float16, offset=offset).astype(np.float32)
+                scale = SCALE.unpack_from(blob, HEADER.size)[0]
+                return np.frombuffer(blob, dtype=np.int8, offset=offset).astype(np.float32) * scale
+
+    # A raw float32 blob can happen to start with the magic bytes, so fall
+    # back to it whenever the header does not describe the blob exactly.
+    if len(blob) % 4:
+        return None
+    return np.frombuffer(blob, dtype=np.float32).copy()
@@ -0,0 +1,91 @@
+import os
+import cv2
+import numpy as np
+
+ENGINE_NAMES = ("tensorflow", "onnx")
+
+
+def preprocess_face(face_img, input_size):
+    """
+    Resizes a crop to the model input size (height, width) keeping its aspect
+    ratio, pads the remainder with black and scales pixels to [0, 1] like DeepFace does.
+    """
+    target_h, target_w = input_size
+    factor = min(target_h / face_img.shape[0], target_w / face_img.shape[1])
+    resized = cv2.resize(face_img, (max(1, int(face_img.shape[1] * factor)), max(1, int(face_img.shape[0] * factor))))
+
+    diff_h = target_h - resized.shape[0]
+    diff_w = target_w - resized.shape[1]
+    padded = np.pad(
+        resized,
+        ((diff_h // 2, diff_h - diff_h // 2), (diff_w // 2, diff_w - diff_w // 2), (0, 0)),
+        "constant"
+    )
+    return padded.astype(np.float32) / 255.0
+
+
+class TensorFlowEngine:
+    """ArcFace as built by DeepFace, run directly through its Keras model."""
+    name = "tensorflow"
+
+    def __init__(self, model_name="ArcFace"):
+        from deepface import DeepFace
+        # Newer DeepFace versions wrap the Keras model in a client object
+        model = DeepFace.build_model(model_name)
+        self.keras_model = getattr(model, "model", model)
+        self.input_size = tuple(self.keras_model.input_shape[1:3])
+        self.model_id = model_name
+
+    def embed(self, batch):
+        """Returns the raw (N, 512) embeddings of a preprocessed (N, H, W, 3) float32 batch."""
+        return np.asarray(self.keras_model(batch, training=False), dtype=np.float32)
+
+
+class ONNXEngine:
+    """
+    ArcFace exported to ONNX (see onnx_export.py) on ONNX Runtime's CPU
+    provider. Does not import TensorFlow, starts faster and is usually faster
+    per batch on CPU; the int8-quantized export is smaller and faster still.
+    ONNX_THREADS sets the intra-op threads (0 lets the runtime decide).
+    """
+    name = "onnx"
+
+    def __init__(self, model_path=None, threads=None, model_name="ArcFace"):
+        import onnxruntime as ort
+        model_path = model_path or os.getenv("ONNX_MODEL_PATH", "models/arcface.onnx")
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"ONNX model not found at '{model_path}'. Run onnx_export.py or set ONNX_MODEL_PATH.")
+        if threads is None:
+            threads = int(os.getenv("ONNX_THREADS") or 0)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        # Batches are small and run one at a time, so one inter-op thread is enough
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        height, width = model_input.shape[1:3]
+        # Dynamic spatial dimensions come back as names; ArcFace expects 112x112
+        self.input_size = (height, width) if isinstance(height, int) and isinstance(width, int) else (112, 112)
+        # Embeddings of different exports (e.g. quantized) are cached separately
+        self.model_id = f"{model_name}-{os.path.splitext(os.path.basename(model_path))[0]}"
+
+    def embed(self, batch):
+        """Returns the raw (N, 512) embeddings of a preprocessed (N, H, W, 3) float32 batch."""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return np.asarray(self.session.run([self.output_name], {self.input_name: batch})[0], dtype=np.float32)
+
+
+def create_embedding_engine(name=None, model_name="ArcFace"):
+    """Builds the embedding engine named by name, or by EMBEDDING_ENGINE in .env (default tensorflow)."""
+    name = (name or os.getenv("EMBEDDING_ENGINE", "tensorflow")).lower()
+    if name == "tensorflow":
+        return TensorFlowEngine(model_name)
+    if name == "onnx":
+        return ONNXEngine(model_name=model_name)
+    raise ValueError(f"Unknown embedding engine '{name}'. Choose one of: {', '.join(ENGINE_NAMES)}")
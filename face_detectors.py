@@ -0,0 +1,152 @@
+import os
+import cv2
+import numpy as np
+
+DETECTOR_NAMES = ("mtcnn", "yunet", "opencv_dnn", "haar")
+
+
+def make_detection(box, confidence, keypoints=None, frame_shape=None):
+    """
+    Builds the detection dict every detector returns, in the format MTCNN uses:
+    {'box': [x, y, w, h], 'confidence': float, 'keypoints': {name: (x, y)}}.
+    Boxes are integer pixel coordinates clipped to the frame when its shape is given.
+    """
+    x, y, w, h = (int(round(v)) for v in box)
+    if frame_shape is not None:
+        frame_h, frame_w = frame_shape[:2]
+        x2, y2 = min(frame_w, x + w), min(frame_h, y + h)
+        x, y = max(0, x), max(0, y)
+        w, h = max(0, x2 - x), max(0, y2 - y)
+    return {
+        'box': [x, y, w, h],
+        'confidence': float(confidence),
+        'keypoints': {name: (int(round(px)), int(round(py))) for name, (px, py) in (keypoints or {}).items()},
+    }
+
+
+class MTCNNDetector:
+    """The original MTCNN detector; slowest on CPU but returns five facial landmarks."""
+    name = "mtcnn"
+
+    def __init__(self):
+        from mtcnn import MTCNN
+        self.model = MTCNN()
+
+    def detect_faces(self, image_rgb):
+        return [
+            make_detection(face['box'], face['confidence'], face.get('keypoints'), image_rgb.shape)
+            for face in self.model.detect_faces(image_rgb)
+        ]
+
+
+class YuNetDetector:
+    """
+    OpenCV's YuNet CNN detector (cv2.FaceDetectorYN). Fast on CPU and also
+    returns five landmarks. Needs the face_detection_yunet ONNX model file.
+    """
+    name = "yunet"
+
+    def __init__(self, model_path=None, score_threshold=0.6, nms_threshold=0.3, top_k=5000):
+        model_path = model_path or os.getenv("YUNET_MODEL_PATH", "models/face_detection_yunet_2023mar.onnx")
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"YuNet model not found at '{model_path}'. Set YUNET_MODEL_PATH.")
+        self.model = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, nms_threshold, top_k)
+        self._input_size = (320, 320)
+
+    def detect_faces(self, image_rgb):
+        height, width = image_rgb.shape[:2]
+        if self._input_size != (width, height):
+            self.model.setInputSize((width, height))
+            self._input_size = (width, height)
+
+        _, faces = self.model.detect(cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
+        if faces is None:
+            return []
+
+        detections = []
+        for face in faces:
+            # YuNet lists the subject's right eye first, which is the eye on the
+            # image's left; name landmarks by image side like MTCNN does.
+            keypoints = {
+                'left_eye': (face[4], face[5]),
+                'right_eye': (face[6], face[7]),
+                'nose': (face[8], face[9]),
+                'mouth_left': (face[10], face[11]),
+                'mouth_right': (face[12], face[13]),
+            }
+            detections.append(make_detection(face[0:4], face[14], keypoints, image_rgb.shape))
+        return detections
+
+
+class OpenCVDNNDetector:
+    """
+    OpenCV's ResNet-10 SSD face detector (Caffe model). Fast and fairly robust,
+    but returns no landmarks, so crops are not eye-aligned.
+    """
+    name = "opencv_dnn"
+
+    def __init__(self, prototxt_path=None, model_path=None, input_size=(300, 300)):
+        prototxt_path = prototxt_path or os.getenv("OPENCV_DNN_PROTOTXT", "models/deploy.prototxt")
+        model_path = model_path or os.getenv("OPENCV_DNN_MODEL", "models/res10_300x300_ssd_iter_140000.caffemodel")
+        for path in (prototxt_path, model_path):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"OpenCV DNN face model file not found at '{path}'.")
+        self.model = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+        self.input_size = input_size
+
+    def detect_faces(self, image_rgb):
+        height, width = image_rgb.shape[:2]
+        # The model was trained on BGR input with these channel means
+        image_bgr = cv2.cvtColor(cv2.resize(image_rgb, self.input_size), cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(image_bgr, 1.0, self.input_size, (104.0, 177.0, 123.0))
+        self.model.setInput(blob)
+        output = self.model.forward()[0, 0]
+
+        detections = []
+        for confidence, x1, y1, x2, y2 in output[:, 2:7]:
+            if confidence <= 0:
+                continue
+            box = (x1 * width, y1 * height, (x2 - x1) * width, (y2 - y1) * height)
+            detections.append(make_detection(box, confidence, None, image_rgb.shape))
+        return detections
+
+
+class HaarCascadeDetector:
+    """
+    OpenCV's Haar cascade frontal face detector. The cheapest option, but it
+    misses angled faces, gives no landmarks and has no calibrated score, so
+    every detection is reported with confidence 1.0; min_neighbors controls strictness.
+    """
+    name = "haar"
+
+    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=5, min_size=(40, 40)):
+        if not hasattr(cv2, "CascadeClassifier"):
+            raise RuntimeError("This OpenCV build has no Haar cascade support (removed in OpenCV 5).")
+        cascade_path = cascade_path or os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        self.model = cv2.CascadeClassifier(cascade_path)
+        if self.model.empty():
+            raise FileNotFoundError(f"Could not load Haar cascade from '{cascade_path}'.")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect_faces(self, image_rgb):
+        gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+        boxes = self.model.detectMultiScale(
+            gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors, minSize=self.min_size
+        )
+        return [make_detection(box, 1.0, None, image_rgb.shape) for box in np.asarray(boxes).reshape(-1, 4)]
+
+
+def create_detector(name=None):
+    """Builds the face detector named by name, or by FACE_DETECTOR in .env (default mtcnn)."""
+    name = (name or os.getenv("FACE_DETECTOR", "mtcnn")).lower()
+    if name == "mtcnn":
+        return MTCNNDetector()
+    if name == "yunet":
+        return YuNetDetector()
+    if name == "opencv_dnn":
+        return OpenCVDNNDetector()
+    if name == "haar":
+        return HaarCascadeDetector()
+    raise ValueError(f"Unknown face detector '{name}'. Choose one of: {', '.join(DETECTOR_NAMES)}")
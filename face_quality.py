@@ -0,0 +1,133 @@
+import os
+import cv2
+import numpy as np
+
+QUALITY_COMPONENTS = ("size", "sharpness", "brightness", "pose")
+
+
+class FaceQualityScorer:
+    """
+    Scores face crops before they are embedded, so faces that would never
+    match (tiny, blurred, badly lit or turned away) do not cost a forward pass.
+    Every component is mapped to 0..1 and the score is their geometric mean,
+    so one failing component is enough to reject a face:
+      size       - shorter crop side, from min_size (0) up to good_size (1);
+      sharpness  - variance of the Laplacian of a fixed-size grayscale copy;
+      brightness - mean gray level, falling off towards black and white;
+      pose       - yaw and pitch estimated from the five detector landmarks
+                   (1 when the detector returns none).
+    A whole batch is scored at once on a stack of small grayscale copies.
+    """
+    def __init__(self, min_score=0.4, min_size=24, good_size=80, sharpness_target=150.0,
+                 dark_level=40, bright_level=220, brightness_ramp=40.0, max_yaw=0.6, max_pitch=0.35, sample_size=64):
+        self.min_score = min_score
+        self.min_size = min_size
+        self.good_size = good_size
+        self.sharpness_target = sharpness_target
+        self.dark_level = dark_level
+        self.bright_level = bright_level
+        self.brightness_ramp = brightness_ramp
+        self.max_yaw = max_yaw
+        self.max_pitch = max_pitch
+        self.sample_size = sample_size
+
+    @classmethod
+    def from_env(cls):
+        """Builds a scorer configured by the FACE_QUALITY_* settings in .env."""
+        return cls(
+            min_score=float(os.getenv("FACE_QUALITY_MIN_SCORE") or 0.4),
+            min_size=int(os.getenv("FACE_QUALITY_MIN_SIZE") or 24),
+        )
+
+    def score(self, face_img, keypoints=None):
+        """Quality of a single crop. Returns (score, components)."""
+        scores, components = self.score_batch([face_img], [keypoints])
+        return float(scores[0]), {name: float(values[0]) for name, values in components.items()}
+
+    def score_batch(self, face_images, keypoints=None):
+        """
+        Scores a list of RGB crops; keypoints, if given, are MTCNN-style
+        landmarks relative to each crop. Returns (scores, components) where
+        scores is an (N,) array and components maps each name to an (N,) array.
+        """
+        count = len(face_images)
+        if count == 0:
+            empty = np.empty(0, dtype=np.float32)
+            return empty, {name: empty for name in QUALITY_COMPONENTS}
+
+        sizes = np.empty(count, dtype=np.float32)
+        gray = np.empty((count, self.sample_size, self.sample_size), dtype=np.float32)
+        for i, face_img in enumerate(face_images):
+            sizes[i] = min(face_img.shape[:2])
+            if face_img.size == 0:
+                gray[i] = 0
+                continue
+            small = cv2.resize(face_img, (self.sample_size, self.sample_size), interpolation=cv2.INTER_AREA)
+            gray[i] = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+        components = {
+            "size": np.clip((sizes - self.min_size) / max(1.0, self.good_size - self.min_size), 0.0, 1.0),
+            "sharpness": np.clip(self._laplacian_variance(gray) / self.sharpness_target, 0.0, 1.0),
+            "brightness": self._brightness(gray.mean(axis=(1, 2))),
+            "pose": self._pose(keypoints, count),
+        }
+        stacked = np.stack([components[name] for name in QUALITY_COMPONENTS])
+        scores = np.exp(np.log(np.maximum(stacked, 1e-6)).mean(axis=0))
+        scores[stacked.min(axis=0) <= 0.0] = 0.0
+        return scores.astype(np.float32), components
+
+    def passes(self, score):
+        return score >= self.min_score
+
+    @staticmethod
+    def weakest(components, index=0):
+        """Name of the component that pulled a face's score down the most."""
+        return min(QUALITY_COMPONENTS, key=lambda name: components[name][index])
+
+    @staticmethod
+    def _laplacian_variance(gray):
+        # 4-neighbour Laplacian over the whole stack at once
+        center = gray[:, 1:-1, 1:-1]
+        laplacian = gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:] - 4.0 * center
+        return laplacian.var(axis=(1, 2))
+
+    def _brightness(self, mean_levels):
+        rising = (mean_levels - self.dark_level) / self.brightness_ramp
+        falling = (self.bright_level - mean_levels) / self.brightness_ramp
+        return np.clip(np.minimum(rising, falling) + 1.0, 0.0, 1.0)
+
+    def _pose(self, keypoints, count):
+        """
+        Measures the nose against the eyes in the frame of the eye axis, so
+        in-plane rotation (which alignment removes) does not count. Sideways
+        nose offset stands in for yaw; its height between the eyes and the
+        mouth for pitch. Both are relative to the distance between the eyes.
+        """
+        pose = np.ones(count, dtype=np.float32)
+        if not keypoints:
+            return pose
+        names = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+        rows = [i for i, points in enumerate(keypoints) if points and all(name in points for name in names)]
+        if not rows:
+            return pose
+
+        points = np.array([[keypoints[i][name] for name in names] for i in rows], dtype=np.float32)
+        left_eye, right_eye, nose = points[:, 0], points[:, 1], points[:, 2]
+        mouth = (points[:, 3] + points[:, 4]) / 2.0
+        eye_center = (left_eye + right_eye) / 2.0
+        eye_axis = right_eye - left_eye
+        eye_distance = np.maximum(np.linalg.norm(eye_axis, axis=1), 1e-6)
+        across = eye_axis / eye_distance[:, None]
+        down = np.stack([-across[:, 1], across[:, 0]], axis=1)
+
+        nose_offset = nose - eye_center
+        yaw = np.abs(np.sum(nose_offset * across, axis=1)) / eye_distance
+        nose_depth = np.sum(nose_offset * down, axis=1)
+        mouth_depth = np.maximum(np.sum((mouth - eye_center) * down, axis=1), 1e-6)
+        # Looking straight ahead, the nose tip sits about halfway down to the mouth
+        pitch = np.abs(nose_depth / mouth_depth - 0.5)
+
+        yaw_score = np.clip(1.0 - yaw / self.max_yaw, 0.0, 1.0)
+        pitch_score = np.clip(1.0 - pitch / self.max_pitch, 0.0, 1.0)
+        pose[rows] = np.minimum(yaw_score, pitch_score)
+        return pose
@@ -1,58 +1,521 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import cv2
 import numpy as np
-from mtcnn import MTCNN
-from deepface import DeepFace
-import faiss
+from index_factory import (IndexConfig, create_index, supports_removal, reconstruct_vectors, copy_to_memory,
+                           index_type_of, min_training_size)
+from index_snapshot import IndexSnapshot, SnapshotMap
+from face_detectors import create_detector
+from metrics import MetricsRegistry
+from embedding_cache import EmbeddingCache
+from embedding_codec import STORAGE_TYPES, encode_embedding, decode_embedding
+from embedding_engines import create_embedding_engine, preprocess_face
+from face_quality import FaceQualityScorer
+from shard_search import ShardedIndex
 
 class FaceService:
     """
     Encapsulates all face detection, embedding, and recognition logic.
     """
-    def __init__(self, db_service):
+    AGGREGATIONS = ("max", "mean", "centroid")
+
+    def __init__(self, db_service, metrics=None, sharded=True, read_only=False):
         self.db_service = db_service
-        self.detector = MTCNN()
+        # Shared with the detection pipeline and the metrics exporter
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        # Seconds spent loading the detector, the model and the index
+        self.startup_timings = {}
+        self._detect_seconds = self.metrics.histogram(
+            "face_service_seconds", "Time spent in face detection, embedding and index search.", op="detect")
+        self._embed_seconds = self.metrics.histogram("face_service_seconds", op="embed")
+        self._search_seconds = self.metrics.histogram("face_service_seconds", op="search")
+        # Detector backend comes from FACE_DETECTOR in .env (mtcnn, yunet, opencv_dnn or haar)
+        start = time.perf_counter()
+        self.detector = create_detector()
+        self.startup_timings["detector"] = time.perf_counter() - start
         self.embedding_dimension = 512  # ArcFace model dimension
-        self.faiss_index = faiss.IndexFlatIP(self.embedding_dimension)
-        self.known_embeddings = []
-        self.known_labels = []
-        self.recognition_threshold = 0.65 
+        self.model_name = "ArcFace"
+
+        # Build ArcFace once so embedding calls skip DeepFace's model lookup.
+        # EMBEDDING_ENGINE picks TensorFlow (DeepFace's Keras model) or ONNX Runtime.
+        start = time.perf_counter()
+        self.embedding_engine = create_embedding_engine(model_name=self.model_name)
+        self.model_input_size = self.embedding_engine.input_size
+        self.startup_timings["model"] = time.perf_counter() - start
+        # Identical crops (re-registrations, rescanned evidence, static cameras)
+        # are answered from a cache instead of another forward pass.
+        cache_entries = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+        cache_dir = os.getenv("EMBEDDING_CACHE_DIR") or None
+        self.embedding_cache = None
+        if cache_entries > 0 or cache_dir:
+            self.embedding_cache = EmbeddingCache(
+                self.embedding_engine.model_id, self.embedding_dimension, cache_entries, cache_dir,
+                int(float(os.getenv("EMBEDDING_CACHE_DISK_MB", 256)) * 1024 * 1024)
+            )
+            cache = self.embedding_cache
+            for result in ("memory_hits", "disk_hits", "misses"):
+                self.metrics.gauge("embedding_cache_lookups", lambda result=result: cache.get_stats()[result],
+                                   "Embedding cache lookups by outcome.", result=result)
+        # Vectors are keyed on criminal_embeddings.id so single rows can be added or
+        # removed; a criminal can own many of them (different photos and angles).
+        # The backend (flat, scalar-quantized, IVF or HNSW) comes from the FAISS_*
+        # settings in .env. The index holds the only in-memory copy of the vectors.
+        self.index_config = IndexConfig.from_env()
+        self.faiss_index, self.index_type = create_index(self.index_config, self.embedding_dimension)
+        # Set while faiss_index reads its vectors from the mapped snapshot file
+        self.index_mapped = False
+        # With SEARCH_SHARDS set, the gallery is partitioned by criminal over
+        # shard processes instead, and faiss_index is the ShardedIndex in front of them.
+        # Shards serve a single coordinator (the application), so command-line
+        # tools and worker processes pass sharded=False and keep a local index.
+        self.search_shards = ShardedIndex.from_env(self.index_config, self.embedding_dimension) if sharded else None
+        if self.search_shards is not None:
+            self.faiss_index, self.index_type = self.search_shards, self.search_shards.describe()
+            for shard in self.search_shards.shards:
+                self._register_shard_gauge(shard.name)
+        # Both are dict-like SnapshotMaps over sorted arrays, so a snapshot
+        # can be installed without building an entry per embedding
+        self.embedding_owners = SnapshotMap()  # embedding id -> criminal id
+        self.known_labels = SnapshotMap()      # criminal id -> name
+        self._identity_embeddings = {}         # criminal id -> set of embedding ids (see identity_embeddings)
+        # Cut-offs tuned offline with benchmarks.threshold_benchmark: the cosine
+        # similarity a match needs, and the detector confidence a face needs to be
+        # used at all (registration, live detection and batch scans alike).
+        self.recognition_threshold = float(os.getenv("RECOGNITION_THRESHOLD") or 0.65)
+        self.detection_confidence = float(os.getenv("DETECTION_CONFIDENCE") or 0.95)
+        # Crops scoring below FACE_QUALITY_MIN_SCORE are not worth embedding
+        self.quality_scorer = FaceQualityScorer.from_env()
+        # Format new embeddings are written to the database in (float32, float16 or int8)
+        self.embedding_storage = os.getenv("EMBEDDING_STORAGE", "float32").lower()
+        if self.embedding_storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown EMBEDDING_STORAGE '{self.embedding_storage}'. Choose one of: {', '.join(STORAGE_TYPES)}")
+        # Searches pull the top-k embeddings and combine the scores of each
+        # criminal's hits with max, mean or centroid (SEARCH_AGGREGATION).
+        self.search_top_k = int(os.getenv("SEARCH_TOP_K", 10))
+        self.aggregation = os.getenv("SEARCH_AGGREGATION", "max").lower()
+        if self.aggregation not in self.AGGREGATIONS:
+            raise ValueError(f"Unknown SEARCH_AGGREGATION '{self.aggregation}'. Choose one of: {', '.join(self.AGGREGATIONS)}")
+        # High-water mark of updated_at already applied to the index
+        self.last_sync = None
+        # Database version stamp the index was last reconciled with
+        self.synced_version = None
+        # The index is searched from the detection pipeline's worker thread
+        # while the UI thread may reload it, so guard it with a lock.
+        self.index_lock = threading.RLock()
+
+        # Local copy of the built index so startup does not depend on gallery size
+        self.snapshot = IndexSnapshot(
+            os.getenv("INDEX_SNAPSHOT_DIR", "index_snapshot"),
+            verify_checksums=os.getenv("INDEX_SNAPSHOT_VERIFY", "0") == "1"
+        )
+        # Set when the index holds changes that the snapshot on disk does not
+        self.snapshot_dirty = False
+        # Worker processes share a snapshot kept up to date by their parent and never write it
+        self.read_only = read_only
+
+        start = time.perf_counter()
+        if not self.load_snapshot():
+            self.load_embeddings_from_db()
+            self.save_snapshot()
+        self.startup_timings["index"] = time.perf_counter() - start
+
+    def warm_up(self):
+        """
+        Runs the detector and the embedding model once on blank input, so the
+        first real frame does not pay for graph building and kernel selection.
+        """
+        self.detector.detect_faces(np.zeros((160, 160, 3), dtype=np.uint8))
+        self.embedding_engine.embed(np.zeros((1, *self.model_input_size, 3), dtype=np.float32))
+
+    def load_snapshot(self):
+        """
+        Installs the on-disk snapshot as the live index. If the database changed
+        since it was written, only the difference is pulled via sync_embeddings.
+        Returns False when there is no usable snapshot and a full rebuild is needed.
+        """
+        if self.search_shards is not None:
+            # Shards are refilled from the database; the snapshot holds a single index
+            return False
+        snapshot, error = self.snapshot.load(self.index_config.describe())
+        if error:
+            print(f"Index snapshot not used: {error}")
+            return False
+
+        try:
+            db_version = self.db_service.get_criminals_version()
+        except Exception as e:
+            print(f"Could not read database version: {e}")
+            db_version = None
+
+        with self.index_lock:
+            self.faiss_index = snapshot["index"]
+            self.index_mapped = snapshot["mapped"]
+            # The snapshot may hold the flat fallback of a backend that needs training
+            self.index_type = index_type_of(self.faiss_index)
+            self.embedding_owners = SnapshotMap(snapshot["ids"], snapshot["owners"])
+            self.known_labels = SnapshotMap(snapshot["criminal_ids"], snapshot["labels"])
+            self._identity_embeddings = None
+            self.last_sync = datetime.fromisoformat(snapshot["last_sync"]) if snapshot["last_sync"] else None
+            self.synced_version = snapshot["db_version"]
+        print(f"Loaded {self.faiss_index.ntotal} embeddings from the index snapshot.")
 
-        self.load_embeddings_from_db()
+        if db_version is not None and db_version != snapshot["db_version"]:
+            print("Index snapshot is behind the database, syncing changes.")
+            self.sync_embeddings()
+            self.snapshot_dirty = True
+        return True
+
+    def save_snapshot(self, force=False):
+        """Writes the current index and its id mappings to disk if they changed since the last save."""
+        if self.search_shards is not None or self.read_only:
+            return
+        if not force and self.snapshot.exists() and not self.snapshot_dirty:
+            return
+        try:
+            db_version = self.db_service.get_criminals_version()
+            with self.index_lock:
+                ids, owners = self.embedding_owners.arrays()
+                criminal_ids, labels = self.known_labels.arrays()
+                self.snapshot.save(
+                    self.faiss_index, ids, owners, criminal_ids, labels, db_version, self.last_sync,
+                    self.index_config.describe()
+                )
+                self.snapshot_dirty = False
+            print(f"Saved index snapshot with {len(ids)} embeddings.")
+        except Exception as e:
+            print(f"Error saving index snapshot: {e}")
 
     def load_embeddings_from_db(self):
-        """Loads all criminal embeddings from the database and populates the FAISS index."""
-        self.known_embeddings.clear()
-        self.known_labels.clear()
-        self.faiss_index.reset()
+        """Loads all criminal embeddings from the database and rebuilds the FAISS index."""
+        ids = []
+        vectors = []
+        owners = []
+        known_labels = {}
+        last_sync = None
         
         try:
-            connection = self.db_service.get_connection()
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT name, embedding FROM criminals WHERE embedding IS NOT NULL")
-                results = cursor.fetchall()
-                for row in results:
-                    if row['embedding']:
-                        embedding = np.frombuffer(row['embedding'], dtype=np.float32)
-                        norm = np.linalg.norm(embedding)
-                        if norm > 0:
-                            normalized_embedding = embedding / norm
-                            self.known_embeddings.append(normalized_embedding)
-                            self.known_labels.append(row['name'])
-            connection.close()
-            
-            if self.known_embeddings:
-                embeddings_np = np.array(self.known_embeddings, dtype=np.float32)
-                self.faiss_index.add(embeddings_np)
-                print(f"Loaded {self.faiss_index.ntotal} embeddings into FAISS.")
+            # Read before streaming, so changes made during the load show up in the next sync
+            version = self.db_service.get_criminals_version()
+            for rows in self.db_service.stream_embeddings():
+                for row in rows:
+                    embedding = self._decode_embedding(row['embedding'])
+                    if embedding is not None:
+                        ids.append(row['id'])
+                        vectors.append(embedding)
+                        owners.append(row['criminal_id'])
+                        known_labels[row['criminal_id']] = row['name']
+                    if last_sync is None or row['updated_at'] > last_sync:
+                        last_sync = row['updated_at']
         except Exception as e:
             print(f"Error loading embeddings: {e}")
+            return
+
+        # The vectors only live in the index from here on; the lists are dropped
+        faiss_index, index_type = self._build_index(ids, vectors, owners)
+        del vectors
+        # Swap the new data in under the lock so searches never see a half-built index
+        with self.index_lock:
+            self.embedding_owners = SnapshotMap.from_pairs(ids, owners)
+            self.known_labels = SnapshotMap.from_pairs(list(known_labels), list(known_labels.values()))
+            self._identity_embeddings = None
+            self.last_sync = last_sync
+            self.synced_version = version
+            self.faiss_index = faiss_index
+            self.index_type = index_type
+            self.index_mapped = False
+            self.snapshot_dirty = True
+            # Nothing reads the previously loaded snapshot's mapped files any more
+            self.snapshot.release()
+        print(f"Loaded {faiss_index.ntotal} embeddings of {len(known_labels)} criminals into FAISS ({index_type} index).")
+
+    @property
+    def identity_embeddings(self):
+        """
+        criminal id -> set of embedding ids. Built from embedding_owners on
+        first use rather than at startup, since only removals and centroid
+        searches need it.
+        """
+        with self.index_lock:
+            if self._identity_embeddings is None:
+                identity_embeddings = {}
+                for embedding_id, criminal_id in self.embedding_owners.items():
+                    identity_embeddings.setdefault(criminal_id, set()).add(embedding_id)
+                self._identity_embeddings = identity_embeddings
+            return self._identity_embeddings
+
+    def _build_index(self, ids, embeddings, owners):
+        """
+        Creates a new index for the configured backend, trained on and filled with the given embeddings.
+        A sharded index is refilled in place instead, each shard with the criminals it owns.
+        """
+        if self.search_shards is not None:
+            self.search_shards.build(ids, owners, embeddings)
+            return self.search_shards, self.search_shards.describe()
+        if len(ids) == 0:
+            return create_index(self.index_config, self.embedding_dimension)
+
+        ids = np.asarray(ids, dtype=np.int64)
+        embeddings_np = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(ids), self.embedding_dimension)
+        faiss_index, index_type = create_index(self.index_config, self.embedding_dimension, embeddings_np)
+        faiss_index.add_with_ids(embeddings_np, ids)
+        return faiss_index, index_type
+
+    def sync_embeddings(self):
+        """
+        Brings the index up to date with the database without a full reload.
+        Only embeddings (or criminals) whose updated_at is at or past the last
+        high-water mark are fetched. Whenever the database version stamp moved,
+        the stored ids are compared with the index to find deleted rows, since a
+        delete followed by an insert leaves the row count unchanged.
+        """
+        if self.last_sync is None:
+            self.load_embeddings_from_db()
+            return
+
+        try:
+            version = self.db_service.get_criminals_version()
+            if version == self.synced_version:
+                return
+            changed_rows = [row for rows in self.db_service.stream_embeddings(since=self.last_sync) for row in rows]
+
+            with self.index_lock:
+                for row in changed_rows:
+                    embedding = self._decode_embedding(row['embedding'])
+                    if embedding is None:
+                        self.remove_embedding(row['id'])
+                    else:
+                        self.update_embedding(row['id'], row['criminal_id'], row['name'], embedding)
+                    if row['updated_at'] > self.last_sync:
+                        self.last_sync = row['updated_at']
+
+                existing_ids = self.db_service.fetch_embedding_ids()
+                self.remove_embeddings(list(set(self.embedding_owners) - existing_ids))
+                self.synced_version = version
+        except Exception as e:
+            print(f"Error syncing embeddings: {e}")
+            return
+
+        if changed_rows:
+            print(f"Synced {len(changed_rows)} changed embeddings into FAISS.")
+
+    def add_embedding(self, embedding_id, criminal_id, name, embedding):
+        """Adds a single normalized embedding of a criminal to the index."""
+        self.add_embeddings([embedding_id], [criminal_id], [name], [embedding])
+
+    def add_embeddings(self, embedding_ids, criminal_ids, names, embeddings):
+        """Adds many normalized embeddings to the index in a single FAISS call."""
+        if len(embedding_ids) == 0:
+            return
+        with self.index_lock:
+            self.remove_embeddings([i for i in embedding_ids if i in self.embedding_owners])
+            vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(embedding_ids), self.embedding_dimension)
+            if self.search_shards is not None:
+                self.search_shards.add_with_owners(vectors, embedding_ids, criminal_ids)
+            elif (self.index_type != self.index_config.index_type
+                    and len(self.embedding_owners) + len(embedding_ids) >= min_training_size(self.index_config)):
+                # Started on the flat fallback; now there is enough data to train the real backend
+                all_ids = list(self.embedding_owners) + list(embedding_ids)
+                all_vectors = np.concatenate([reconstruct_vectors(self.faiss_index, list(self.embedding_owners)), vectors])
+                self.faiss_index, self.index_type = self._build_index(
+                    all_ids, all_vectors, list(self.embedding_owners.values()) + list(criminal_ids))
+                self.index_mapped = False
+            else:
+                self._unmap_index()
+                self.faiss_index.add_with_ids(vectors, np.asarray(embedding_ids, dtype=np.int64))
+            identity_embeddings = self.identity_embeddings
+            for embedding_id, criminal_id, name in zip(embedding_ids, criminal_ids, names):
+                self.embedding_owners[embedding_id] = criminal_id
+                self.known_labels[criminal_id] = name
+                identity_embeddings.setdefault(criminal_id, set()).add(embedding_id)
+            self.snapshot_dirty = True
+
+    def remove_embedding(self, embedding_id):
+        """Removes one embedding from the index if present; the criminal goes once it has none left."""
+        self.remove_embeddings([embedding_id])
+
+    def remove_embeddings(self, embedding_ids):
+        """Removes several embeddings from the index in a single FAISS call."""
+        with self.index_lock:
+            embedding_ids = [i for i in embedding_ids if i in self.embedding_owners]
+            if not embedding_ids:
+                return
+            # Built (if it was not yet) before the owners below change
+            identity_embeddings = self.identity_embeddings
+            for embedding_id in embedding_ids:
+                criminal_id = self.embedding_owners.pop(embedding_id)
+                remaining = identity_embeddings[criminal_id]
+                remaining.discard(embedding_id)
+                if not remaining:
+                    del identity_embeddings[criminal_id]
+                    del self.known_labels[criminal_id]
+            self.snapshot_dirty = True
+            if supports_removal(self.faiss_index):
+                self._unmap_index()
+                self.faiss_index.remove_ids(np.asarray(embedding_ids, dtype=np.int64))
+            else:
+                # HNSW cannot delete in place, so rebuild it from the vectors it still holds
+                remaining_ids = list(self.embedding_owners)
+                vectors = reconstruct_vectors(self.faiss_index, remaining_ids)
+                self.faiss_index, self.index_type = self._build_index(
+                    remaining_ids, vectors, [self.embedding_owners[i] for i in remaining_ids])
+                self.index_mapped = False
+
+    def _unmap_index(self):
+        """A mapped snapshot index is read-only; it is copied into memory before its first change."""
+        if self.index_mapped:
+            self.faiss_index = copy_to_memory(self.faiss_index)
+            self.index_mapped = False
+
+    def remove_criminal(self, criminal_id):
+        """Removes every embedding of a criminal from the index."""
+        with self.index_lock:
+            self.remove_embeddings(list(self.identity_embeddings.get(criminal_id, ())))
+
+    def add_search_shard(self, address=None):
+        """
+        Adds a search shard (a local worker, or the shard server at host:port)
+        and rebalances the gallery onto it. Returns the number of embeddings moved.
+        """
+        if self.search_shards is None:
+            raise ValueError("Search shards are not enabled; set SEARCH_SHARDS.")
+        with self.index_lock:
+            moved = self.search_shards.add_shard(address)
+            self.index_type = self.search_shards.describe()
+        self._register_shard_gauge(self.search_shards.shards[-1].name)
+        print(f"Added search shard {self.search_shards.shards[-1].name}, moved {moved} embeddings to it.")
+        return moved
+
+    def _register_shard_gauge(self, name):
+        shards = self.search_shards
+        self.metrics.gauge("index_shard_embeddings", lambda: shards.shard_sizes().get(name, 0),
+                           "Embeddings held by each search shard.", shard=name)
+
+    def close(self):
+        """Stops the search shard workers, if any."""
+        if self.search_shards is not None:
+            self.search_shards.close()
+
+    def update_embedding(self, embedding_id, criminal_id, name, embedding):
+        """Replaces an embedding (and its criminal's label) in the index."""
+        with self.index_lock:
+            self.remove_embedding(embedding_id)
+            self.add_embedding(embedding_id, criminal_id, name, embedding)
 
-    def extract_face(self, image_np, confidence_threshold=0.90):
+    def encode_embedding(self, embedding):
+        """Serializes an embedding for the database in the EMBEDDING_STORAGE format."""
+        return encode_embedding(embedding, self.embedding_storage)
+
+    def _decode_embedding(self, blob):
+        """Converts a stored embedding blob into a normalized vector, or None if unusable."""
+        embedding = decode_embedding(blob)
+        if embedding is None or len(embedding) != self.embedding_dimension:
+            return None
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            return None
+        return embedding / norm
+
+    def import_criminals(self, records, batch_size=32, workers=4, chunk_size=1000, progress_callback=None):
+        """
+        Registers many criminals at once. Each record is a dict with 'name' and
+        'image_path' and optionally 'father_name', 'gender', 'dob' and 'crimes_done'.
+        Records repeating a name add further photos of the same criminal; the
+        details are taken from the name's first record.
+        Images are read and faces detected on a thread pool while the previous
+        batch is embedded in one forward pass; rows are written with chunked
+        executemany and the index is updated once at the end.
+        progress_callback(stage, done, total) is called as work advances.
+        Returns (number of criminals imported, [(name, error message)]).
+        """
+        errors = []
+        valid_records = []
+        for record in records:
+            name = (record.get('name') or '').strip()
+            if not name:
+                errors.append(("", f"Missing name for image {record.get('image_path')}."))
+            else:
+                valid_records.append(dict(record, name=name))
+
+        existing_names = self.db_service.find_existing_criminal_names({r['name'] for r in valid_records})
+        for name in sorted(existing_names):
+            errors.append((name, "A criminal with this name is already registered."))
+        valid_records = [r for r in valid_records if r['name'] not in existing_names]
+
+        def load_face(record):
+            image = cv2.imread(record['image_path'])
+            if image is None:
+                return None, "Could not read image file."
+            return self.extract_face(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+        batches = [valid_records[i:i + batch_size] for i in range(0, len(valid_records), batch_size)]
+        details_by_name = {}
+        embeddings_by_name = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep the next batch loading while the current one is embedded
+            next_faces = [pool.submit(load_face, r) for r in batches[0]] if batches else []
+            for batch_index, batch in enumerate(batches):
+                faces = [future.result() for future in next_faces]
+                if batch_index + 1 < len(batches):
+                    next_faces = [pool.submit(load_face, r) for r in batches[batch_index + 1]]
+
+                batch_records, crops = [], []
+                for record, (face_img, error) in zip(batch, faces):
+                    if error:
+                        errors.append((record['name'], f"{os.path.basename(record.get('image_path', ''))}: {error}"))
+                    else:
+                        batch_records.append(record)
+                        crops.append(face_img)
+
+                embeddings, error = self.get_embeddings_batch(crops)
+                if error:
+                    errors.extend((record['name'], error) for record in batch_records)
+                else:
+                    for record, embedding in zip(batch_records, embeddings):
+                        details_by_name.setdefault(record['name'], record)
+                        embeddings_by_name.setdefault(record['name'], []).append(embedding)
+
+                if progress_callback:
+                    progress_callback("embedding", min((batch_index + 1) * batch_size, len(valid_records)), len(valid_records))
+
+        rows = []
+        for name, record in details_by_name.items():
+            rows.append((
+                name, record.get('father_name') or None, record.get('gender') or None,
+                record.get('dob') or None, record.get('crimes_done') or None,
+                [self.encode_embedding(embedding) for embedding in embeddings_by_name[name]]
+            ))
+
+        saving_progress = (lambda done, total: progress_callback("saving", done, total)) if progress_callback else None
+        inserted, insert_errors = self.db_service.insert_criminals_bulk(rows, chunk_size, saving_progress)
+        errors.extend(insert_errors)
+
+        embedding_ids, criminal_ids, names, embeddings = [], [], [], []
+        for name, (criminal_id, ids) in inserted.items():
+            embedding_ids.extend(ids)
+            criminal_ids.extend([criminal_id] * len(ids))
+            names.extend([name] * len(ids))
+            embeddings.extend(embeddings_by_name[name])
+        self.add_embeddings(embedding_ids, criminal_ids, names, embeddings)
+        return len(inserted), errors
+
+    def extract_face(self, image_np, confidence_threshold=None):
+        """
+        Crops the largest confident face of an image for registration. The crop
+        is aligned with its landmarks like the crops recognition embeds, so
+        gallery and probe embeddings are comparable. Returns (face_img, error).
+        """
+        start = time.perf_counter()
         faces = self.detector.detect_faces(image_np)
+        self._detect_seconds.observe(time.perf_counter() - start)
         if not faces:
             return None, "No face detected."
 
         # filter faces by confidence and find the one with the largest bounding box
+        if confidence_threshold is None:
+            confidence_threshold = self.detection_confidence
         confident_faces = [f for f in faces if f['confidence'] >= confidence_threshold]
         if not confident_faces:
             return None, "Face detection confidence too low."
@@ -60,56 +523,181 @@ class FaceService:
         main_face = max(confident_faces, key=lambda f: f['box'][2] * f['box'][3])
         x, y, w, h = main_face['box']
         
-        x, y = max(0, x), max(0, y)
         face_img = image_np[y:y+h, x:x+w]
-        
+        if face_img.size == 0:
+            return None, "No face detected."
+
+        keypoints = {name: (px - x, py - y) for name, (px, py) in main_face.get('keypoints', {}).items()}
+        scores, components = self.quality_scorer.score_batch([face_img], [keypoints])
+        if not self.quality_scorer.passes(scores[0]):
+            weakest = self.quality_scorer.weakest(components)
+            return None, f"Face quality too low ({scores[0]:.2f}, weakest: {weakest})."
+
+        if keypoints:
+            face_img = self._align_face(face_img, keypoints)
         return face_img, None
 
     def get_embedding(self, face_image_np):
         """
         Generates a face embedding from a cropped face image.
-        Handles the specific return format from DeepFace.
+        Convenience wrapper around get_embeddings_batch for a single face.
+        """
+        embeddings, error = self.get_embeddings_batch([face_image_np])
+        if error:
+            return None, error
+        return embeddings[0], None
+
+    def get_embeddings_batch(self, face_images, keypoints=None):
+        """
+        Generates embeddings for a list of cropped face images in a single forward pass.
+        If keypoints (MTCNN style, relative to each crop) are given, each crop is
+        rotated so the eyes are level before resizing.
+        Crops found in the embedding cache skip the model; only the rest are batched.
+        Returns an (N, 512) array of L2-normalized float32 embeddings.
         """
+        if not face_images:
+            return np.empty((0, self.embedding_dimension), dtype=np.float32), None
+
+        start = time.perf_counter()
         try:
-            # DeepFace.represent returns a list of dictionaries
-            embedding_result = DeepFace.represent(
-                face_image_np,
-                model_name="ArcFace",
-                enforce_detection=False
-            )
-            
-            if isinstance(embedding_result, list) and len(embedding_result) > 0:
-                embedding_vector = embedding_result[0].get("embedding")
-                if embedding_vector:
-                    embedding_np = np.array(embedding_vector, dtype=np.float32)
-                    # Normalize the embedding before searching
-                    norm = np.linalg.norm(embedding_np)
-                    if norm > 0:
-                        return embedding_np / norm, None
-            
-            return None, "Could not extract embedding from face."
+            for face_img in face_images:
+                if face_img is None or face_img.size == 0:
+                    return None, "Could not extract embedding from an empty face crop."
+
+            embeddings = np.empty((len(face_images), self.embedding_dimension), dtype=np.float32)
+            missing, keys = [], []
+            for i, face_img in enumerate(face_images):
+                face_keypoints = keypoints[i] if keypoints is not None else None
+                if self.embedding_cache is None:
+                    missing.append(i)
+                    continue
+                key = self.embedding_cache.make_key(face_img, self.model_input_size, face_keypoints)
+                cached = self.embedding_cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                    keys.append(key)
+                else:
+                    embeddings[i] = cached
+            if not missing:
+                return embeddings, None
+
+            batch = np.empty((len(missing), *self.model_input_size, 3), dtype=np.float32)
+            for row, i in enumerate(missing):
+                face_img = face_images[i]
+                if keypoints is not None and keypoints[i]:
+                    face_img = self._align_face(face_img, keypoints[i])
+                batch[row] = preprocess_face(face_img, self.model_input_size)
+
+            computed = self.embedding_engine.embed(batch)
+
+            # Normalize all embeddings at once; zero vectors stay zero
+            norms = np.linalg.norm(computed, axis=1, keepdims=True)
+            computed /= np.maximum(norms, 1e-12)
+            embeddings[missing] = computed
+            if self.embedding_cache is not None:
+                for key, embedding in zip(keys, computed):
+                    self.embedding_cache.put(key, embedding)
+            return embeddings, None
         except Exception as e:
             return None, f"Embedding extraction failed: {str(e)}"
+        finally:
+            self._embed_seconds.observe(time.perf_counter() - start)
+
+    def _align_face(self, face_img, keypoints):
+        """Rotates a face crop around its center so that both eyes lie on a horizontal line."""
+        left_x, left_y = keypoints['left_eye']
+        right_x, right_y = keypoints['right_eye']
+        angle = np.degrees(np.arctan2(right_y - left_y, right_x - left_x))
+        h, w = face_img.shape[:2]
+        rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        return cv2.warpAffine(face_img, rotation, (w, h), borderMode=cv2.BORDER_CONSTANT)
 
     def search_face(self, embedding):
         """
         Searches for a similar face in the FAISS index using Cosine Similarity.
         Returns the name of the matched criminal and the similarity score.
         """
-        if self.faiss_index.ntotal == 0:
-            return "Unknown", 0.0
-        
-        embedding_np = np.array([embedding], dtype=np.float32)
-        
-        similarities, indices = self.faiss_index.search(embedding_np, k=1)
-        
-        similarity_score = similarities[0][0]
-        matched_label = self.known_labels[indices[0][0]]
-        
-        #print(f"DEBUG: Closest match is '{matched_label}' with similarity {similarity_score:.4f}")
+        return self.search_faces([embedding])[0]
 
-        if similarity_score >= self.recognition_threshold:
-            return matched_label, similarity_score
-            
-        return "Unknown", similarity_score
+    def search_faces(self, embeddings):
+        """
+        Searches a batch of query embeddings at once.
+        Returns a list of (name, similarity score), one per query.
+        """
+        return [(name, score) for _, name, score in self.identify_faces(embeddings)]
+
+    def identify_faces(self, embeddings):
+        """
+        Like search_faces, but also returns who matched.
+        Returns a list of (criminal id or None, name, similarity score), one per query.
+        """
+        criminal_ids, scores = self.match_identities(embeddings)
+        results = []
+        for criminal_id, score in zip(criminal_ids.tolist(), scores.tolist()):
+            if criminal_id >= 0 and score >= self.recognition_threshold and criminal_id in self.known_labels:
+                results.append((criminal_id, self.known_labels[criminal_id], score))
+            else:
+                results.append((None, "Unknown", score))
+        return results
+
+    def match_identities(self, embeddings, k=None, aggregation=None):
+        """
+        Finds the best-matching criminal for each query embedding.
+        The top-k nearest embeddings are fetched in one batched FAISS call, and
+        the similarities of each criminal's hits are combined per query:
+        'max' keeps the best hit, 'mean' averages the hits, and 'centroid'
+        rescores against the mean of all of the criminal's stored embeddings.
+        Returns (criminal ids, scores) arrays of shape (N,); id -1 means no match.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.embedding_dimension)
+        k = k or self.search_top_k
+        aggregation = aggregation or self.aggregation
+        no_match = (np.full(len(queries), -1, dtype=np.int64), np.zeros(len(queries), dtype=np.float32))
+        if len(queries) == 0:
+            return no_match
+
+        with self.index_lock:
+            if self.faiss_index.ntotal == 0:
+                return no_match
+            start = time.perf_counter()
+            similarities, embedding_ids = self.faiss_index.search(queries, min(k, self.faiss_index.ntotal))
+            self._search_seconds.observe(time.perf_counter() - start)
+            owners = np.array(
+                [self.embedding_owners.get(i, -1) for i in embedding_ids.ravel().tolist()], dtype=np.int64
+            ).reshape(embedding_ids.shape)
+            candidates, column = np.unique(owners, return_inverse=True)
+            column = column.reshape(owners.shape)
+            if aggregation == "centroid":
+                centroids = self._centroids(candidates)
+
+        # Scatter every hit into a (queries x candidate criminals) score matrix
+        rows = np.broadcast_to(np.arange(len(queries))[:, None], owners.shape)
+        valid = owners >= 0
+        if aggregation == "mean":
+            totals = np.zeros((len(queries), len(candidates)), dtype=np.float32)
+            counts = np.zeros((len(queries), len(candidates)), dtype=np.float32)
+            np.add.at(totals, (rows[valid], column[valid]), similarities[valid])
+            np.add.at(counts, (rows[valid], column[valid]), 1.0)
+            scores = np.where(counts > 0, totals / np.maximum(counts, 1.0), -np.inf)
+        else:
+            scores = np.full((len(queries), len(candidates)), -np.inf, dtype=np.float32)
+            np.maximum.at(scores, (rows[valid], column[valid]), similarities[valid])
+            if aggregation == "centroid":
+                # Only criminals that appeared among a query's hits are rescored
+                scores = np.where(np.isfinite(scores), queries @ centroids.T, -np.inf)
+
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(queries)), best]
+        matched = np.isfinite(best_scores)
+        criminal_ids = np.where(matched, candidates[best], -1)
+        return criminal_ids, np.where(matched, best_scores, 0.0).astype(np.float32)
 
+    def _centroids(self, criminal_ids):
+        """Normalized mean embedding of each given criminal (zeros for unknown ids), read back from the index."""
+        centroids = np.zeros((len(criminal_ids), self.embedding_dimension), dtype=np.float32)
+        for row, criminal_id in enumerate(criminal_ids.tolist()):
+            embedding_ids = self.identity_embeddings.get(criminal_id)
+            if embedding_ids:
+                centroids[row] = reconstruct_vectors(self.faiss_index, list(embedding_ids)).mean(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        return centroids / np.maximum(norms, 1e-12)
@@ -0,0 +1,86 @@
+import math
+import cv2
+import numpy as np
+
+
+class FrameRenderer:
+    """
+    Display stage of the live view. The newest frame of every feed is scaled
+    once with cv2.resize straight into its cell of a preallocated canvas the
+    size of the video widget, and boxes, labels and the stats overlay are drawn
+    afterwards at display resolution. The canvas is reused between frames and
+    only reallocated when the widget size or the number of feeds changes.
+    Cells keep their last picture, so only feeds with a new frame are redrawn.
+    """
+    def __init__(self, interpolation=cv2.INTER_LINEAR):
+        self.interpolation = interpolation
+        self.width = 0
+        self.height = 0
+        self.canvas = None
+        self._cells = []       # (x, y, width, height) of every feed's cell
+        self._cell_shapes = []  # frame shape each cell was last fitted to
+
+    def set_size(self, width, height):
+        """Sets the display size in pixels; the canvas is rebuilt on the next render."""
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.canvas = None
+
+    def reset(self):
+        self.canvas = None
+
+    def render(self, frames, feed_count, overlay_lines=None):
+        """
+        Draws {feed index: (RGB frame, annotations)} into the canvas, where
+        annotations are (box, label, color) tuples in frame coordinates.
+        Returns the canvas, or None while the display size is still unknown.
+        """
+        if self.width < 2 or self.height < 2 or feed_count < 1:
+            return None
+        if self.canvas is None or len(self._cells) != feed_count:
+            self._allocate(feed_count)
+        for index, (frame, annotations) in frames.items():
+            if index < feed_count:
+                self._draw_cell(index, frame, annotations, overlay_lines)
+        return self.canvas
+
+    def _allocate(self, feed_count):
+        """Lays the feeds out in a near-square grid, in source order."""
+        self.canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        columns = math.ceil(math.sqrt(feed_count))
+        rows = math.ceil(feed_count / columns)
+        cell_w, cell_h = self.width // columns, self.height // rows
+        self._cells = []
+        for index in range(feed_count):
+            row, column = divmod(index, columns)
+            self._cells.append((column * cell_w, row * cell_h, cell_w, cell_h))
+        self._cell_shapes = [None] * feed_count
+
+    def _draw_cell(self, index, frame, annotations, overlay_lines):
+        cell_x, cell_y, cell_w, cell_h = self._cells[index]
+        frame_h, frame_w = frame.shape[:2]
+        # Fit the frame into the cell keeping its aspect ratio, centered
+        scale = min(cell_w / frame_w, cell_h / frame_h)
+        fit_w, fit_h = max(1, int(frame_w * scale)), max(1, int(frame_h * scale))
+        x0, y0 = cell_x + (cell_w - fit_w) // 2, cell_y + (cell_h - fit_h) // 2
+
+        if self._cell_shapes[index] != frame.shape:
+            # Clear the letterbox margins left by a differently shaped frame
+            self.canvas[cell_y:cell_y + cell_h, cell_x:cell_x + cell_w] = 0
+            self._cell_shapes[index] = frame.shape
+
+        view = self.canvas[y0:y0 + fit_h, x0:x0 + fit_w]
+        cv2.resize(frame, (fit_w, fit_h), dst=view, interpolation=self.interpolation)
+
+        for (x, y, w, h), label, color in annotations:
+            left, top = int(x * scale), int(y * scale)
+            right, bottom = int((x + w) * scale), int((y + h) * scale)
+            cv2.rectangle(view, (left, top), (right, bottom), color, 2)
+            cv2.putText(view, label, (left, max(12, top - 6)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+        if overlay_lines:
+            text_y = 18
+            for text in overlay_lines:
+                cv2.putText(view, text, (8, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3)
+                cv2.putText(view, text, (8, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 0), 1)
+                text_y += 17
@@ -0,0 +1,159 @@
+import os
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "sq8", "sq_fp16", "ivf_flat", "ivf_pq", "hnsw")
+
+# sq8 needs value ranges per dimension before it can encode anything
+SQ_MIN_TRAINING = 256
+
+
+class IndexConfig:
+    """
+    Settings that select and tune the FAISS backend used for the gallery.
+    Values are read from the environment (.env) so each deployment can pick
+    a backend that fits its watchlist size.
+    """
+    def __init__(self, index_type="flat", nlist=1024, nprobe=16, pq_m=64, pq_bits=8,
+                 hnsw_m=32, ef_construction=200, ef_search=64):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+            nlist=int(os.getenv("FAISS_NLIST", 1024)),
+            nprobe=int(os.getenv("FAISS_NPROBE", 16)),
+            pq_m=int(os.getenv("FAISS_PQ_M", 64)),
+            pq_bits=int(os.getenv("FAISS_PQ_BITS", 8)),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", 32)),
+            ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", 200)),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", 64)),
+        )
+
+    def describe(self):
+        if self.index_type == "ivf_flat":
+            return f"ivf_flat(nlist={self.nlist}, nprobe={self.nprobe})"
+        if self.index_type == "ivf_pq":
+            return f"ivf_pq(nlist={self.nlist}, m={self.pq_m}, bits={self.pq_bits}, nprobe={self.nprobe})"
+        if self.index_type == "hnsw":
+            return f"hnsw(M={self.hnsw_m}, efConstruction={self.ef_construction}, efSearch={self.ef_search})"
+        return self.index_type
+
+
+def min_training_size(config):
+    """Smallest number of vectors the configured backend can be trained on."""
+    if config.index_type == "ivf_flat":
+        return config.nlist
+    if config.index_type == "ivf_pq":
+        return max(config.nlist, 2 ** config.pq_bits)
+    if config.index_type == "sq8":
+        return SQ_MIN_TRAINING
+    return 0
+
+
+def create_index(config, dimension, training_vectors=None):
+    """
+    Builds an empty, ID-mapped inner-product index for the configured backend.
+    IVF and sq8 backends are trained on training_vectors; when there are too
+    few of them the exact flat index is used instead until the gallery grows.
+    The scalar-quantized backends scan every vector like flat but store one
+    byte (sq8) or two bytes (sq_fp16) per dimension instead of four.
+    Every backend can return stored vectors by id (see reconstruct_vectors).
+    Returns (index, effective_index_type).
+    """
+    index_type = config.index_type
+    if index_type in ("ivf_flat", "ivf_pq", "sq8"):
+        if training_vectors is None or len(training_vectors) < min_training_size(config):
+            index_type = "flat"
+
+    if index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dimension)
+        base_index = faiss.IndexIVFFlat(quantizer, dimension, config.nlist, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "ivf_pq":
+        quantizer = faiss.IndexFlatIP(dimension)
+        base_index = faiss.IndexIVFPQ(quantizer, dimension, config.nlist, config.pq_m, config.pq_bits,
+                                      faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "sq8":
+        base_index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        # Widen the trained ranges so later enrollments are not clipped
+        base_index.sq.rangestat_arg = 0.2
+    elif index_type == "sq_fp16":
+        base_index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "hnsw":
+        base_index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        base_index.hnsw.efConstruction = config.ef_construction
+    else:
+        base_index = faiss.IndexFlatIP(dimension)
+
+    if not base_index.is_trained:
+        base_index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+
+    if isinstance(base_index, faiss.IndexIVF):
+        # IVF lists store the ids themselves; a hashtable direct map lets
+        # vectors be looked up (and removed) by id without an ID-map wrapper.
+        base_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index = base_index
+    else:
+        index = faiss.IndexIDMap2(base_index)
+    apply_search_params(index, config)
+    return index, index_type
+
+
+def index_type_of(index):
+    """The backend (one of INDEX_TYPES) an index was actually built as, e.g. flat for a fallback."""
+    base_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base_index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base_index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(base_index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base_index, faiss.IndexScalarQuantizer):
+        return "sq8" if base_index.sq.qtype == faiss.ScalarQuantizer.QT_8bit else "sq_fp16"
+    return "flat"
+
+
+def reconstruct_vectors(index, ids):
+    """
+    Returns the stored vectors for the given ids as an (N, d) float32 array.
+    Quantized backends return their approximation of the original vectors.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(ids)
+
+
+def copy_to_memory(index):
+    """Copy of an index that owns its storage, e.g. of one memory-mapped from a snapshot."""
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def index_memory_bytes(index):
+    """Serialized size of an index, a close proxy for the memory it occupies."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def apply_search_params(index, config):
+    """Applies the query-time knobs (nprobe for IVF, efSearch for HNSW) to an index."""
+    base_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base_index, faiss.IndexIVF):
+        base_index.nprobe = min(config.nprobe, base_index.nlist)
+    elif isinstance(base_index, faiss.IndexHNSW):
+        base_index.hnsw.efSearch = config.ef_search
+
+
+def supports_removal(index):
+    """HNSW graphs cannot delete vectors in place; the other backends can."""
+    base_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    return not isinstance(base_index, faiss.IndexHNSW)
@@ -0,0 +1,268 @@
+import os
+import json
+import shutil
+import time
+import hashlib
+import numpy as np
+import faiss
+
+SNAPSHOT_FORMAT_VERSION = 4
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotMap:
+    """
+    Dict-like map from integer ids to values, backed by two arrays sorted by
+    id (memory-mapped from a snapshot, or built from a database load) plus a
+    small in-memory overlay of the changes made since. Lookups binary search
+    the ids, so opening a snapshot reads nothing per entry and only the pages
+    that lookups touch are ever read from disk.
+    """
+    def __init__(self, keys=None, values=None):
+        self._keys = keys if keys is not None else np.empty(0, dtype=np.int64)
+        self._values = values if values is not None else np.empty(0, dtype=np.int64)
+        self._changed = {}    # entries added or replaced since the arrays were made
+        self._hidden = set()  # ids of the arrays that were replaced or removed
+
+    @classmethod
+    def from_pairs(cls, keys, values):
+        """Builds a map over in-memory arrays; keys need not be sorted."""
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values)
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], values[order])
+
+    def _position(self, key):
+        """Index of key in the arrays, or -1 if it is not there (or was hidden)."""
+        if len(self._keys) == 0 or key in self._hidden:
+            return -1
+        position = int(np.searchsorted(self._keys, key))
+        if position < len(self._keys) and self._keys[position] == key:
+            return position
+        return -1
+
+    def get(self, key, default=None):
+        if key in self._changed:
+            return self._changed[key]
+        position = self._position(key)
+        return default if position < 0 else self._values[position].item()
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key, value):
+        if self._position(key) >= 0:
+            self._hidden.add(key)
+        self._changed[key] = value
+
+    def pop(self, key, *default):
+        if key in self._changed:
+            return self._changed.pop(key)
+        position = self._position(key)
+        if position >= 0:
+            self._hidden.add(key)
+            return self._values[position].item()
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __len__(self):
+        return len(self._keys) - len(self._hidden) + len(self._changed)
+
+    def items(self):
+        for key, value in zip(self._keys.tolist(), self._values.tolist()):
+            if key not in self._hidden:
+                yield key, value
+        yield from self._changed.items()
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (value for _, value in self.items())
+
+    def arrays(self):
+        """Returns (keys, values) as arrays sorted by key, ready to be saved."""
+        hidden = np.fromiter(self._hidden, dtype=np.int64, count=len(self._hidden))
+        visible = ~np.isin(self._keys, hidden)
+        keys = np.concatenate([self._keys[visible], np.fromiter(self._changed, dtype=np.int64, count=len(self._changed))])
+        values = np.array(self._values[visible].tolist() + list(self._changed.values()))
+        order = np.argsort(keys, kind="stable")
+        return keys[order], values[order]
+
+
+_MISSING = object()
+
+
+class IndexSnapshot:
+    """
+    Persists the built FAISS index together with the matching embedding ids,
+    the criminal owning each embedding and the criminals' labels in a local
+    directory. The index is the only copy of the vectors. On load the id and
+    label arrays are memory-mapped (see SnapshotMap) and so is the index where
+    its type allows, so startup reads neither every embedding blob from MySQL
+    nor the whole gallery from disk.
+    """
+    INDEX_FILE = "index.faiss"
+    IDS_FILE = "ids.npy"
+    OWNERS_FILE = "owners.npy"
+    CRIMINALS_FILE = "criminals.npy"
+    LABELS_FILE = "labels.npy"
+    META_FILE = "meta.json"
+    # Names the generation directory currently in use. Each save writes a new
+    # generation, so files that are still memory-mapped are never overwritten.
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(self, directory, verify_checksums=False):
+        self.directory = directory
+        self.verify_checksums = verify_checksums
+        # Generation whose files this process has mapped and still reads from
+        self.mapped_generation = None
+
+    def current_path(self):
+        """Returns the directory of the active snapshot generation, or None."""
+        try:
+            with open(os.path.join(self.directory, self.CURRENT_FILE), encoding="utf-8") as f:
+                generation = f.read().strip()
+        except OSError:
+            return None
+        path = os.path.join(self.directory, generation)
+        return path if os.path.isfile(os.path.join(path, self.META_FILE)) else None
+
+    def exists(self):
+        return self.current_path() is not None
+
+    def save(self, faiss_index, ids, owners, criminal_ids, labels, db_version, last_sync, index_description):
+        """
+        Writes a complete snapshot into a new generation directory and only then
+        points CURRENT at it, so a crash mid-write never leaves a half-written snapshot.
+        ids/owners map embeddings to criminals and criminal_ids/labels name them;
+        both pairs are stored sorted by id so they can be searched where they are mapped.
+        """
+        generation = f"gen-{time.time_ns()}"
+        generation_dir = os.path.join(self.directory, generation)
+        os.makedirs(generation_dir)
+
+        faiss.write_index(faiss_index, os.path.join(generation_dir, self.INDEX_FILE))
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        np.save(os.path.join(generation_dir, self.IDS_FILE), ids[order])
+        np.save(os.path.join(generation_dir, self.OWNERS_FILE), np.asarray(owners, dtype=np.int64)[order])
+        criminal_ids = np.asarray(criminal_ids, dtype=np.int64)
+        order = np.argsort(criminal_ids, kind="stable")
+        np.save(os.path.join(generation_dir, self.CRIMINALS_FILE), criminal_ids[order])
+        # Fixed-width unicode, so the labels can be memory-mapped like the ids
+        np.save(os.path.join(generation_dir, self.LABELS_FILE), np.asarray(labels, dtype=str)[order])
+
+        data_files = (self.INDEX_FILE, self.IDS_FILE, self.OWNERS_FILE, self.CRIMINALS_FILE, self.LABELS_FILE)
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "count": int(len(ids)),
+            "dimension": int(faiss_index.d),
+            "index": index_description,
+            "db_version": db_version,
+            "last_sync": last_sync.isoformat() if last_sync else None,
+            "files": {
+                name: {
+                    "size": os.path.getsize(os.path.join(generation_dir, name)),
+                    "sha256": file_checksum(os.path.join(generation_dir, name)),
+                }
+                for name in data_files
+            },
+        }
+        with open(os.path.join(generation_dir, self.META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        current_tmp = os.path.join(self.directory, self.CURRENT_FILE + ".tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(current_tmp, os.path.join(self.directory, self.CURRENT_FILE))
+        self._remove_old_generations(generation)
+
+    def release(self):
+        """Called once nothing reads from the mapped generation any more, so a later save may delete it."""
+        self.mapped_generation = None
+
+    def _remove_old_generations(self, keep):
+        """Deletes superseded generations, except the one this process still has mapped (see release)."""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith("gen-") and name not in (keep, self.mapped_generation) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def load(self, index_description):
+        """
+        Loads the snapshot if it is intact and was built with the same index settings.
+        Returns (snapshot, error) where snapshot is a dict with the index, the
+        memory-mapped ids, owners, criminal ids and labels (each pair sorted by
+        id), db_version and last_sync.
+        """
+        snapshot_dir = self.current_path()
+        if snapshot_dir is None:
+            return None, "No index snapshot found."
+
+        try:
+            with open(os.path.join(snapshot_dir, self.META_FILE), encoding="utf-8") as f:
+                meta = json.load(f)
+
+            if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+                return None, "Index snapshot format is outdated."
+            if meta.get("index") != index_description:
+                return None, "Index snapshot was built with different index settings."
+
+            for name, info in meta["files"].items():
+                path = os.path.join(snapshot_dir, name)
+                if not os.path.isfile(path) or os.path.getsize(path) != info["size"]:
+                    return None, f"Index snapshot file {name} is missing or truncated."
+                if self.verify_checksums and file_checksum(path) != info["sha256"]:
+                    return None, f"Index snapshot file {name} failed its checksum."
+
+            ids = np.load(os.path.join(snapshot_dir, self.IDS_FILE), mmap_mode="r")
+            owners = np.load(os.path.join(snapshot_dir, self.OWNERS_FILE), mmap_mode="r")
+            criminal_ids = np.load(os.path.join(snapshot_dir, self.CRIMINALS_FILE), mmap_mode="r")
+            labels = np.load(os.path.join(snapshot_dir, self.LABELS_FILE), mmap_mode="r")
+            # Flat, scalar-quantized and HNSW indexes keep their vectors in one
+            # block that FAISS can map in place. A mapped index is read-only, so
+            # the caller copies it into memory before changing it ("mapped").
+            index_path = os.path.join(snapshot_dir, self.INDEX_FILE)
+            faiss_index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC)
+            mapped = not isinstance(faiss_index, faiss.IndexIVF)
+            if not mapped:
+                faiss_index = faiss.read_index(index_path)
+        except Exception as e:
+            return None, f"Could not read index snapshot: {e}"
+
+        if not (len(ids) == len(owners) == faiss_index.ntotal == meta["count"]) or len(criminal_ids) != len(labels):
+            return None, "Index snapshot files disagree on the number of embeddings."
+
+        self.mapped_generation = os.path.basename(snapshot_dir)
+        return {
+            "index": faiss_index,
+            "mapped": mapped,
+            "ids": ids,
+            "owners": owners,
+            "criminal_ids": criminal_ids,
+            "labels": labels,
+            "db_version": meta["db_version"],
+            "last_sync": meta["last_sync"],
+        }, None
@@ -1,24 +1,35 @@
+import time
 import tkinter as tk
 from tkinter import messagebox
 from ui.login_frame import LoginFrame
 from ui.signup_frame import SignUpFrame
 from ui.home_frame import HomeFrame
 from database import DatabaseService
-from face_service import FaceService
+from metrics import MetricsRegistry, MetricsExporter
+from service_loader import ServiceLoader
+from sightings_log import SightingsLog
 
 class App(tk.Tk):
     """Main application class that manages the Tkinter window and frame navigation."""
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        started_at = time.perf_counter()
 
         self.title("Criminal Detection System")
         self.geometry("1280x720")
         self.resizable(False, False)
 
-        # Initialize services
+        # Initialize services. The face recognition stack (TensorFlow, models,
+        # index) loads in the background while the login screen is shown.
         try:
             self.db_service = DatabaseService()
-            self.face_service = FaceService(self.db_service)
+            self.metrics = MetricsRegistry()
+            self.services = ServiceLoader(self.db_service, self.metrics)
+            self.services.start()
+            # Recognitions are logged to the sightings table in the background
+            self.sightings = SightingsLog.from_env(self.db_service, self.metrics)
+            self.sightings.start()
+            self.metrics_exporter = self.start_metrics_export()
         except Exception as e:
             messagebox.showerror("Initialization Error", f"Failed to connect to services: {e}")
             self.destroy()
@@ -40,6 +51,13 @@ class App(tk.Tk):
             frame.grid(row=0, column=0, sticky="nsew")
 
         self.show_frame("LoginFrame")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after_idle(lambda: print(f"Login screen shown after {time.perf_counter() - started_at:.2f}s"))
+
+    @property
+    def face_service(self):
+        """The FaceService once background loading finished, otherwise None."""
+        return self.services.face_service
 
     def show_frame(self, page_name):
         """Raise the specified frame to the top."""
@@ -49,6 +67,37 @@ class App(tk.Tk):
         if hasattr(frame, 'on_show'):
             frame.on_show()
 
+    def on_close(self):
+        """Stops the camera, flushes logged sightings, persists index changes and closes search shards and pooled connections."""
+        self.frames["HomeFrame"].stop_detection()
+        if self.face_service:
+            self.face_service.save_snapshot()
+            self.face_service.close()
+        self.sightings.stop()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+        self.db_service.close()
+        self.destroy()
+
+    def start_metrics_export(self):
+        """Serves or writes the metrics registry if METRICS_PORT or METRICS_FILE is set."""
+        metrics = self.metrics
+        pool = self.db_service.pool
+        metrics.gauge("db_pool_in_use", lambda: pool.get_stats()["in_use"], "Database connections currently borrowed.")
+        metrics.gauge("db_pool_wait_p95_ms", lambda: pool.wait_stats.summary()["p95_ms"],
+                      "p95 wait for a free database connection.")
+        metrics.gauge("index_embeddings", lambda: self.face_service.faiss_index.ntotal if self.face_service else 0,
+                      "Embeddings in the FAISS index.")
+
+        exporter = MetricsExporter.from_env(metrics)
+        if exporter:
+            try:
+                exporter.start()
+            except OSError as e:
+                print(f"Could not start metrics export: {e}")
+                return None
+        return exporter
+
     def get_db_service(self):
         return self.db_service
 
@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Upper bounds in seconds, from sub-millisecond FAISS searches to slow CPU detections
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Counter:
+    """A monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """
+    Latency distribution in Prometheus-style cumulative buckets, plus a rolling
+    window of recent samples for p50/p95/p99 of the current behaviour.
+    """
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=512):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.bucket_counts[slot] += 1
+            self.sum += seconds
+            self.count += 1
+            self.recent.append(seconds)
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        """Returns the given percentiles of the recent window in milliseconds."""
+        with self._lock:
+            recent = np.array(self.recent)
+        if len(recent) == 0:
+            return {q: 0.0 for q in quantiles}
+        values = np.percentile(recent * 1000.0, quantiles)
+        return {q: round(float(v), 3) for q, v in zip(quantiles, values)}
+
+    def cumulative_buckets(self):
+        with self._lock:
+            counts = list(self.bucket_counts)
+            total, count = self.sum, self.count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class Gauge:
+    """A value read from a callable whenever metrics are collected."""
+    kind = "gauge"
+
+    def __init__(self, read):
+        self.read = read
+
+
+class MetricsRegistry:
+    """
+    Holds the counters, histograms and gauges of one process. Metrics are
+    created on first use and identified by name plus optional labels, e.g.
+    registry.histogram("pipeline_stage_seconds", stage="detect").
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, *args):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = cls(*args)
+                    self._metrics[key] = metric
+                    if help_text or name not in self._help:
+                        self._help[name] = help_text
+        return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text="", **labels):
+        return self._get(Histogram, name, help_text, labels)
+
+    def gauge(self, name, read, help_text="", **labels):
+        return self._get(Gauge, name, help_text, labels, read)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observes how long the with block takes in the named histogram."""
+        histogram = self.histogram(name, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    @staticmethod
+    def _label_text(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def to_dict(self):
+        """A JSON-friendly view: counter values, gauge values and histogram summaries."""
+        result = {"counters": {}, "gauges": {}, "histograms": {}}
+        for (name, labels), metric in self._items():
+            key = name + self._label_text(labels)
+            if metric.kind == "counter":
+                result["counters"][key] = metric.value
+            elif metric.kind == "gauge":
+                try:
+                    result["gauges"][key] = metric.read()
+                except Exception:
+                    result["gauges"][key] = None
+            else:
+                percentiles = metric.percentiles()
+                result["histograms"][key] = {
+                    "count": metric.count,
+                    "mean_ms": round(metric.sum * 1000.0 / metric.count, 3) if metric.count else 0.0,
+                    "p50_ms": percentiles[50],
+                    "p95_ms": percentiles[95],
+                    "p99_ms": percentiles[99],
+                }
+        return result
+
+    def to_prometheus(self):
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for (name, labels), metric in self._items():
+            if name not in described:
+                described.add(name)
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+            if metric.kind == "counter":
+                lines.append(f"{name}{self._label_text(labels)} {metric.value}")
+            elif metric.kind == "gauge":
+                try:
+                    lines.append(f"{name}{self._label_text(labels)} {float(metric.read())}")
+                except Exception:
+                    continue
+            else:
+                cumulative, total, count = metric.cumulative_buckets()
+                for bound, running in cumulative:
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{self._label_text(labels, [('le', le)])} {running}")
+                lines.append(f"{name}_sum{self._label_text(labels)} {total}")
+                lines.append(f"{name}_count{self._label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Publishes a registry for scrapers: an HTTP endpoint on localhost serving
+    /metrics (Prometheus text) and /metrics.json, and/or a file rewritten every
+    interval seconds (JSON if the path ends in .json, Prometheus text otherwise).
+    """
+    def __init__(self, registry, port=None, file_path=None, interval=5.0):
+        self.registry = registry
+        self.port = port
+        self.file_path = file_path
+        self.interval = interval
+        self._server = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_env(cls, registry):
+        """Builds an exporter from METRICS_PORT / METRICS_FILE in .env, or returns None if neither is set."""
+        port = int(os.getenv("METRICS_PORT") or 0) or None
+        file_path = os.getenv("METRICS_FILE") or None
+        if port is None and file_path is None:
+            return None
+        return cls(registry, port, file_path, float(os.getenv("METRICS_INTERVAL") or 5))
+
+    def start(self):
+        if self.port:
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path == "/metrics":
+                        body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+                    elif self.path == "/metrics.json":
+                        body, content_type = json.dumps(registry.to_dict()), "application/json"
+                    else:
+                        self.send_error(404)
+                        return
+                    data = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            self._threads.append(threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True))
+        if self.file_path:
+            self._threads.append(threading.Thread(target=self._write_loop, name="metrics-file", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+        if self.file_path:
+            self.write_file()
+
+    def write_file(self):
+        """Writes the current metrics atomically so a reader never sees a partial file."""
+        if self.file_path.endswith(".json"):
+            body = json.dumps(self.registry.to_dict(), indent=2)
+        else:
+            body = self.registry.to_prometheus()
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp_path, self.file_path)
+
+    def _write_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write_file()
+            except OSError as e:
+                print(f"Could not write metrics file: {e}")
@@ -0,0 +1,135 @@
+import os
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap motion check that runs before face detection. Each frame is shrunk to
+    a small grayscale image and compared with a slowly updated background;
+    pixels that differ by more than threshold form motion blobs, and blobs
+    covering at least min_area of the frame become regions of interest.
+    regions() returns:
+      []    - nothing moved, the previous detections are still valid;
+      list  - padded (x, y, w, h) regions in full-resolution coordinates;
+      None  - detect on the whole frame (first frame, most of the frame
+              moved, or refresh_seconds passed since the last full detection).
+    """
+    def __init__(self, width=160, threshold=25, min_area=0.001, padding=0.2,
+                 background_rate=0.05, max_region_fraction=0.5, refresh_seconds=10.0):
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.padding = padding
+        self.background_rate = background_rate
+        self.max_region_fraction = max_region_fraction
+        self.refresh_seconds = refresh_seconds
+
+        self._background = None
+        self._last_full = 0.0
+        self._kernel = np.ones((3, 3), dtype=np.uint8)
+
+        self.checked = 0
+        self.skipped = 0
+        self.partial = 0
+        self.full = 0
+        self.region_fraction_total = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Builds a gate tuned by the MOTION_* settings in .env."""
+        return cls(
+            width=int(os.getenv("MOTION_WIDTH") or 160),
+            threshold=int(os.getenv("MOTION_THRESHOLD") or 25),
+            min_area=float(os.getenv("MOTION_MIN_AREA") or 0.001),
+            refresh_seconds=float(os.getenv("MOTION_REFRESH_SECONDS") or 10),
+        )
+
+    def reset(self):
+        self._background = None
+        self._last_full = 0.0
+
+    def regions(self, frame_rgb):
+        self.checked += 1
+        height, width = frame_rgb.shape[:2]
+        scale = min(1.0, self.width / width)
+        small = cv2.resize(frame_rgb, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY), (5, 5), 0).astype(np.float32)
+
+        now = time.monotonic()
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            return self._full(now)
+
+        mask = cv2.absdiff(gray, self._background) > self.threshold
+        # A running average absorbs gradual lighting changes into the background
+        cv2.accumulateWeighted(gray, self._background, self.background_rate)
+
+        if now - self._last_full >= self.refresh_seconds:
+            return self._full(now)
+        if not mask.any():
+            self.skipped += 1
+            return []
+
+        mask = cv2.dilate(mask.astype(np.uint8), self._kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_pixels = self.min_area * mask.shape[0] * mask.shape[1]
+        boxes = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_pixels]
+        if not boxes:
+            self.skipped += 1
+            return []
+
+        regions = self._merge([self._pad(box, 1.0 / scale, width, height) for box in boxes])
+        fraction = sum(w * h for _, _, w, h in regions) / float(width * height)
+        if fraction > self.max_region_fraction:
+            return self._full(now)
+        self.partial += 1
+        self.region_fraction_total += fraction
+        return regions
+
+    def _full(self, now):
+        self.full += 1
+        self.region_fraction_total += 1.0
+        self._last_full = now
+        return None
+
+    def _pad(self, box, factor, width, height):
+        """Scales a motion box to full resolution and grows it so faces on its edge are not cut off."""
+        x, y, w, h = (v * factor for v in box)
+        pad = self.padding * max(w, h)
+        x1, y1 = max(0, int(x - pad)), max(0, int(y - pad))
+        x2, y2 = min(width, int(x + w + pad)), min(height, int(y + h + pad))
+        return [x1, y1, x2 - x1, y2 - y1]
+
+    def _merge(self, boxes):
+        """Joins overlapping regions so no area is sent to the detector twice."""
+        merged = True
+        while merged and len(boxes) > 1:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    ax, ay, aw, ah = boxes[i]
+                    bx, by, bw, bh = boxes[j]
+                    if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                        x1, y1 = min(ax, bx), min(ay, by)
+                        x2, y2 = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                        boxes[i] = [x1, y1, x2 - x1, y2 - y1]
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [tuple(box) for box in boxes]
+
+    def get_stats(self):
+        """Share of checked frames skipped, detected on regions only, or detected in full."""
+        checked = max(1, self.checked)
+        return {
+            "checked": self.checked,
+            "skipped_fraction": round(self.skipped / checked, 4),
+            "partial_fraction": round(self.partial / checked, 4),
+            "full_fraction": round(self.full / checked, 4),
+            "mean_area_fraction": round(self.region_fraction_total / checked, 4),
+        }
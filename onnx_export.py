@@ -0,0 +1,58 @@
+"""
+Exports DeepFace's ArcFace model to ONNX for the onnx embedding engine,
+optionally with a dynamically int8-quantized copy:
+
+    python onnx_export.py --output models/arcface.onnx --quantize
+
+Needs TensorFlow, tf2onnx and onnxruntime on the exporting machine only; the
+edge hosts then run the .onnx file with onnxruntime alone. Check the result with
+python -m benchmarks.embedding_benchmark before switching EMBEDDING_ENGINE.
+"""
+import argparse
+import os
+
+
+def export_arcface(output_path, opset=13, model_name="ArcFace"):
+    """Converts the Keras model to ONNX with a dynamic batch dimension."""
+    import tensorflow as tf
+    import tf2onnx
+    from embedding_engines import TensorFlowEngine
+
+    engine = TensorFlowEngine(model_name)
+    height, width = engine.input_size
+    signature = (tf.TensorSpec((None, height, width, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(engine.keras_model, input_signature=signature, opset=opset, output_path=output_path)
+
+
+def quantize_model(input_path, output_path):
+    """
+    Writes a dynamically quantized copy: weights are stored as int8 and
+    activations are quantized on the fly, so no calibration set is needed.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export ArcFace to ONNX for the onnx embedding engine.")
+    parser.add_argument("--output", default="models/arcface.onnx", help="Path of the exported model.")
+    parser.add_argument("--opset", type=int, default=13)
+    parser.add_argument("--quantize", action="store_true",
+                        help="Also write an int8-quantized copy next to it (<name>_int8.onnx).")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    print(f"Exporting ArcFace to {args.output}...")
+    export_arcface(args.output, args.opset)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / (1024 * 1024):.1f} MB)")
+
+    if args.quantize:
+        root, extension = os.path.splitext(args.output)
+        quantized_path = f"{root}_int8{extension}"
+        print(f"Quantizing to {quantized_path}...")
+        quantize_model(args.output, quantized_path)
+        print(f"Wrote {quantized_path} ({os.path.getsize(quantized_path) / (1024 * 1024):.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import time
+import threading
+
+
+class ServiceLoader:
+    """
+    Builds the FaceService on a background thread so the login screen appears
+    at once. Importing TensorFlow, DeepFace and FAISS, creating the detector
+    and ArcFace, loading the index and a warm-up pass all happen off the UI
+    thread while the operator logs in.
+    state is "loading", "ready" or "failed". The UI thread polls is_ready();
+    other threads can block on wait().
+    """
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, db_service, metrics=None):
+        self.db_service = db_service
+        self.metrics = metrics
+        self.face_service = None
+        self.state = self.LOADING
+        self.error = None
+        # Seconds spent in each startup phase, in the order they ran
+        self.timings = {}
+        self._done = threading.Event()
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        threading.Thread(target=self._load, name="service-loader", daemon=True).start()
+
+    def _load(self):
+        try:
+            start = time.perf_counter()
+            from face_service import FaceService
+            self.timings["imports"] = time.perf_counter() - start
+
+            face_service = FaceService(self.db_service, self.metrics)
+            self.timings.update(face_service.startup_timings)
+
+            start = time.perf_counter()
+            face_service.warm_up()
+            self.timings["warm_up"] = time.perf_counter() - start
+            self.timings["total"] = time.perf_counter() - self._started_at
+
+            print(self.format_timings())
+            if self.metrics is not None:
+                for phase, seconds in self.timings.items():
+                    self.metrics.gauge("startup_seconds", lambda seconds=seconds: round(seconds, 3),
+                                       "Time spent in each phase of background startup.", phase=phase)
+            self.face_service = face_service
+            self.state = self.READY
+        except Exception as e:
+            self.error = str(e)
+            self.state = self.FAILED
+            print(f"Failed to load face recognition services: {e}")
+        finally:
+            self._done.set()
+
+    def is_ready(self):
+        return self.state == self.READY
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def elapsed(self):
+        """Seconds since loading started."""
+        return time.perf_counter() - self._started_at if self._started_at else 0.0
+
+    def wait(self, timeout=None):
+        """Blocks until loading finished; returns True if the services are ready."""
+        self._done.wait(timeout)
+        return self.is_ready()
+
+    def format_timings(self):
+        """One-line startup breakdown, e.g. 'Startup: imports 7.9s, detector 1.1s, ... (total 12.4s)'."""
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.timings.items() if phase != "total")
+        return f"Startup: {phases} (total {self.timings.get('total', 0.0):.2f}s)"
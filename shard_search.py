@@ -0,0 +1,447 @@
+"""
+Sharded gallery search. The gallery is partitioned by criminal id over shard
+servers, each holding its own FAISS index in its own process, so neither the
+RAM nor the search throughput of one process caps the watchlist size.
+
+Shards are either local worker processes started by the coordinator or
+servers on other machines, started there with:
+
+    python shard_search.py --host 0.0.0.0 --port 7001
+
+Both speak the same protocol over an authenticated multiprocessing socket.
+Messages are pickled, so remote shards must only be reachable from a trusted
+network and share SEARCH_SHARD_AUTHKEY with the coordinator.
+
+A shard's contents are decided by its coordinator, so a shard server accepts
+one coordinator at a time and refuses others until it leaves.
+"""
+import argparse
+import hashlib
+import os
+import secrets
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+import numpy as np
+import faiss
+from index_factory import IndexConfig, create_index, min_training_size, reconstruct_vectors, supports_removal
+
+
+def rendezvous_weight(shard_name, criminal_id):
+    digest = hashlib.blake2b(f"{shard_name}/{criminal_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def merge_results(results, k):
+    """
+    Merges per-shard (similarities, ids) search results into the global top-k.
+    Missing neighbours are padded the way FAISS pads them (id -1).
+    """
+    similarities = np.concatenate([s for s, _ in results], axis=1)
+    ids = np.concatenate([i for _, i in results], axis=1)
+    if similarities.shape[1] < k:
+        padding = k - similarities.shape[1]
+        similarities = np.pad(similarities, ((0, 0), (0, padding)), constant_values=-np.inf)
+        ids = np.pad(ids, ((0, 0), (0, padding)), constant_values=-1)
+    order = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(similarities, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class Shard:
+    """Server side of one shard: a FAISS index of part of the gallery."""
+    def __init__(self):
+        self.config = None
+        self.dimension = None
+        self.index = None
+        self.index_type = None
+        self.ids = set()
+
+    def handle(self, command, *args):
+        return getattr(self, f"do_{command}")(*args)
+
+    def do_configure(self, config_values, dimension):
+        # A new coordinator always starts from an empty shard and refills it
+        self.config = IndexConfig(**config_values)
+        self.dimension = dimension
+        self.index, self.index_type = create_index(self.config, dimension)
+        self.ids = set()
+        return None
+
+    def do_build(self, ids, vectors):
+        """Replaces the shard's contents, training the configured backend on them."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)
+        self.index, self.index_type = create_index(self.config, self.dimension, vectors if len(ids) else None)
+        if len(ids):
+            self.index.add_with_ids(vectors, ids)
+        self.ids = set(ids.tolist())
+        return self.index_type
+
+    def do_add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)
+        if self.index_type != self.config.index_type and len(self.ids) + len(ids) >= min_training_size(self.config):
+            # Started on the flat fallback; now there is enough data to train the real backend
+            all_ids = np.array(sorted(self.ids), dtype=np.int64)
+            return self.do_build(np.concatenate([all_ids, ids]),
+                                 np.concatenate([reconstruct_vectors(self.index, all_ids), vectors]))
+        self.index.add_with_ids(vectors, ids)
+        self.ids.update(ids.tolist())
+        return self.index_type
+
+    def do_remove(self, ids):
+        ids = [i for i in ids if i in self.ids]
+        if not ids:
+            return 0
+        self.ids.difference_update(ids)
+        if supports_removal(self.index):
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+        else:
+            # HNSW cannot delete in place, so rebuild it from the vectors it still holds
+            remaining = np.array(sorted(self.ids), dtype=np.int64)
+            self.do_build(remaining, reconstruct_vectors(self.index, remaining))
+        return len(ids)
+
+    def do_take(self, ids):
+        """Removes the given vectors and returns them, for moving them to another shard."""
+        vectors = reconstruct_vectors(self.index, ids)
+        self.do_remove(list(ids))
+        return vectors
+
+    def do_reconstruct(self, ids):
+        return reconstruct_vectors(self.index, ids)
+
+    def do_search(self, queries, k):
+        if self.index.ntotal == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        return self.index.search(queries, min(k, self.index.ntotal))
+
+    def do_stats(self):
+        return {"embeddings": int(self.index.ntotal), "index_type": self.index_type}
+
+
+def serve_coordinator(conn, shard):
+    """Answers one coordinator's requests until it closes the connection."""
+    with conn:
+        while True:
+            try:
+                command, args = conn.recv()
+            except (EOFError, OSError):
+                break
+            if command == "close":
+                break
+            try:
+                conn.send(("ok", shard.handle(command, *args)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def serve(host, port, authkey, once=False, threads=0):
+    """
+    Runs a shard server. A shard belongs to one coordinator at a time, since
+    the coordinator decides its contents; while one is attached, other
+    connections are refused with an error instead of waiting or overwriting
+    the gallery. With once set (local worker processes) the server exits when
+    its coordinator leaves. threads limits FAISS's search threads (0 keeps
+    its default of all cores).
+    """
+    if threads > 0:
+        faiss.omp_set_num_threads(threads)
+    shard = Shard()
+    attached = threading.Lock()
+
+    def run(conn):
+        try:
+            serve_coordinator(conn, shard)
+        finally:
+            attached.release()
+
+    with Listener((host, port), authkey=authkey) as listener:
+        bound_host, bound_port = listener.address
+        # The coordinator of a local worker reads the port it was given from here
+        print(f"SHARD_READY {bound_host} {bound_port}", flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"Rejected search shard connection: {e}", file=sys.stderr)
+                continue
+            if once:
+                serve_coordinator(conn, shard)
+                return
+            if not attached.acquire(blocking=False):
+                with conn:
+                    conn.recv()
+                    conn.send(("error", "this shard is already serving another coordinator"))
+                continue
+            threading.Thread(target=run, args=(conn,), name="shard-coordinator", daemon=True).start()
+
+
+class ShardClient:
+    """Coordinator side of the connection to one shard."""
+    def __init__(self, name, address, authkey, process=None):
+        self.name = name
+        self.address = address
+        self.process = process
+        self.count = 0
+        self._conn = Client(address, authkey=authkey)
+
+    def send(self, command, *args):
+        self._conn.send((command, args))
+
+    def receive(self):
+        status, payload = self._conn.recv()
+        if status == "error":
+            raise RuntimeError(f"Search shard {self.name} failed: {payload}")
+        return payload
+
+    def call(self, command, *args):
+        self.send(command, *args)
+        return self.receive()
+
+    def close(self):
+        try:
+            self.send("close")
+            self._conn.close()
+        except OSError:
+            pass
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class ShardedIndex:
+    """
+    Gallery index partitioned by criminal id across shard processes.
+    All embeddings of one criminal live on the same shard, chosen by
+    rendezvous hashing of the criminal id, so adding a shard only moves the
+    criminals that now hash to it. Batched queries are sent to every shard at
+    once and the per-shard top-k lists are merged into the global top-k.
+    Offers the parts of the FAISS index API that FaceService searches and
+    maintains the gallery with (ntotal, d, search, remove_ids,
+    reconstruct_batch); vectors are added with add_with_owners or build.
+    """
+    def __init__(self, config, dimension, local_shards=0, addresses=(), authkey=None):
+        self.config = config
+        self.d = dimension
+        # Local workers get a fresh random key; remote shards must share the configured one
+        self.authkey = authkey or secrets.token_bytes(32)
+        self.shards = []
+        self._owners = {}          # embedding id -> criminal id
+        self._criminal_shard = {}  # criminal id -> index into self.shards
+        self._lock = threading.Lock()
+
+        # Local workers share this machine's cores instead of each claiming all of them
+        self.local_threads = max(1, (os.cpu_count() or 1) // max(1, local_shards))
+        try:
+            for _ in range(local_shards):
+                self.shards.append(self._start_local())
+            for address in addresses:
+                self.shards.append(self._connect(address))
+        except Exception:
+            self.close()
+            raise
+        if not self.shards:
+            raise ValueError("A sharded index needs at least one shard.")
+
+    @classmethod
+    def from_env(cls, config, dimension):
+        """
+        Builds a sharded index from SEARCH_SHARDS: a number of local worker
+        processes, or a comma-separated list of host:port shard servers.
+        Returns None when SEARCH_SHARDS is empty and search stays in-process.
+        """
+        spec = (os.getenv("SEARCH_SHARDS") or "").strip()
+        if not spec:
+            return None
+        if spec.isdigit():
+            return cls(config, dimension, local_shards=int(spec))
+        authkey = os.getenv("SEARCH_SHARD_AUTHKEY")
+        if not authkey:
+            raise ValueError("SEARCH_SHARD_AUTHKEY must be set to use remote search shards.")
+        return cls(config, dimension, addresses=[parse_address(item) for item in spec.split(",") if item.strip()],
+                   authkey=authkey.encode())
+
+    @property
+    def ntotal(self):
+        return len(self._owners)
+
+    def describe(self):
+        return f"sharded({len(self.shards)} x {self.config.describe()})"
+
+    def shard_sizes(self):
+        """Embeddings held by every shard, by shard name."""
+        return {shard.name: shard.count for shard in self.shards}
+
+    def _start_local(self):
+        """Starts a shard server on a free localhost port and connects to it."""
+        env = dict(os.environ, SEARCH_SHARD_AUTHKEY=self.authkey.hex())
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--host", "127.0.0.1", "--port", "0", "--once", "--hex-authkey",
+             "--threads", str(self.local_threads)],
+            stdout=subprocess.PIPE, env=env, text=True
+        )
+        ready = process.stdout.readline().split()
+        if len(ready) != 3 or ready[0] != "SHARD_READY":
+            process.kill()
+            raise RuntimeError("Search shard worker did not start.")
+        name = f"local-{len(self.shards)}"
+        return self._connect((ready[1], int(ready[2])), name, process)
+
+    def _connect(self, address, name=None, process=None):
+        shard = ShardClient(name or f"{address[0]}:{address[1]}", address, self.authkey, process)
+        shard.call("configure", vars(self.config), self.d)
+        return shard
+
+    def _shard_of(self, criminal_id):
+        shard_index = self._criminal_shard.get(criminal_id)
+        if shard_index is None:
+            shard_index = max(range(len(self.shards)), key=lambda i: rendezvous_weight(self.shards[i].name, criminal_id))
+            self._criminal_shard[criminal_id] = shard_index
+        return shard_index
+
+    def _group(self, ids, owners):
+        """Splits embedding ids (and their positions) by the shard their criminal lives on."""
+        groups = {}
+        for position, (embedding_id, criminal_id) in enumerate(zip(ids, owners)):
+            groups.setdefault(self._shard_of(criminal_id), []).append(position)
+        return groups
+
+    def _broadcast(self, calls):
+        """Sends {shard index: (command, args)} to all shards first, then collects the replies."""
+        for shard_index, (command, args) in calls.items():
+            self.shards[shard_index].send(command, *args)
+        return {shard_index: self.shards[shard_index].receive() for shard_index in calls}
+
+    def build(self, ids, owners, vectors):
+        """Replaces the whole gallery, training every shard on its own part."""
+        ids = np.asarray(ids, dtype=np.int64)
+        owners = [int(o) for o in owners]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.d)
+        with self._lock:
+            self._owners = {}
+            groups = self._group(ids, owners)
+            calls = {}
+            for shard_index in range(len(self.shards)):
+                positions = groups.get(shard_index, [])
+                calls[shard_index] = ("build", (ids[positions], vectors[positions]))
+                self.shards[shard_index].count = len(positions)
+            self._broadcast(calls)
+            self._owners = dict(zip(ids.tolist(), owners))
+
+    def add_with_owners(self, vectors, ids, owners):
+        ids = np.asarray(ids, dtype=np.int64)
+        owners = [int(o) for o in owners]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.d)
+        with self._lock:
+            groups = self._group(ids, owners)
+            self._broadcast({shard_index: ("add", (ids[positions], vectors[positions]))
+                             for shard_index, positions in groups.items()})
+            for shard_index, positions in groups.items():
+                self.shards[shard_index].count += len(positions)
+            self._owners.update(zip(ids.tolist(), owners))
+
+    def remove_ids(self, ids):
+        with self._lock:
+            ids = [int(i) for i in np.asarray(ids).ravel() if int(i) in self._owners]
+            groups = self._group(ids, [self._owners[i] for i in ids])
+            self._broadcast({shard_index: ("remove", ([ids[p] for p in positions],))
+                             for shard_index, positions in groups.items()})
+            for shard_index, positions in groups.items():
+                self.shards[shard_index].count -= len(positions)
+            for embedding_id in ids:
+                del self._owners[embedding_id]
+            return len(ids)
+
+    def reconstruct_batch(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.empty((len(ids), self.d), dtype=np.float32)
+        with self._lock:
+            groups = self._group(ids.tolist(), [self._owners[i] for i in ids.tolist()])
+            replies = self._broadcast({shard_index: ("reconstruct", (ids[positions],))
+                                       for shard_index, positions in groups.items()})
+        for shard_index, positions in groups.items():
+            vectors[positions] = replies[shard_index]
+        return vectors
+
+    def search(self, queries, k):
+        """Searches every shard with the whole batch in parallel and merges their top-k lists."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        with self._lock:
+            replies = self._broadcast({shard_index: ("search", (queries, k)) for shard_index in range(len(self.shards))})
+        return merge_results(list(replies.values()), k)
+
+    def add_shard(self, address=None):
+        """
+        Adds a shard (a new local worker, or the shard server at host:port)
+        and moves over the criminals that now hash to it.
+        Returns the number of embeddings moved.
+        """
+        with self._lock:
+            if address is None:
+                shard = self._start_local()
+            else:
+                shard = self._connect(parse_address(address) if isinstance(address, str) else address)
+            self.shards.append(shard)
+            new_index = len(self.shards) - 1
+
+            # With rendezvous hashing a criminal either stays put or moves to the new shard
+            moving = set()
+            for criminal_id in self._criminal_shard:
+                if rendezvous_weight(shard.name, criminal_id) > \
+                        rendezvous_weight(self.shards[self._criminal_shard[criminal_id]].name, criminal_id):
+                    moving.add(criminal_id)
+            by_shard = {}
+            for embedding_id, criminal_id in self._owners.items():
+                if criminal_id in moving:
+                    by_shard.setdefault(self._criminal_shard[criminal_id], []).append(embedding_id)
+            if not by_shard:
+                return 0
+
+            taken = self._broadcast({shard_index: ("take", (np.asarray(ids, dtype=np.int64),))
+                                     for shard_index, ids in by_shard.items()})
+            moved_ids = np.concatenate([np.asarray(by_shard[shard_index], dtype=np.int64) for shard_index in by_shard])
+            moved_vectors = np.concatenate([taken[shard_index] for shard_index in by_shard])
+            shard.call("build", moved_ids, moved_vectors)
+            for shard_index, ids in by_shard.items():
+                self.shards[shard_index].count -= len(ids)
+            shard.count = len(moved_ids)
+            for criminal_id in moving:
+                self._criminal_shard[criminal_id] = new_index
+            return len(moved_ids)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+
+
+def parse_address(text):
+    host, _, port = text.strip().rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a search shard server for a sharded gallery index.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=7001, help="Port to listen on (0 picks a free one).")
+    parser.add_argument("--once", action="store_true", help="Exit when the first coordinator disconnects.")
+    parser.add_argument("--threads", type=int, default=0, help="FAISS search threads (default: all cores).")
+    parser.add_argument("--hex-authkey", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not args.hex_authkey:
+        # Local workers get their key from the coordinator; remote servers read it from .env
+        from dotenv import load_dotenv
+        load_dotenv()
+    authkey = os.getenv("SEARCH_SHARD_AUTHKEY")
+    if not authkey:
+        parser.error("SEARCH_SHARD_AUTHKEY must be set.")
+    serve(args.host, args.port, bytes.fromhex(authkey) if args.hex_authkey else authkey.encode(), args.once, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import re
+import time
+import queue
+import threading
+from datetime import datetime
+import cv2
+import pymysql
+
+# Errors of the connection rather than of the rows; the same batch may succeed later
+TRANSIENT_ERRORS = (pymysql.OperationalError, pymysql.InterfaceError)
+
+
+class SightingsLog:
+    """
+    Write-behind log of recognized faces. record() only puts the sighting on
+    an in-process queue, so the detection loop never waits for MySQL.
+    A background writer debounces repeated hits of the same criminal on the
+    same camera: a hit is logged only if that criminal was not seen on that
+    camera during the previous debounce_seconds. The remaining rows are
+    flushed with one batched INSERT every flush_interval seconds, or as soon
+    as batch_size rows are waiting.
+    With thumbnail_dir set, a small JPEG of each logged face is written there
+    and its path is stored with the row.
+    """
+    def __init__(self, db_service, metrics=None, debounce_seconds=10.0, flush_interval=2.0, batch_size=200,
+                 queue_size=10000, thumbnail_dir=None, thumbnail_size=112):
+        self.db_service = db_service
+        self.debounce_seconds = debounce_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = queue_size
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_size = thumbnail_size
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = []
+        self._last_seen = {}  # (criminal id, camera) -> monotonic time of the latest hit
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.logged = self.debounced = self.dropped = None
+        self.flush_seconds = None
+        if metrics is not None:
+            self.logged = metrics.counter("sightings_total", "Recognitions by what happened to them.", outcome="logged")
+            self.debounced = metrics.counter("sightings_total", outcome="debounced")
+            self.dropped = metrics.counter("sightings_total", outcome="dropped")
+            self.flush_seconds = metrics.histogram("sightings_flush_seconds", "Time to write one batch of sightings.")
+            metrics.gauge("sightings_queue_depth", self._queue.qsize, "Sightings waiting for the writer.")
+
+    @classmethod
+    def from_env(cls, db_service, metrics=None):
+        """Builds a log configured by the SIGHTINGS_* settings in .env."""
+        return cls(
+            db_service, metrics,
+            debounce_seconds=float(os.getenv("SIGHTINGS_DEBOUNCE_SECONDS") or 10),
+            flush_interval=float(os.getenv("SIGHTINGS_FLUSH_INTERVAL") or 2),
+            batch_size=int(os.getenv("SIGHTINGS_BATCH_SIZE") or 200),
+            thumbnail_dir=os.getenv("SIGHTINGS_THUMBNAIL_DIR") or None,
+        )
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sightings-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stops the writer after it has flushed everything already recorded."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def record(self, criminal_id, camera, score, face_img=None):
+        """
+        Queues a sighting without blocking. face_img is only needed for
+        thumbnails. Returns False if the queue was full and the sighting was dropped.
+        """
+        if face_img is not None and self.thumbnail_dir:
+            # The frame may be reused once the caller moves on
+            face_img = face_img.copy()
+        else:
+            face_img = None
+        try:
+            self._queue.put_nowait((int(criminal_id), str(camera), float(score), datetime.now(), time.monotonic(), face_img))
+            return True
+        except queue.Full:
+            self._count(self.dropped)
+            return False
+
+    def _count(self, counter, amount=1):
+        if counter is not None:
+            counter.inc(amount)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            stopping = self._stop_event.is_set()
+            try:
+                self._accept(self._queue.get(timeout=max(0.0, min(0.1, next_flush - time.monotonic()))))
+                # Drain whatever else is waiting without blocking
+                while len(self._pending) < self.batch_size:
+                    self._accept(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if len(self._pending) >= self.batch_size or now >= next_flush or stopping:
+                self._flush()
+                self._forget_stale(now)
+                next_flush = now + self.flush_interval
+            if stopping and self._queue.empty():
+                break
+
+    def _accept(self, item):
+        criminal_id, camera, score, seen_at, seen_monotonic, face_img = item
+        key = (criminal_id, camera)
+        last_seen = self._last_seen.get(key)
+        self._last_seen[key] = seen_monotonic
+        if last_seen is not None and seen_monotonic - last_seen < self.debounce_seconds:
+            self._count(self.debounced)
+            return
+        thumbnail_path = self._write_thumbnail(criminal_id, camera, seen_at, face_img) if face_img is not None else None
+        self._pending.append((criminal_id, camera, seen_at, score, thumbnail_path))
+
+    def _write_thumbnail(self, criminal_id, camera, seen_at, face_img):
+        safe_camera = re.sub(r"[^A-Za-z0-9]+", "_", camera).strip("_")[-40:] or "camera"
+        directory = os.path.join(self.thumbnail_dir, seen_at.strftime("%Y%m%d"))
+        path = os.path.join(directory, f"{criminal_id}_{safe_camera}_{seen_at.strftime('%H%M%S_%f')}.jpg")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            scale = self.thumbnail_size / max(face_img.shape[:2])
+            if scale < 1.0:
+                face_img = cv2.resize(face_img, (max(1, int(face_img.shape[1] * scale)), max(1, int(face_img.shape[0] * scale))),
+                                      interpolation=cv2.INTER_AREA)
+            if not cv2.imwrite(path, cv2.cvtColor(face_img, cv2.COLOR_RGB2BGR)):
+                return None
+        except (OSError, cv2.error) as e:
+            print(f"Could not write sighting thumbnail: {e}")
+            return None
+        return path
+
+    def _flush(self):
+        if not self._pending:
+            return
+        start = time.perf_counter()
+        try:
+            self.db_service.insert_sightings(self._pending)
+        except TRANSIENT_ERRORS as e:
+            print(f"Could not write {len(self._pending)} sightings, retrying later: {e}")
+            self._keep_pending()
+            return
+        except Exception as e:
+            # A bad row (say, of a criminal deleted meanwhile) would fail every
+            # retry, so write the rows one by one and drop the ones that fail
+            print(f"Could not write {len(self._pending)} sightings, writing them one by one: {e}")
+            self._flush_rows()
+            return
+        if self.flush_seconds is not None:
+            self.flush_seconds.observe(time.perf_counter() - start)
+        self._count(self.logged, len(self._pending))
+        self._pending = []
+
+    def _flush_rows(self):
+        written = failed = 0
+        for position, row in enumerate(self._pending):
+            try:
+                self.db_service.insert_sightings([row])
+            except TRANSIENT_ERRORS as e:
+                print(f"Could not write {len(self._pending) - position} sightings, retrying later: {e}")
+                del self._pending[:position]
+                self._keep_pending()
+                break
+            except Exception as e:
+                print(f"Dropped sighting of criminal {row[0]} on {row[1]}: {e}")
+                failed += 1
+            else:
+                written += 1
+        else:
+            self._pending = []
+        self._count(self.logged, written)
+        self._count(self.dropped, failed)
+
+    def _keep_pending(self):
+        """Keeps the unwritten rows for the next flush, but never lets them grow without bound."""
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self._count(self.dropped, overflow)
+
+    def _forget_stale(self, now):
+        """Drops debounce entries whose window has passed, so the map does not grow forever."""
+        stale = [key for key, seen in self._last_seen.items() if now - seen >= self.debounce_seconds]
+        for key in stale:
+            del self._last_seen[key]
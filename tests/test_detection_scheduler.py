@@ -0,0 +1,32 @@
+import numpy as np
+from detection_scheduler import DetectionScheduler
+
+
+class MovingFaceDetector:
+    """Reports one face moving right at a constant speed, one step per frame it is shown."""
+    def __init__(self, speed):
+        self.speed = speed
+        self.frame = 0
+
+    def position(self):
+        return 100 + self.speed * self.frame
+
+    def detect_faces(self, image_rgb):
+        return [{'box': [self.position(), 50, 40, 40], 'confidence': 0.99, 'keypoints': {}}]
+
+
+def test_extrapolated_boxes_follow_constant_speed():
+    scheduler = DetectionScheduler(detection_width=0, min_interval=4, max_interval=4)
+    detector = MovingFaceDetector(speed=3)
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+
+    errors = []
+    for index in range(60):
+        detector.frame = index
+        faces, detected = scheduler.process(detector, frame)
+        if not detected and index > 20:
+            errors.append(abs(faces[0]['box'][0] - detector.position()))
+
+    assert scheduler.interval == 4
+    assert errors
+    assert max(errors) <= 2
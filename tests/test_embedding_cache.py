@@ -0,0 +1,43 @@
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+
+def vector(value, dimension=8):
+    return np.full(dimension, value, dtype=np.float32)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = EmbeddingCache("model", 8, memory_entries=2)
+    cache.put("a", vector(1))
+    cache.put("b", vector(2))
+    assert cache.get("a")[0] == 1  # "b" is now the least recently used
+    cache.put("c", vector(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == 1 and cache.get("c")[0] == 3
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1 and stats["memory_hits"] == 3 and stats["misses"] == 1
+
+
+def test_keys_change_with_pixels_size_and_landmarks():
+    cache = EmbeddingCache("model", 8)
+    crop = np.zeros((4, 4, 3), dtype=np.uint8)
+    key = cache.make_key(crop, (112, 112))
+
+    assert key == cache.make_key(crop.copy(), (112, 112))
+    assert key != cache.make_key(crop + 1, (112, 112))
+    assert key != cache.make_key(crop, (160, 160))
+    assert key != cache.make_key(crop, (112, 112), {"left_eye": (1, 1), "right_eye": (3, 1)})
+    assert key != EmbeddingCache("other", 8).make_key(crop, (112, 112))
+
+
+def test_disk_tier_survives_restarts_and_stays_within_its_size(tmp_path):
+    cache = EmbeddingCache("model", 8, memory_entries=0, disk_dir=str(tmp_path), disk_max_bytes=2 * 8 * 4)
+    for key, value in (("aa1", 1), ("bb2", 2), ("cc3", 3)):
+        cache.put(key, vector(value))
+
+    reopened = EmbeddingCache("model", 8, memory_entries=0, disk_dir=str(tmp_path))
+    assert reopened.get("aa1") is None
+    assert reopened.get("bb2")[0] == 2 and reopened.get("cc3")[0] == 3
+    assert reopened.get_stats()["disk_entries"] == 2
+    assert not [path for path in tmp_path.rglob("*.tmp")]
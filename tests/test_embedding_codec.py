@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from embedding_codec import HEADER, decode_embedding, encode_embedding
+
+
+@pytest.fixture
+def embedding():
+    vector = np.random.default_rng(0).standard_normal(512).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("storage, item_size, tolerance", [("float32", 4, 0.0), ("float16", 2, 1e-3), ("int8", 1, 2e-3)])
+def test_round_trip(embedding, storage, item_size, tolerance):
+    blob = encode_embedding(embedding, storage)
+    decoded = decode_embedding(blob)
+
+    assert decoded.dtype == np.float32 and decoded.shape == (512,)
+    assert np.abs(decoded - embedding).max() <= tolerance
+    assert len(blob) == HEADER.size + (4 if storage == "int8" else 0) + 512 * item_size
+
+
+def test_headerless_blobs_are_legacy_float32(embedding):
+    assert np.array_equal(decode_embedding(embedding.tobytes()), embedding)
+
+
+def test_raw_blob_starting_with_the_magic_bytes_is_still_read_as_float32():
+    raw = np.frombuffer(b"FE" + bytes(2046), dtype=np.float32)
+    assert np.array_equal(decode_embedding(raw.tobytes()), raw, equal_nan=True)
+
+
+def test_malformed_and_unknown_input():
+    assert decode_embedding(b"") is None
+    assert decode_embedding(None) is None
+    assert decode_embedding(b"\x00\x01\x02") is None
+    with pytest.raises(ValueError):
+        encode_embedding(np.zeros(4), "bfloat16")
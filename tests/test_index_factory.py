@@ -0,0 +1,14 @@
+import numpy as np
+from index_factory import IndexConfig, create_index, index_type_of
+
+
+def test_index_type_of_reports_the_built_backend():
+    vectors = np.random.default_rng(0).standard_normal((300, 16)).astype(np.float32)
+    for index_type in ("flat", "sq8", "sq_fp16", "ivf_flat", "hnsw"):
+        index, built_type = create_index(IndexConfig(index_type, nlist=4), 16, vectors)
+        assert index_type_of(index) == built_type == index_type
+
+
+def test_index_type_of_sees_the_flat_fallback():
+    index, built_type = create_index(IndexConfig("ivf_flat", nlist=64), 16, np.zeros((10, 16), dtype=np.float32))
+    assert built_type == "flat" and index_type_of(index) == "flat"
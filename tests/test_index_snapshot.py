@@ -0,0 +1,55 @@
+import numpy as np
+from index_factory import IndexConfig, create_index
+from index_snapshot import IndexSnapshot, SnapshotMap
+
+
+def test_snapshot_map_overlays_changes_on_sorted_arrays():
+    owners = SnapshotMap.from_pairs([30, 10, 20], [3, 1, 2])
+    owners[40] = 4
+    owners[20] = 5
+    assert owners.pop(10) == 1
+    assert owners.pop(10, None) is None
+
+    assert 10 not in owners and 40 in owners
+    assert owners[20] == 5 and owners.get(30) == 3 and owners.get(99, -1) == -1
+    assert len(owners) == 3
+    assert dict(owners.items()) == {20: 5, 30: 3, 40: 4}
+    keys, values = owners.arrays()
+    assert keys.tolist() == [20, 30, 40] and values.tolist() == [5, 3, 4]
+
+
+def test_snapshot_round_trip_is_memory_mapped(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((6, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index, _ = create_index(IndexConfig("flat"), 8)
+    index.add_with_ids(vectors, np.arange(100, 106))
+    snapshot = IndexSnapshot(str(tmp_path))
+    snapshot.save(index, [105, 100, 101, 102, 103, 104], [2, 1, 1, 1, 2, 2], [2, 1], ["Bob", "Alice"],
+                  {"embeddings": 6}, None, "flat")
+
+    loaded, error = snapshot.load("flat")
+
+    assert error is None and loaded["mapped"]
+    assert isinstance(loaded["ids"], np.memmap) and loaded["ids"].tolist() == list(range(100, 106))
+    labels = SnapshotMap(loaded["criminal_ids"], loaded["labels"])
+    owners = SnapshotMap(loaded["ids"], loaded["owners"])
+    assert labels[owners[105]] == "Bob" and labels[owners[100]] == "Alice"
+    assert loaded["index"].search(vectors[:1], 1)[1][0, 0] == 100
+    assert snapshot.load("hnsw")[1] == "Index snapshot was built with different index settings."
+
+
+def test_save_keeps_the_mapped_generation(tmp_path):
+    index, _ = create_index(IndexConfig("flat"), 4)
+    snapshot = IndexSnapshot(str(tmp_path))
+    snapshot.save(index, [], [], [], [], None, None, "flat")
+    snapshot.load("flat")
+    mapped = snapshot.mapped_generation
+
+    snapshot.save(index, [], [], [], [], None, None, "flat")
+    snapshot.save(index, [], [], [], [], None, None, "flat")
+    generations = [name for name in tmp_path.iterdir() if name.name.startswith("gen-")]
+    assert mapped in [name.name for name in generations] and len(generations) == 2
+
+    snapshot.release()
+    snapshot.save(index, [], [], [], [], None, None, "flat")
+    assert len([name for name in tmp_path.iterdir() if name.name.startswith("gen-")]) == 1
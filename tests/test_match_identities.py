@@ -0,0 +1,79 @@
+import types
+import numpy as np
+import pytest
+import face_service
+from face_service import FaceService
+
+DIMENSION = 512
+
+
+class EmptyGallery:
+    """Stands in for DatabaseService with no criminals registered."""
+    def stream_embeddings(self, since=None, chunk_size=1000):
+        return iter(())
+
+    def fetch_embedding_ids(self):
+        return set()
+
+    def get_criminals_version(self):
+        return {"embeddings": 0}
+
+
+def unit(vector):
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """A FaceService without models, holding three photos of Alice and one of Bob."""
+    monkeypatch.setenv("INDEX_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setenv("EMBEDDING_CACHE_SIZE", "0")
+    monkeypatch.setenv("FAISS_INDEX_TYPE", "flat")
+    monkeypatch.delenv("SEARCH_SHARDS", raising=False)
+    monkeypatch.setattr(face_service, "create_detector", lambda: None)
+    monkeypatch.setattr(face_service, "create_embedding_engine",
+                        lambda model_name: types.SimpleNamespace(input_size=(112, 112), model_id="stub"))
+    service = FaceService(EmptyGallery(), sharded=False)
+
+    axes = np.eye(DIMENSION, dtype=np.float32)
+    alice = [unit(axes[0] + 0.2 * axes[1]), unit(axes[0] - 0.2 * axes[1]), unit(axes[2])]
+    bob = [unit(axes[0] + 0.1 * axes[3])]
+    service.add_embeddings([1, 2, 3, 4], [10, 10, 10, 20], ["Alice", "Alice", "Alice", "Bob"], alice + bob)
+    return service
+
+
+def test_max_takes_the_best_hit(service):
+    ids, scores = service.match_identities([np.eye(DIMENSION, dtype=np.float32)[0]], aggregation="max")
+    assert ids.tolist() == [20] and scores[0] == pytest.approx(1 / np.sqrt(1.01))
+
+
+def test_mean_averages_the_hits_of_each_criminal(service):
+    axes = np.eye(DIMENSION, dtype=np.float32)
+    query = unit(axes[0] + 0.2 * axes[1])
+    assert service.match_identities([query], k=4, aggregation="max")[0].tolist() == [10]
+    assert service.match_identities([query], k=2, aggregation="mean")[0].tolist() == [10]
+
+    # With all of her photos among the hits, Alice's unlike third photo pulls her mean below Bob
+    ids, scores = service.match_identities([query], k=4, aggregation="mean")
+    assert ids.tolist() == [20] and scores[0] == pytest.approx(float(query @ unit(axes[0] + 0.1 * axes[3])))
+
+
+def test_centroid_rescores_against_each_criminals_mean(service):
+    axes = np.eye(DIMENSION, dtype=np.float32)
+    query = unit(axes[0] + axes[2])
+    ids, scores = service.match_identities([query], aggregation="centroid")
+    centroid = unit(np.mean([unit(axes[0] + 0.2 * axes[1]), unit(axes[0] - 0.2 * axes[1]), axes[2]], axis=0))
+    assert ids.tolist() == [10] and scores[0] == pytest.approx(float(query @ centroid), abs=1e-5)
+
+
+def test_search_faces_applies_the_threshold(service):
+    service.recognition_threshold = 0.9
+    axes = np.eye(DIMENSION, dtype=np.float32)
+    results = service.search_faces([axes[2], axes[5]])
+    assert results[0][0] == "Alice" and results[1][0] == "Unknown"
+
+
+def test_removed_criminal_is_no_longer_matched(service):
+    service.remove_criminal(20)
+    ids, _ = service.match_identities([np.eye(DIMENSION, dtype=np.float32)[0]], aggregation="max")
+    assert ids.tolist() == [10] and 20 not in service.known_labels
@@ -0,0 +1,49 @@
+import pymysql
+from sightings_log import SightingsLog
+
+
+class FlakyDatabase:
+    """Rejects rows of unknown criminals; fails whole batches while disconnected."""
+    def __init__(self, known_criminals):
+        self.known_criminals = known_criminals
+        self.connected = True
+        self.rows = []
+
+    def insert_sightings(self, rows):
+        if not self.connected:
+            raise pymysql.OperationalError(2013, "Lost connection to MySQL server")
+        if any(row[0] not in self.known_criminals for row in rows):
+            raise pymysql.IntegrityError(1452, "Cannot add or update a child row")
+        self.rows.extend(rows)
+
+
+def record(log, criminal_id, camera="cam"):
+    log._accept((criminal_id, camera, 0.9, None, float(len(log._pending)), None))
+
+
+def test_bad_row_is_dropped_and_the_rest_written():
+    db = FlakyDatabase(known_criminals={1, 2})
+    log = SightingsLog(db, debounce_seconds=0)
+    for criminal_id in (1, 3, 2):
+        record(log, criminal_id)
+
+    log._flush()
+
+    assert [row[0] for row in db.rows] == [1, 2]
+    assert log._pending == []
+
+
+def test_lost_connection_keeps_the_batch():
+    db = FlakyDatabase(known_criminals={1, 2})
+    log = SightingsLog(db, debounce_seconds=0)
+    for criminal_id in (1, 2):
+        record(log, criminal_id)
+
+    db.connected = False
+    log._flush()
+    assert len(log._pending) == 2 and db.rows == []
+
+    db.connected = True
+    log._flush()
+    assert [row[0] for row in db.rows] == [1, 2]
+    assert log._pending == []
@@ -0,0 +1,57 @@
+import numpy as np
+from tracker import FaceTracker, iou_matrix
+
+
+def test_iou_matrix():
+    ious = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]])
+    assert np.allclose(ious, [[1.0, 50 / 150, 0.0]])
+
+
+def test_boxes_keep_their_track_while_moving():
+    tracker = FaceTracker()
+    first = tracker.update([[10, 10, 40, 40], [200, 10, 40, 40]])
+    second = tracker.update([[204, 12, 40, 40], [14, 12, 40, 40]])
+
+    assert [t.track_id for t in first] == [1, 2]
+    assert [t.track_id for t in second] == [2, 1]
+    assert len(tracker.tracks) == 2
+
+
+def test_unmatched_box_starts_a_track_and_lost_tracks_expire():
+    tracker = FaceTracker(max_missed=2)
+    tracker.update([[10, 10, 40, 40]])
+    tracker.update([[300, 300, 40, 40]])
+    assert [t.track_id for t in tracker.tracks] == [1, 2]
+
+    tracker.update([[300, 300, 40, 40]])
+    tracker.update([[300, 300, 40, 40]])
+    assert [t.track_id for t in tracker.tracks] == [2]
+
+
+def test_re_embedding_is_due_on_new_tracks_intervals_and_better_crops():
+    tracker = FaceTracker(reembed_interval=5, unknown_reembed_interval=2, quality_upgrade=0.2)
+    track = tracker.update([[10, 10, 40, 40]])[0]
+    assert tracker.needs_embedding(track)
+
+    tracker.offer_crop(track, np.zeros((40, 40, 3), dtype=np.uint8), {}, 0.5)
+    tracker.assign_identity(track, "Alice", 0.9, track.best_quality)
+    assert track.best_crop is None and not tracker.needs_embedding(track)
+
+    tracker.update([[10, 10, 40, 40]])
+    tracker.offer_crop(track, np.zeros((40, 40, 3), dtype=np.uint8), {}, 0.8)
+    assert tracker.needs_embedding(track)
+
+    tracker.assign_identity(track, "Alice", 0.9, 0.8)
+    for _ in range(4):
+        tracker.update([[10, 10, 40, 40]])
+        assert not tracker.needs_embedding(track)
+    tracker.update([[10, 10, 40, 40]])
+    assert tracker.needs_embedding(track)
+
+
+def test_offer_crop_keeps_the_best_one():
+    tracker = FaceTracker()
+    track = tracker.update([[0, 0, 20, 20]])[0]
+    tracker.offer_crop(track, np.full((2, 2), 1), {"nose": (1, 1)}, 0.7)
+    tracker.offer_crop(track, np.full((2, 2), 2), {}, 0.4)
+    assert track.best_quality == 0.7 and track.best_crop[0, 0] == 1 and track.best_keypoints == {"nose": (1, 1)}
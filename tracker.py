@@ -0,0 +1,160 @@
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Computes the intersection-over-union of every pair of (x, y, w, h) boxes.
+    Returns an array of shape (len(boxes_a), len(boxes_b)).
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    intersection = inter_w * inter_h
+    union = (a[:, 2:3] * a[:, 3:4]) + (b[:, 2] * b[:, 3]) - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """A face followed across frames, with the identity it was last recognized as."""
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.last_seen = frame_index
+        self.hits = 1
+        self.match_iou = 1.0
+
+        self.name = "Unknown"
+        self.score = 0.0
+        self.last_embedded = None
+        self.embedded_quality = None
+
+        # Best crop seen since the track was last embedded
+        self.best_crop = None
+        self.best_keypoints = None
+        self.best_quality = None
+
+    def predict(self, frame_index):
+        """Box expected at frame_index under a constant-velocity motion model."""
+        return self.box + self.velocity * (frame_index - self.last_seen)
+
+    def update(self, box, frame_index, match_iou, smoothing):
+        box = np.asarray(box, dtype=np.float32)
+        elapsed = max(1, frame_index - self.last_seen)
+        observed_velocity = (box - self.box) / elapsed
+        self.velocity = smoothing * self.velocity + (1.0 - smoothing) * observed_velocity
+        self.box = box
+        self.last_seen = frame_index
+        self.hits += 1
+        self.match_iou = match_iou
+
+    def int_box(self):
+        x, y, w, h = self.box
+        return int(x), int(y), int(w), int(h)
+
+
+class FaceTracker:
+    """
+    Associates detected face boxes across frames so a person only has to be
+    embedded and searched when they first appear, periodically afterwards,
+    or when the association becomes uncertain.
+    Each track also keeps the best-quality crop offered since its last
+    embedding, which is what gets embedded when the track is due, and a crop
+    better than the embedded one by quality_upgrade makes it due early.
+    """
+    def __init__(self, iou_threshold=0.3, max_missed=15, reembed_interval=30, unknown_reembed_interval=10,
+                 reembed_iou=0.5, use_motion=True, velocity_smoothing=0.6, quality_upgrade=0.15):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reembed_interval = reembed_interval
+        self.unknown_reembed_interval = unknown_reembed_interval
+        self.reembed_iou = reembed_iou
+        self.use_motion = use_motion
+        self.velocity_smoothing = velocity_smoothing
+        self.quality_upgrade = quality_upgrade
+
+        self.tracks = []
+        self.frame_index = 0
+        self._next_track_id = 1
+
+    def update(self, boxes, frames=1):
+        """
+        Advances by frames (the real frames since the previous update) and
+        matches the detected boxes to existing tracks, so velocities stay in
+        pixels per real frame when not every frame is detected.
+        Unmatched boxes start new tracks and tracks unseen for max_missed frames are dropped.
+        Returns the tracks seen in this frame, in the order of the given boxes.
+        """
+        self.frame_index += max(1, int(frames))
+        boxes = [np.asarray(box, dtype=np.float32) for box in boxes]
+        assigned = [None] * len(boxes)
+
+        if self.tracks and boxes:
+            if self.use_motion:
+                predicted = [track.predict(self.frame_index) for track in self.tracks]
+            else:
+                predicted = [track.box for track in self.tracks]
+            ious = iou_matrix(predicted, boxes)
+
+            # Greedy assignment, best overlapping pairs first
+            used_tracks = set()
+            for flat_index in np.argsort(-ious, axis=None):
+                track_index, box_index = np.unravel_index(flat_index, ious.shape)
+                iou = ious[track_index, box_index]
+                if iou < self.iou_threshold:
+                    break
+                if track_index in used_tracks or assigned[box_index] is not None:
+                    continue
+                track = self.tracks[track_index]
+                track.update(boxes[box_index], self.frame_index, float(iou), self.velocity_smoothing)
+                used_tracks.add(track_index)
+                assigned[box_index] = track
+
+        for box_index, box in enumerate(boxes):
+            if assigned[box_index] is None:
+                track = Track(self._next_track_id, box, self.frame_index)
+                self._next_track_id += 1
+                self.tracks.append(track)
+                assigned[box_index] = track
+
+        self.tracks = [t for t in self.tracks if self.frame_index - t.last_seen <= self.max_missed]
+        return assigned
+
+    def needs_embedding(self, track):
+        """Whether a track seen in the current frame should be re-embedded now."""
+        if track.last_embedded is None:
+            return True
+        if track.match_iou < self.reembed_iou:
+            return True
+        if track.best_quality is not None and track.embedded_quality is not None and \
+                track.best_quality >= track.embedded_quality + self.quality_upgrade:
+            return True
+        interval = self.reembed_interval if track.name != "Unknown" else self.unknown_reembed_interval
+        return self.frame_index - track.last_embedded >= interval
+
+    def offer_crop(self, track, crop, keypoints, quality):
+        """Keeps the crop as the track's candidate for embedding if it beats the current one."""
+        if track.best_quality is None or quality >= track.best_quality:
+            # Copied so the candidate does not keep the whole frame alive
+            track.best_crop = crop.copy()
+            track.best_keypoints = keypoints
+            track.best_quality = float(quality)
+
+    def assign_identity(self, track, name, score, quality=None):
+        """Records the recognition result for a track in the current frame."""
+        track.name = name
+        track.score = float(score)
+        track.last_embedded = self.frame_index
+        track.embedded_quality = quality
+        track.best_crop = track.best_keypoints = track.best_quality = None
+
+    def reset(self):
+        self.tracks = []
+        self.frame_index = 0
@@ -1,8 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
+import os
+import time
 import cv2
-import numpy as np
+from detection_pipeline import DetectionPipeline, parse_sources
+from frame_renderer import FrameRenderer
 
 class HomeFrame(tk.Frame):
     """
@@ -11,13 +14,18 @@ class HomeFrame(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent, bg="#f0f0f0")
         self.controller = controller
-        self.face_service = controller.get_face_service()
+        # Set once the background loader has the models and index ready
+        self.face_service = None
         self.db_service = controller.get_db_service()
         
         # State variables
         self.captured_image_for_registration = None
         self.detection_running = False
-        self.cap = None
+        self.pipeline = None
+        # Display stage: frames are scaled into a canvas the size of the video
+        # label and shown through one PhotoImage that is pasted into each tick.
+        self.renderer = FrameRenderer()
+        self.video_photo = None
 
         # --- Main Layout ---
         self.grid_columnconfigure(0, weight=1)
@@ -30,6 +38,14 @@ class HomeFrame(tk.Frame):
         
         self.video_label = tk.Label(detection_frame, bg="black")
         self.video_label.pack(expand=True, fill="both")
+        self.video_label.bind("<Configure>", self.on_video_resize)
+
+        sources_row = tk.Frame(detection_frame)
+        sources_row.pack(pady=(10, 0), fill="x")
+        tk.Label(sources_row, text="Cameras:").pack(side="left")
+        self.sources_entry = tk.Entry(sources_row)
+        self.sources_entry.insert(0, os.getenv("CAMERA_SOURCES", "0"))
+        self.sources_entry.pack(side="left", fill="x", expand=True, padx=5)
 
         detection_controls = tk.Frame(detection_frame)
         detection_controls.pack(pady=10)
@@ -40,6 +56,20 @@ class HomeFrame(tk.Frame):
         self.stop_btn = tk.Button(detection_controls, text="Stop Detection", command=self.stop_detection, state="disabled")
         self.stop_btn.pack(side="left", padx=5)
 
+        tk.Label(detection_controls, text="Target FPS:").pack(side="left", padx=(15, 2))
+        self.target_fps_var = tk.StringVar(value=os.getenv("TARGET_FPS", "15"))
+        self.target_fps_spinbox = tk.Spinbox(detection_controls, from_=1, to=60, width=4,
+                                             textvariable=self.target_fps_var, command=self.apply_target_fps)
+        self.target_fps_spinbox.pack(side="left")
+        self.target_fps_spinbox.bind("<Return>", lambda e: self.apply_target_fps())
+
+        self.overlay_var = tk.BooleanVar(value=os.getenv("METRICS_OVERLAY", "0") == "1")
+        tk.Checkbutton(detection_controls, text="Stats overlay", variable=self.overlay_var,
+                       command=self.apply_overlay).pack(side="left", padx=(15, 0))
+
+        self.fps_label = tk.Label(detection_frame, text="", font=("Arial", 9), fg="grey")
+        self.fps_label.pack()
+
         # --- Right Frame: Registration ---
         reg_frame = tk.LabelFrame(self, text="Register New Criminal", padx=10, pady=10, font=("Arial", 14))
         reg_frame.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
@@ -62,15 +92,49 @@ class HomeFrame(tk.Frame):
         self.photo_preview_label = tk.Label(reg_frame, text="No photo selected", bg="lightgrey", width=20, height=10)
         self.photo_preview_label.grid(row=4, column=0, columnspan=2, pady=5)
         
-        register_btn = tk.Button(reg_frame, text="Register Criminal", command=self.register_criminal, bg="#28a745", fg="white")
-        register_btn.grid(row=5, column=0, columnspan=2, pady=10, sticky="ew")
+        self.register_btn = tk.Button(reg_frame, text="Register Criminal", command=self.register_criminal, bg="#28a745", fg="white")
+        self.register_btn.grid(row=5, column=0, columnspan=2, pady=10, sticky="ew")
         
         logout_btn = tk.Button(self, text="Logout", command=self.logout)
         logout_btn.grid(row=1, column=1, sticky="se", padx=10, pady=10)
 
     def on_show(self):
         """Called when the frame is shown."""
-        self.face_service.load_embeddings_from_db()
+        if self.face_service:
+            self.face_service.sync_embeddings()
+        else:
+            self.wait_for_services()
+
+    def wait_for_services(self):
+        """
+        Keeps detection and registration disabled until the background loader
+        is done, polling it from the UI thread.
+        """
+        services = self.controller.services
+        if not services.is_done():
+            self.start_btn.config(state="disabled")
+            self.register_btn.config(state="disabled")
+            self.fps_label.config(text=f"Loading face recognition models... ({services.elapsed():.0f}s)")
+            self.after(250, self.wait_for_services)
+            return
+
+        if not services.is_ready():
+            self.start_btn.config(state="disabled")
+            self.register_btn.config(state="disabled")
+            self.fps_label.config(text="Face recognition is unavailable.")
+            messagebox.showerror("Initialization Error", f"Failed to load face recognition: {services.error}", parent=self)
+            return
+
+        self.face_service = services.face_service
+        self.fps_label.config(text="")
+        self.start_btn.config(state="normal")
+        self.register_btn.config(state="normal")
+        self.face_service.sync_embeddings()
+
+    def on_video_resize(self, event):
+        """Tracks the space inside the video label, so the render loop never has to query it."""
+        inset = 2 * (int(self.video_label.cget("borderwidth")) + int(self.video_label.cget("highlightthickness")))
+        self.renderer.set_size(event.width - inset, event.height - inset)
 
     def upload_photo(self):
         file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.jpeg *.png")])
@@ -105,28 +169,39 @@ class HomeFrame(tk.Frame):
             return
 
         # 2. Get embedding for the face
-        embedding, error = self.face_service.get_embedding(face_img)
+        embeddings, error = self.face_service.get_embeddings_batch([face_img])
         if error:
             messagebox.showerror("Registration Error", error, parent=self)
             return
+        embedding = embeddings[0]
 
-        # 3. Save to database
+        # 3. Save to database. A known name gets the photo as an extra embedding,
+        # so the same person can be enrolled from several angles.
         try:
-            connection = self.db_service.get_connection()
-            with connection.cursor() as cursor:
-                sql = "INSERT INTO criminals (name, father_name, crimes_done, embedding) VALUES (%s, %s, %s, %s)"
-                cursor.execute(sql, (
+            existing = self.db_service.find_criminal_by_name(name)
+            if existing:
+                if not messagebox.askyesno(
+                    "Criminal Exists",
+                    f"'{name}' is already registered. Add this photo to their record?",
+                    parent=self
+                ):
+                    return
+                criminal_id = existing['id']
+                embedding_ids = self.db_service.add_criminal_embeddings(criminal_id, [self.face_service.encode_embedding(embedding)])
+            else:
+                criminal_id, embedding_ids = self.db_service.insert_criminal(
                     name,
-                    self.father_name_entry.get().strip(),
-                    self.crimes_entry.get().strip(),
-                    embedding.tobytes()
-                ))
-            connection.commit()
-            connection.close()
+                    father_name=self.father_name_entry.get().strip(),
+                    crimes_done=self.crimes_entry.get().strip(),
+                    embeddings=[self.face_service.encode_embedding(embedding)]
+                )
             
-            # 4. Reload embeddings and show success
-            self.face_service.load_embeddings_from_db()
-            messagebox.showinfo("Success", f"Criminal '{name}' registered successfully.", parent=self)
+            # 4. Add the new embedding to the index and show success
+            self.face_service.add_embedding(embedding_ids[0], criminal_id, name, embedding)
+            if existing:
+                messagebox.showinfo("Success", f"Added a photo to '{name}'.", parent=self)
+            else:
+                messagebox.showinfo("Success", f"Criminal '{name}' registered successfully.", parent=self)
             self.clear_registration_fields()
         except Exception as e:
             messagebox.showerror("Database Error", f"Could not register criminal: {e}", parent=self)
@@ -138,63 +213,91 @@ class HomeFrame(tk.Frame):
         self.captured_image_for_registration = None
         self.photo_preview_label.config(image="", text="No photo selected")
 
+    def get_target_fps(self):
+        try:
+            return max(1.0, float(self.target_fps_var.get()))
+        except ValueError:
+            return 15.0
+
+    def apply_target_fps(self):
+        """Passes the operator's target FPS to the running detection scheduler."""
+        if self.pipeline:
+            self.pipeline.set_target_fps(self.get_target_fps())
+
+    def apply_overlay(self):
+        """Turns the FPS/latency overlay on the video on or off."""
+        if self.pipeline:
+            self.pipeline.show_overlay = self.overlay_var.get()
+
     def start_detection(self):
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            messagebox.showerror("Camera Error", "Could not open webcam.", parent=self)
+        sources = parse_sources(self.sources_entry.get())
+        if not sources:
+            messagebox.showerror("Camera Error", "Enter at least one camera index or video file.", parent=self)
+            return
+
+        self.renderer.reset()
+        self.pipeline = DetectionPipeline(
+            self.face_service,
+            sources=sources,
+            target_fps=self.get_target_fps(),
+            detection_width=int(os.getenv("DETECTION_WIDTH", 640)),
+            show_overlay=self.overlay_var.get(),
+            sightings=self.controller.sightings,
+            motion_gate=os.getenv("MOTION_GATE", "1") == "1"
+        )
+        success, error = self.pipeline.start()
+        if not success:
+            self.pipeline = None
+            messagebox.showerror("Camera Error", error, parent=self)
             return
         
         self.detection_running = True
         self.start_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
-        self.detect_faces_loop()
+        self.render_loop()
 
     def stop_detection(self):
         self.detection_running = False
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
         
+        self.renderer.reset()
+        self.video_photo = None
         self.video_label.config(image="") # Clear the label
+        self.fps_label.config(text="")
         self.start_btn.config(state="normal")
         self.stop_btn.config(state="disabled")
 
-    def detect_faces_loop(self):
+    def render_loop(self):
+        """Paints the latest annotated frame produced by the detection pipeline."""
         if not self.detection_running:
             return
 
-        ret, frame = self.cap.read()
-        if not ret:
+        if not self.pipeline.is_running():
+            error = self.pipeline.error
             self.stop_detection()
+            if error:
+                messagebox.showwarning("Camera", error, parent=self)
             return
-        
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Perform detection
-        faces = self.face_service.detector.detect_faces(frame_rgb)
-        for face in faces:
-            if face['confidence'] < 0.95:
-                continue
-
-            x, y, w, h = face['box']
-            face_img = frame_rgb[y:y+h, x:x+w]
-            
-            embedding, _ = self.face_service.get_embedding(face_img)
-            if embedding is not None:
-                name, distance = self.face_service.search_face(embedding)
-                
-                color = (0, 255, 0) if name != "Unknown" else (255, 0, 0)
-                label = f"{name} ({distance:.2f})"
-                
-                cv2.rectangle(frame_rgb, (x, y), (x+w, y+h), color, 2)
-                cv2.putText(frame_rgb, label, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-
-        img = Image.fromarray(frame_rgb)
-        img.thumbnail((self.video_label.winfo_width(), self.video_label.winfo_height()))
-        self.video_img = ImageTk.PhotoImage(image=img)
-        self.video_label.config(image=self.video_img)
-
-        self.after(20, self.detect_faces_loop)
+
+        new_frames = self.pipeline.get_latest_frames()
+        if new_frames:
+            # Timed on its own, so painting never shows up as recognition latency
+            start = time.perf_counter()
+            canvas = self.renderer.render(new_frames, len(self.pipeline.feeds), self.pipeline.overlay_lines())
+            if canvas is not None:
+                height, width = canvas.shape[:2]
+                if self.video_photo is None or (self.video_photo.width(), self.video_photo.height()) != (width, height):
+                    self.video_photo = ImageTk.PhotoImage("RGB", (width, height))
+                    self.video_label.config(image=self.video_photo)
+                self.video_photo.paste(Image.fromarray(canvas))
+                self.pipeline.record_render(time.perf_counter() - start)
+
+            fps = self.pipeline.get_stage_fps()
+            self.fps_label.config(text="  ".join(f"{stage}: {value:.1f} fps" for stage, value in fps.items()))
+
+        self.after(15, self.render_loop)
         
     def logout(self):
         self.stop_detection()
@@ -48,11 +48,7 @@ class LoginFrame(tk.Frame):
             
         db_service = self.controller.get_db_service()
         try:
-            connection = db_service.get_connection()
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT password FROM users WHERE email = %s", (email,))
-                result = cursor.fetchone()
-            connection.close()
+            result = db_service.fetch_user(email)
 
             if result and bcrypt.checkpw(password, result['password'].encode('utf-8')):
                 messagebox.showinfo("Success", "Login successful!", parent=self)
@@ -7,7 +7,6 @@ class SignUpFrame(tk.Frame):
     def __init__(self, parent, controller):
         tk.Frame.__init__(self, parent, bg="#F0F0F0") # Using a light grey background
         self.controller = controller
-        self.face_service = controller.face_service
         self.db_service = controller.db_service
         
         self.image_paths = [] # Store paths to multiple images
@@ -122,8 +121,13 @@ class SignUpFrame(tk.Frame):
             if not messagebox.askyesno("Warning", "For best results, we recommend adding at least 3 photos. Do you want to continue anyway?", parent=self):
                 return
 
+        face_service = self.controller.get_face_service()
+        if face_service is None:
+            messagebox.showinfo("Please Wait", "Face recognition models are still loading.", parent=self)
+            return
+
         try:
-            success, message = self.face_service.register_criminal_with_photos(
+            success, message = face_service.register_criminal_with_photos(
                 name=name,
                 email=email,
                 password=password,